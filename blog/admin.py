@@ -1,12 +1,27 @@
-import csv
-
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from django.http import HttpResponse
-from django.urls import reverse
+from django.db import transaction
+from django.db.models import Q
 
+from .cache import bump_scopes, comment_page_scopes, post_page_scopes
+from .counters import count_published, count_unpublished
+from .dispatch import dispatch
+from .exports import EXPORTS, export_path, export_threshold, selection, stream_csv
 from .models import Author, Comment, Post
-from .tasks import send_user_email
+from .search import search_backend
+from .tasks import export_selection_csv, notify_post_owners, refresh_author_stats, send_user_email
+
+
+def export_selected(modeladmin, request, queryset, kind):
+    """Stream queryset as CSV, or export it in the background above BLOG_EXPORT_ASYNC_THRESHOLD rows."""
+    _, header, rows = EXPORTS[kind]
+    count = queryset.count()
+    if count > export_threshold():
+        export_selection_csv.delay(kind, selection(request, queryset), export_path(kind), request.user.email)
+        modeladmin.message_user(request, f'Export of {count} {kind} is running in the background, the link will be '
+                                         f'emailed to {request.user.email}')
+        return None
+    return stream_csv(f'{kind}.csv', header, rows(queryset))
 
 
 class CustomUserAdmin(UserAdmin):
@@ -36,26 +51,32 @@ admin.site.register(Author, CustomUserAdmin)
 
 
 class PostAdmin(admin.ModelAdmin):
-    list_display = ('title', 'owner', 'is_published', 'published_date')
+    list_display = ('title', 'owner', 'is_published', 'published_date', 'published_comment_count')
     list_filter = ('is_published', 'published_date', 'owner')
     search_fields = ('title', 'short_description', 'full_description')
     actions = ['make_published', 'make_unpublished', 'export_selected_posts']
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return search_backend().matching(queryset, search_term), False
+
     def make_published(self, request, queryset):
+        scopes = post_page_scopes(queryset)
+        owners = sorted(set(queryset.values_list('owner_id', flat=True)))
         queryset.update(is_published=True)
+        bump_scopes(scopes)
+        dispatch(refresh_author_stats, owners)
 
     def make_unpublished(self, request, queryset):
+        scopes = post_page_scopes(queryset)
+        owners = sorted(set(queryset.values_list('owner_id', flat=True)))
         queryset.update(is_published=False)
+        bump_scopes(scopes)
+        dispatch(refresh_author_stats, owners)
 
     def export_selected_posts(self, request, queryset):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="posts.csv"'
-        writer = csv.writer(response)
-        writer.writerow(['Published Date', 'Owner', 'Title', 'short_description', 'full_description'])
-        for post in queryset:
-            writer.writerow([post.published_date, post.owner.username, post.title, post.short_description,
-                             post.full_description])
-        return response
+        return export_selected(self, request, queryset, 'posts')
 
 
 admin.site.register(Post, PostAdmin)
@@ -67,46 +88,55 @@ class CommentAdmin(admin.ModelAdmin):
     search_fields = ('post__title', 'author', 'text')
     actions = ['make_published', 'make_unpublished', 'export_selected_comments']
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        backend = search_backend()
+        comments = backend.matching(Comment.objects.all(), search_term).values('pk')
+        posts = backend.matching(Post.objects.all(), search_term).values('pk')
+        return queryset.filter(Q(pk__in=comments) | Q(post__in=posts)), False
+
     def save_model(self, request, obj, form, change):
-        if 'is_published' in form.changed_data:
-            if obj.is_published:
-                post_owner_email = obj.post.owner.email
-                post_url = reverse('post_detail', args=[obj.post.id])
-                subject = f'New comment on your post "{obj.post.title}"'
-                message = f'Hi, {obj.post.owner.username}! You have a new comment on your post "{obj.post.title}".\n\n'
-                message += f'Author: {obj.author}\n'
-                message += f'Text: {obj.text}\n'
-                message += f'Link: {post_url}#comment-{obj.id}'
-                send_user_email.delay(obj.post.id, obj.id)
-
-        super().save_model(request, obj, form, change)
+        with transaction.atomic():
+            super().save_model(request, obj, form, change)
+            if 'is_published' in form.changed_data:
+                if obj.is_published:
+                    count_published(Comment.objects.filter(pk=obj.pk))
+                    dispatch(send_user_email, obj.id)
+                else:
+                    count_unpublished(Comment.objects.filter(pk=obj.pk))
 
     def make_published(self, request, queryset):
-        count = 0
-        for comment in queryset:
-            if not comment.is_published:
-                comment.is_published = True
-                comment.save()
-                send_user_email.delay(comment.post.id, comment.id)
-                count += 1
+        # Lock the unpublished rows so a concurrent or repeated run cannot publish
+        # (and notify about) the same comments twice
+        with transaction.atomic():
+            selected = queryset.filter(is_published=False).select_for_update(of=('self',))
+            published = list(selected.values_list('pk', 'post__owner_id'))
+            comments = Comment.objects.filter(pk__in=[pk for pk, _ in published])
+            scopes = comment_page_scopes(comments)
+            comments.update(is_published=True)
+            count_published(comments)
+        bump_scopes(scopes)
+        dispatch(refresh_author_stats, sorted({owner_id for _, owner_id in published}))
+        notify_post_owners(published)
         self.message_user(request,
-                          f'{count} Comments have been marked as published and notifications have been sent')
+                          f'{len(published)} Comments have been marked as published and notifications have been sent')
 
     make_published.short_description = "Mark selected comments as published and send notifications"
 
     def make_unpublished(self, request, queryset):
-        queryset.update(is_published=False)
+        scopes = comment_page_scopes(queryset)
+        with transaction.atomic():
+            unpublished = list(queryset.filter(is_published=True).values_list('pk', 'post__owner_id'))
+            queryset.update(is_published=False)
+            count_unpublished(Comment.objects.filter(pk__in=[pk for pk, _ in unpublished]))
+        bump_scopes(scopes)
+        dispatch(refresh_author_stats, sorted({owner_id for _, owner_id in unpublished}))
 
     make_unpublished.short_description = "Mark selected comments as unpublished"
 
     def export_selected_comments(self, request, queryset):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="comments.csv"'
-        writer = csv.writer(response)
-        writer.writerow(['Post', 'Author', 'Published Date'])
-        for comment in queryset:
-            writer.writerow([comment.post.title, comment.author, comment.published_date])
-        return response
+        return export_selected(self, request, queryset, 'comments')
 
 
 admin.site.register(Comment, CommentAdmin)
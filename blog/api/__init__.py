@@ -0,0 +1 @@
+"""Read-only JSON API, the version is part of the url (blog/api/v1/...)."""
@@ -0,0 +1,80 @@
+from django.urls import reverse
+
+# name: (columns loaded for the field, value of the field for an object)
+POST_FIELDS = {
+    'id': ((), lambda post: post.pk),
+    'url': ((), lambda post: reverse('api:post_detail', args=[post.pk])),
+    'title': (('title',), lambda post: post.title),
+    'short_description': (('short_description',), lambda post: post.short_description),
+    'full_description': (('full_description',), lambda post: post.full_description),
+    'author': (('owner__username',), lambda post: post.owner.username),
+    'published_date': ((), lambda post: post.published_date),
+    'comment_count': (('published_comment_count',), lambda post: post.published_comment_count),
+    'last_comment_at': (('last_comment_at',), lambda post: post.last_comment_at),
+    'image': (('image', 'image_variants'), lambda post: image_data(post.image, post.image_variants)),
+}
+
+COMMENT_FIELDS = {
+    'id': ((), lambda comment: comment.pk),
+    'author': (('author',), lambda comment: comment.author),
+    'text': (('text',), lambda comment: comment.text),
+    'published_date': ((), lambda comment: comment.published_date),
+}
+
+AUTHOR_FIELDS = {
+    'username': (('username',), lambda author: author.username),
+    'first_name': (('first_name',), lambda author: author.first_name),
+    'last_name': (('last_name',), lambda author: author.last_name),
+    'bio': (('bio',), lambda author: author.bio),
+    'location': (('location',), lambda author: author.location),
+    'date_joined': (('date_joined',), lambda author: author.date_joined),
+    'profile_photo': (('profile_photo', 'profile_photo_variants'),
+                      lambda author: image_data(author.profile_photo, author.profile_photo_variants)),
+    'posts': (('username',), lambda author: reverse('api:post_list') + f'?author={author.username}'),
+}
+
+# Fields returned when the request has no ?fields=, lists stay compact
+POST_LIST_DEFAULT = ('id', 'url', 'title', 'short_description', 'author', 'published_date', 'comment_count')
+POST_DETAIL_DEFAULT = tuple(POST_FIELDS) + ('comments',)
+COMMENT_DEFAULT = tuple(COMMENT_FIELDS)
+AUTHOR_DEFAULT = tuple(AUTHOR_FIELDS)
+
+
+class UnknownFields(ValueError):
+    pass
+
+
+def image_data(image, variants):
+    if not image:
+        return None
+    return {
+        'url': image.url,
+        'variants': [{'format': variant['format'], 'width': variant['width'], 'height': variant['height'],
+                      'url': image.storage.url(variant['name'])} for variant in variants],
+    }
+
+
+def selected_fields(value, available, default):
+    """Field names of a ?fields=a,b parameter, in the order of available."""
+    if not value:
+        return default
+    names = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = names.difference(available)
+    if unknown:
+        raise UnknownFields('Unknown fields: ' + ', '.join(sorted(unknown)))
+    return tuple(name for name in available if name in names)
+
+
+def load_only(queryset, field_specs, fields, *required):
+    """queryset loading only the columns of fields, plus required ones."""
+    columns = set(required)
+    for name in fields:
+        if name in field_specs:
+            columns.update(field_specs[name][0])
+    if any(column.startswith('owner__') for column in columns):
+        queryset = queryset.select_related('owner')
+    return queryset.only(*columns)
+
+
+def serialize(obj, field_specs, fields):
+    return {name: field_specs[name][1](obj) for name in fields if name in field_specs}
@@ -0,0 +1,182 @@
+import datetime
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Max
+from django.http import JsonResponse
+from django.views.decorators.http import condition, require_GET
+
+from .serializers import (AUTHOR_DEFAULT, AUTHOR_FIELDS, COMMENT_DEFAULT, COMMENT_FIELDS, POST_DETAIL_DEFAULT,
+                          POST_FIELDS, POST_LIST_DEFAULT, UnknownFields, load_only, selected_fields, serialize)
+from ..cache import author_scope, count_scope, list_scope, post_scope, scope_versions
+from ..models import Author, Comment, Post
+from ..paginators import CursorPage, paginate
+from ..storage import media_url_mode
+
+
+def api_response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':')})
+
+
+def not_found():
+    return api_response({'error': 'Not found.'}, status=404)
+
+
+def page_size(request):
+    default = getattr(settings, 'BLOG_API_PAGE_SIZE', 20)
+    try:
+        size = int(request.GET.get('page_size', default))
+    except ValueError:
+        size = default
+    return min(max(size, 1), getattr(settings, 'BLOG_API_MAX_PAGE_SIZE', 100))
+
+
+def page_link(request, **params):
+    query = request.GET.copy()
+    for key in ('page', 'cursor'):
+        query.pop(key, None)
+    query.update(params)
+    return f'{request.path}?{query.urlencode()}'
+
+
+def page_data(request, page, field_specs, fields):
+    """Serialized page with the links to its neighbours, keyset pages have no count."""
+    if isinstance(page, CursorPage):
+        data = {
+            'next': page_link(request, cursor=page.next_cursor) if page.has_next() else None,
+            'previous': page_link(request, cursor=page.previous_cursor) if page.has_previous() else None,
+        }
+    else:
+        data = {
+            'count': page.paginator.count,
+            'next': page_link(request, page=page.next_page_number()) if page.has_next() else None,
+            'previous': page_link(request, page=page.previous_page_number()) if page.has_previous() else None,
+        }
+    data['results'] = [serialize(obj, field_specs, fields) for obj in page]
+    return data
+
+
+def media_url_lifetime():
+    """Seconds the image urls of a response stay valid at least, None when they do not expire."""
+    mode = media_url_mode()
+    expire = getattr(Post._meta.get_field('image').storage, 'querystring_expire', None)
+    if mode == 'public' or not expire:
+        return None
+    if mode == 'cached':
+        # cached urls are handed out while they stay valid for this long
+        return min(expire, getattr(settings, 'BLOG_MEDIA_SIGNED_URL_MIN_TTL', 900))
+    return expire
+
+
+def media_url_period():
+    """Start of the current media_url_lifetime() period, None when urls do not expire.
+
+    Validators change with the period, so 304 never lets a client keep expired urls.
+    """
+    lifetime = media_url_lifetime()
+    if lifetime is None:
+        return None
+    return int(time.time() // lifetime * lifetime)
+
+
+def scope_etag(scopes):
+    """ETag from the page cache versions of scopes, every write bumping them changes it.
+
+    It costs one cache read, so answering a repeat poll with 304 takes no query.
+    """
+    def etag_func(request, *args, **kwargs):
+        versions = ':'.join(str(version) for version in scope_versions(scopes(request, *args, **kwargs)))
+        return hashlib.md5(f'{versions}|{media_url_period()}|{request.get_full_path()}'.encode()).hexdigest()
+    return etag_func
+
+
+def published_last_modified(func):
+    """Last-Modified for clients polling with If-Modified-Since only.
+
+    It follows publication (and comment) dates, edits only change the ETag, and
+    is skipped when If-None-Match is sent as the ETag decides alone then.
+    """
+    @wraps(func)
+    def last_modified_func(request, *args, **kwargs):
+        if 'HTTP_IF_NONE_MATCH' in request.META:
+            return None
+        last_modified = func(request, *args, **kwargs)
+        period = media_url_period()
+        if last_modified is None or period is None:
+            return last_modified
+        return max(last_modified, datetime.datetime.fromtimestamp(period, datetime.timezone.utc))
+    return last_modified_func
+
+
+def list_scopes(request):
+    """The list or author scope, and the comment count one for the comment_count and last_comment_at fields."""
+    username = request.GET.get('author')
+    return [author_scope(username) if username else list_scope(), count_scope(Comment)]
+
+
+def published_posts(request):
+    posts = Post.objects.filter(is_published=True)
+    if request.GET.get('author'):
+        posts = posts.filter(owner__username=request.GET['author'])
+    return posts
+
+
+@published_last_modified
+def list_last_modified(request):
+    return published_posts(request).aggregate(last=Max('published_date'))['last']
+
+
+@published_last_modified
+def detail_last_modified(request, pk):
+    dates = Post.objects.filter(pk=pk, is_published=True).values_list('published_date', 'last_comment_at').first()
+    return max(date for date in dates if date) if dates else None
+
+
+@require_GET
+@condition(etag_func=scope_etag(list_scopes), last_modified_func=list_last_modified)
+def post_list(request):
+    """Published posts, newest first; ?author=username, ?fields=, ?page_size=, ?page= or ?cursor=."""
+    try:
+        fields = selected_fields(request.GET.get('fields'), tuple(POST_FIELDS), POST_LIST_DEFAULT)
+    except UnknownFields as error:
+        return api_response({'error': str(error)}, status=400)
+    posts = load_only(published_posts(request), POST_FIELDS, fields, 'published_date')
+    posts = posts.order_by('-published_date', '-id')
+    return api_response(page_data(request, paginate(request, posts, page_size(request)), POST_FIELDS, fields))
+
+
+@require_GET
+@condition(etag_func=scope_etag(lambda request, pk: [post_scope(pk)]), last_modified_func=detail_last_modified)
+def post_detail(request, pk):
+    """Published post with a page of its comments; ?fields=, ?comment_fields=, ?page= or ?cursor=."""
+    try:
+        fields = selected_fields(request.GET.get('fields'), POST_DETAIL_DEFAULT, POST_DETAIL_DEFAULT)
+        comment_fields = selected_fields(request.GET.get('comment_fields'), tuple(COMMENT_FIELDS), COMMENT_DEFAULT)
+    except UnknownFields as error:
+        return api_response({'error': str(error)}, status=400)
+    post = load_only(Post.objects.filter(pk=pk, is_published=True), POST_FIELDS, fields, 'published_date').first()
+    if post is None:
+        return not_found()
+    data = serialize(post, POST_FIELDS, fields)
+    if 'comments' in fields:
+        comments = Comment.objects.filter(post=post, is_published=True).order_by('-published_date', '-id')
+        comments = load_only(comments, COMMENT_FIELDS, comment_fields, 'published_date')
+        data['comments'] = page_data(request, paginate(request, comments, page_size(request)),
+                                     COMMENT_FIELDS, comment_fields)
+    return api_response(data)
+
+
+@require_GET
+@condition(etag_func=scope_etag(lambda request, username: [author_scope(username)]))
+def author_detail(request, username):
+    """Public profile of an author; ?fields=."""
+    try:
+        fields = selected_fields(request.GET.get('fields'), AUTHOR_DEFAULT, AUTHOR_DEFAULT)
+    except UnknownFields as error:
+        return api_response({'error': str(error)}, status=400)
+    author = load_only(Author.objects.filter(username=username), AUTHOR_FIELDS, fields).first()
+    if author is None:
+        return not_found()
+    return api_response(serialize(author, AUTHOR_FIELDS, fields))
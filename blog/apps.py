@@ -4,3 +4,24 @@ from django.apps import AppConfig
 class BlogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blog'
+
+    def ready(self):
+        from celery import signals as celery_signals
+
+        from django.db.backends.signals import connection_created
+
+        from . import dbpool, instrumentation, signals  # noqa: F401
+
+        connection_created.connect(instrumentation.install_query_recorder)
+        celery_signals.before_task_publish.connect(instrumentation.stamp_sent_at)
+        celery_signals.task_prerun.connect(instrumentation.task_started)
+        celery_signals.task_postrun.connect(instrumentation.task_finished)
+        celery_signals.task_failure.connect(instrumentation.task_failed)
+        celery_signals.worker_process_shutdown.connect(instrumentation.flush_metrics)
+        celery_signals.worker_shutdown.connect(instrumentation.flush_metrics)
+        # threaded workers share a pool of BLOG_CELERY_DB_POOL_SIZE database connections per process
+        celery_signals.worker_init.connect(dbpool.install_pool)
+        celery_signals.worker_process_init.connect(dbpool.reset_pool)
+        celery_signals.task_prerun.connect(dbpool.lend_connection)
+        celery_signals.task_postrun.connect(dbpool.return_connection)
+        celery_signals.worker_shutdown.connect(dbpool.close_pool)
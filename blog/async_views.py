@@ -0,0 +1,99 @@
+"""Async versions of the read views, for serving under ASGI (core/asgi.py).
+
+They load rows with the async ORM and talk to the cache with the async cache
+API; templates are rendered by Django's handler in a worker thread. urls.py
+routes to them when BLOG_ASYNC_VIEWS is on.
+"""
+from asgiref.sync import sync_to_async
+
+from django.http import Http404
+from django.template.response import TemplateResponse
+from django.views import View
+
+from . import views
+from .cache import author_scope, cache_anonymous_page, list_scope, post_scope
+from .forms import CommentForm
+from .models import Author, Comment, Post
+from .paginators import apaginate
+from .stats import aauthor_stats
+
+
+async def aget_or_404(queryset, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.verbose_name} found matching the query')
+
+
+async def aget_user(request):
+    """request.user, loaded in a worker thread as it may query the session and user tables."""
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
+class CachedPageView(View):
+    """Async view whose pages are cached for anonymous visitors, in page_scopes(request, **kwargs).
+
+    method_decorator() turns async handlers into sync ones in Django 4.1, so
+    the cache wraps the view function returned by as_view() instead.
+    """
+    page_scopes = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return cache_anonymous_page(cls.page_scopes)(super().as_view(**initkwargs))
+
+
+def page_context(page):
+    return {'page_obj': page, 'paginator': page.paginator, 'is_paginated': page.has_other_pages()}
+
+
+class PostDetailView(CachedPageView):
+    page_scopes = staticmethod(lambda request, pk: [post_scope(pk)])
+    template_name = 'blog/post_detail.html'
+    paginate_by = 10
+
+    async def get(self, request, pk):
+        post = await aget_or_404(Post.objects.select_related('owner'), pk=pk)
+        comments = Comment.objects.filter(post=post, is_published=True).order_by('-published_date', '-id')
+        context = {'post': post, 'object': post, 'comment_form': CommentForm(),
+                   'page_obj': await apaginate(request, comments, self.paginate_by)}
+        if post.owner_id == (await aget_user(request)).pk:
+            context['is_owner'] = True
+        return TemplateResponse(request, self.template_name, context)
+
+    async def post(self, request, pk):
+        # writing a comment stays on the sync view, in a worker thread
+        return await sync_to_async(views.PostDetailView.as_view())(request, pk=pk)
+
+
+class PostListView(CachedPageView):
+    page_scopes = staticmethod(lambda request: [list_scope()])
+    template_name = 'blog/post_list.html'
+    paginate_by = 10
+
+    async def get(self, request):
+        queryset = Post.objects.filter(is_published=True).select_related('owner').order_by('-published_date', '-id')
+        page = await apaginate(request, queryset, self.paginate_by)
+        return TemplateResponse(request, self.template_name, {'posts': page, **page_context(page)})
+
+
+class UserPostListView(CachedPageView):
+    page_scopes = staticmethod(lambda request, username: [author_scope(username)])
+    template_name = 'blog/user_post_list.html'
+    paginate_by = 10
+
+    async def get(self, request, username):
+        user_profile = await aget_or_404(Author.objects.all(), username=username)
+        queryset = Post.objects.filter(owner=user_profile, is_published=True).order_by('-published_date', '-id')
+        page = await apaginate(request, queryset, self.paginate_by)
+        for post in page:
+            post.owner = user_profile
+        stats = await aauthor_stats(user_profile)
+        return TemplateResponse(request, self.template_name,
+                                {'posts': page, 'user_profile': user_profile, 'stats': stats, **page_context(page)})
+
+
+async def user_profile(request, username):
+    user = await aget_or_404(Author.objects.all(), username=username)
+    return TemplateResponse(request, 'blog/user_profile.html', {'user': user, 'stats': await aauthor_stats(user)})
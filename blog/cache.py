@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import re
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+from .models import Author, Comment, Post
+
+PAGE_KEY_PREFIX = 'blog:page:'
+VERSION_KEY_PREFIX = 'blog:page-version:'
+
+# Cached pages are shared between visitors, so the CSRF token rendered into the
+# comment form is swapped for a placeholder and re-issued for every hit
+CSRF_INPUT_RE = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+CSRF_PLACEHOLDER = b'__blog_csrf_token__'
+
+
+def page_cache_timeout():
+    return getattr(settings, 'BLOG_PAGE_CACHE_TIMEOUT', 300)
+
+
+def list_scope():
+    return 'list'
+
+
+def author_scope(username):
+    return f'author:{username}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def count_scope(model):
+    return f'count:{model._meta.label_lower}'
+
+
+def scope_versions(scopes):
+    """Return the current version of every scope, starting missing ones at the current time.
+
+    Starting from the clock instead of 0 means an evicted version never brings
+    back pages cached before the eviction.
+    """
+    keys = [VERSION_KEY_PREFIX + scope for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = time.time_ns()
+            cache.add(key, versions[key], None)
+    return [versions[key] for key in keys]
+
+
+async def ascope_versions(scopes):
+    """scope_versions() with the async cache API."""
+    keys = [VERSION_KEY_PREFIX + scope for scope in scopes]
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = time.time_ns()
+            await cache.aadd(key, versions[key], None)
+    return [versions[key] for key in keys]
+
+
+def bump_scopes(scopes):
+    """Invalidate every cached page belonging to one of scopes."""
+    for scope in set(scopes):
+        key = VERSION_KEY_PREFIX + scope
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def page_key(request, scopes, versions=None):
+    versions = ':'.join(str(version) for version in versions or scope_versions(scopes))
+    digest = hashlib.md5(f'{versions}|{request.get_full_path()}'.encode()).hexdigest()
+    return PAGE_KEY_PREFIX + digest
+
+
+def cached_page_response(request, content):
+    if CSRF_PLACEHOLDER in content:
+        content = content.replace(CSRF_PLACEHOLDER, get_token(request).encode())
+    return HttpResponse(content)
+
+
+def cacheable_content(response):
+    """Content of response to cache, with the CSRF token swapped for the placeholder, or None."""
+    if response.status_code == 200 and not response.streaming and not response.cookies:
+        return CSRF_INPUT_RE.sub(rb'\1' + CSRF_PLACEHOLDER + rb'\2', response.content)
+    return None
+
+
+def store_after_render(response, key, timeout):
+    """Cache response under key once it is rendered, return it."""
+    def store(response):
+        content = cacheable_content(response)
+        if content is not None:
+            cache.set(key, content, timeout)
+
+    if callable(getattr(response, 'render', None)):
+        response.add_post_render_callback(store)
+    else:
+        store(response)
+    return response
+
+
+def cache_anonymous_page(scopes):
+    """Cache the rendered page of a view for anonymous GET requests.
+
+    scopes(request, *args, **kwargs) returns the invalidation scopes of the page;
+    bump_scopes() on any of them makes the cached copy unreachable. Async views
+    get an async wrapper using the async cache API.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            timeout = page_cache_timeout()
+            if not timeout or request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+                return view_func(request, *args, **kwargs)
+
+            key = page_key(request, scopes(request, *args, **kwargs))
+            content = cache.get(key)
+            if content is not None:
+                return cached_page_response(request, content)
+            return store_after_render(view_func(request, *args, **kwargs), key, timeout)
+
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            timeout = page_cache_timeout()
+            if (not timeout or request.method not in ('GET', 'HEAD')
+                    or await sync_to_async(lambda: request.user.is_authenticated)()):
+                return await view_func(request, *args, **kwargs)
+
+            page_scopes = scopes(request, *args, **kwargs)
+            key = page_key(request, page_scopes, await ascope_versions(page_scopes))
+            content = await cache.aget(key)
+            if content is not None:
+                return cached_page_response(request, content)
+            # template responses are rendered, and stored, by the handler in a worker thread
+            return store_after_render(await view_func(request, *args, **kwargs), key, timeout)
+
+        return async_wrapper if asyncio.iscoroutinefunction(view_func) else wrapper
+    return decorator
+
+
+def post_page_scopes(posts):
+    """Scopes of the list, author and detail pages showing posts, a Post queryset.
+
+    Collect them before a queryset.update() that may change which rows the
+    queryset matches, and bump them after it.
+    """
+    scopes = [list_scope(), count_scope(Post)]
+    for pk, username in posts.values_list('pk', 'owner__username'):
+        scopes += [post_scope(pk), author_scope(username)]
+    return scopes
+
+
+def comment_page_scopes(comments):
+    """Scopes of the detail pages showing comments, a Comment queryset."""
+    post_ids = comments.values_list('post_id', flat=True).distinct()
+    return [count_scope(Comment)] + [post_scope(post_id) for post_id in post_ids]
+
+
+def post_scopes(post):
+    username = Author.objects.filter(pk=post.owner_id).values_list('username', flat=True).first()
+    return [list_scope(), count_scope(Post), post_scope(post.pk), author_scope(username)]
+
+
+def comment_scopes(comment):
+    return [count_scope(Comment), post_scope(comment.post_id)]
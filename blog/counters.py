@@ -0,0 +1,46 @@
+from django.db.models import Count, F, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Post
+
+
+def published_comments_of(post_ref):
+    return Comment.objects.filter(post=post_ref, is_published=True).order_by().values('post')
+
+
+def latest_published_comment():
+    return Subquery(published_comments_of(OuterRef('pk')).annotate(latest=Max('published_date')).values('latest'))
+
+
+def count_published(comments):
+    """Add comments, a Comment queryset of newly published comments, to their posts' counters.
+
+    All posts are updated by one UPDATE with correlated subqueries over comments.
+    """
+    changed = comments.filter(post=OuterRef('pk')).order_by().values('post')
+    added = Subquery(changed.annotate(added=Count('pk')).values('added'))
+    latest = Subquery(changed.annotate(latest=Max('published_date')).values('latest'))
+    return Post.objects.filter(pk__in=comments.values('post_id')).update(
+        published_comment_count=F('published_comment_count') + added,
+        last_comment_at=Greatest(Coalesce('last_comment_at', latest), latest),
+    )
+
+
+def count_unpublished(comments):
+    """Remove comments, a Comment queryset of newly unpublished comments, from their posts' counters."""
+    changed = comments.filter(post=OuterRef('pk')).order_by().values('post')
+    removed = Subquery(changed.annotate(removed=Count('pk')).values('removed'))
+    return Post.objects.filter(pk__in=comments.values('post_id')).update(
+        # drifted counters must not go below zero, recount_comments fixes them
+        published_comment_count=Greatest(F('published_comment_count') - removed, 0),
+        last_comment_at=latest_published_comment(),
+    )
+
+
+def recount(posts):
+    """Recompute the counters of posts, a Post queryset, from blog_comment in a single UPDATE."""
+    published_count = published_comments_of(OuterRef('pk')).annotate(total=Count('pk')).values('total')
+    return posts.update(
+        published_comment_count=Coalesce(Subquery(published_count, output_field=IntegerField()), 0),
+        last_comment_at=latest_published_comment(),
+    )
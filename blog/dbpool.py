@@ -0,0 +1,100 @@
+import os
+import queue
+import threading
+
+from celery.concurrency import get_implementation
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Worker pools running several tasks at once in one process, their threads (or greenlets) share the pool
+SHARED_POOLS = {'thread', 'eventlet', 'gevent'}
+
+
+def pool_size():
+    return getattr(settings, 'BLOG_CELERY_DB_POOL_SIZE', 0)
+
+
+class ConnectionPool:
+    """Database connections lent to the threads of a worker process, one task at a time.
+
+    At most size connections are opened, a task waits for one to be returned
+    when all are lent. Connections are reused most recently returned first, so
+    the others reach CONN_MAX_AGE and get closed when the load drops.
+    """
+
+    def __init__(self, size, alias=DEFAULT_DB_ALIAS):
+        self.alias = alias
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle = queue.LifoQueue()
+        self.pid = os.getpid()
+
+    def acquire(self):
+        """Make a pooled connection the current thread's connection of the alias."""
+        self.slots.acquire()
+        try:
+            connection = self.idle.get_nowait()
+        except queue.Empty:
+            connection = connections.create_connection(self.alias)
+            # only ever used by the thread it is lent to
+            connection.inc_thread_sharing()
+        connections[self.alias] = connection
+
+    def release(self):
+        connection = connections[self.alias]
+        del connections[self.alias]
+        try:
+            # broken and expired connections are closed, and checked again before their next query
+            connection.close_if_unusable_or_obsolete()
+        finally:
+            self.idle.put(connection)
+            self.slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+# ConnectionPool of this worker process, None when its tasks keep their thread's connection
+_pool = None
+
+
+def install_pool(sender=None, **kwargs):
+    """worker_init receiver, threaded worker pools share BLOG_CELERY_DB_POOL_SIZE connections per process.
+
+    Prefork children run one task at a time: each keeps its own persistent
+    connection (CONN_MAX_AGE), which celery closes after the fork.
+    """
+    global _pool
+    # still the --pool name when worker_init is sent
+    kind = get_implementation(sender.pool_cls).__module__.rsplit('.', 1)[-1]
+    if pool_size() and kind in SHARED_POOLS:
+        _pool = ConnectionPool(pool_size())
+
+
+def reset_pool(**kwargs):
+    """worker_process_init receiver, a forked child never uses the connections of its parent's pool."""
+    global _pool
+    if _pool is not None and _pool.pid != os.getpid():
+        _pool = None
+
+
+def lend_connection(task=None, **kwargs):
+    """task_prerun receiver."""
+    if _pool is not None and not task.request.is_eager:
+        _pool.acquire()
+
+
+def return_connection(task=None, **kwargs):
+    """task_postrun receiver."""
+    if _pool is not None and not task.request.is_eager:
+        _pool.release()
+
+
+def close_pool(**kwargs):
+    """worker_shutdown receiver."""
+    if _pool is not None:
+        _pool.close()
@@ -0,0 +1,54 @@
+import contextvars
+import functools
+import json
+
+from celery import current_app
+
+from django.db import transaction
+
+# TaskBatch collecting the tasks dispatched by the request being served, None outside requests
+task_batch = contextvars.ContextVar('task_batch', default=None)
+
+
+def publish(calls):
+    """Send calls, (task, args) pairs, to the broker through one producer and connection."""
+    if not calls:
+        return
+    with current_app.producer_or_acquire() as producer:
+        for task, args in calls:
+            task.apply_async(args, producer=producer)
+
+
+class TaskBatch:
+    """Committed task calls of a request, the same task with the same arguments is kept once."""
+
+    def __init__(self):
+        self.calls = {}
+        self.closed = False
+
+    def add(self, task, args):
+        if self.closed:
+            # committed after the response, by a transaction the request left open
+            publish([(task, args)])
+            return
+        self.calls.setdefault((task.name, json.dumps(args)), (task, args))
+
+    def close(self):
+        self.closed = True
+        calls, self.calls = list(self.calls.values()), {}
+        publish(calls)
+
+
+def dispatch(task, *args):
+    """Enqueue task(*args) once the current transaction commits, right away outside of one.
+
+    Workers never see rows the transaction has not committed, and nothing is
+    sent when it rolls back. Within a request (see dispatch_middleware) the
+    committed calls are collected, duplicates dropped, and published together
+    once the view has returned.
+    """
+    batch = task_batch.get()
+    if batch is None:
+        transaction.on_commit(functools.partial(publish, [(task, args)]))
+    else:
+        transaction.on_commit(functools.partial(batch.add, task, args))
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse, reverse_lazy
+from django.utils.cache import get_conditional_response
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed, SyndicationFeed, rfc3339_date
+from django.utils.http import http_date
+
+from .cache import author_scope, list_scope, scope_versions
+from .models import Author, Post
+
+FEED_KEY_PREFIX = 'blog:feed:'
+
+
+def feed_size():
+    return getattr(settings, 'BLOG_FEED_SIZE', 20)
+
+
+def feed_cache_timeout():
+    return getattr(settings, 'BLOG_FEED_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+class JsonFeed(SyndicationFeed):
+    """JSON Feed 1.1 (https://jsonfeed.org/version/1.1)."""
+    content_type = 'application/feed+json; charset=utf-8'
+
+    def write(self, outfile, encoding):
+        data = {
+            'version': 'https://jsonfeed.org/version/1.1',
+            'title': self.feed['title'],
+            'home_page_url': self.feed['link'],
+            'feed_url': self.feed['feed_url'],
+            'description': self.feed['description'],
+            'items': [self.item_data(item) for item in self.items],
+        }
+        outfile.write(json.dumps({key: value for key, value in data.items() if value is not None},
+                                 ensure_ascii=False))
+
+    def item_data(self, item):
+        data = {
+            'id': item['unique_id'] or item['link'],
+            'url': item['link'],
+            'title': item['title'],
+            'summary': item['description'],
+            'content_text': item.get('content_text'),
+            'date_published': item['pubdate'] and rfc3339_date(item['pubdate']),
+            'authors': [{'name': item['author_name']}] if item['author_name'] else None,
+        }
+        return {key: value for key, value in data.items() if value is not None}
+
+
+class PostsFeed(Feed):
+    feed_type = Rss201rev2Feed
+    title = 'Hillel Blog'
+    link = reverse_lazy('post_list')
+    description = 'Latest posts'
+
+    def posts(self):
+        return Post.objects.filter(is_published=True).order_by('-published_date', '-id')
+
+    def items(self, obj=None):
+        return self.posts().select_related('owner')[:feed_size()]
+
+    def item_title(self, post):
+        return post.title
+
+    def item_description(self, post):
+        return post.short_description
+
+    def item_link(self, post):
+        return reverse('post_detail', args=[post.pk])
+
+    def item_pubdate(self, post):
+        return post.published_date
+
+    def item_author_name(self, post):
+        return post.owner.username
+
+    def item_extra_kwargs(self, post):
+        return {'content_text': post.full_description} if self.feed_type is JsonFeed else {}
+
+
+class AtomPostsFeed(PostsFeed):
+    feed_type = Atom1Feed
+    subtitle = PostsFeed.description
+
+
+class JsonPostsFeed(PostsFeed):
+    feed_type = JsonFeed
+
+
+class AuthorPostsFeed(PostsFeed):
+    def get_object(self, request, username):
+        return get_object_or_404(Author, username=username)
+
+    def title(self, author):
+        return f'Hillel Blog: {author.username}'
+
+    def link(self, author):
+        return reverse('user_posts', args=[author.username])
+
+    def description(self, author):
+        return f'Latest posts by {author.username}'
+
+    def items(self, author):
+        # the owner is known, no join needed
+        posts = list(self.posts().filter(owner=author)[:feed_size()])
+        for post in posts:
+            post.owner = author
+        return posts
+
+
+class AtomAuthorPostsFeed(AuthorPostsFeed):
+    feed_type = Atom1Feed
+    subtitle = AuthorPostsFeed.description
+
+
+class JsonAuthorPostsFeed(AuthorPostsFeed):
+    feed_type = JsonFeed
+
+
+def cached_feed(feed, scopes):
+    """View serving feed, a Feed instance, from the cache until one of its scopes is bumped.
+
+    scopes(request, *args, **kwargs) returns the page cache scopes of the feed,
+    which post saves (publishing and edits) bump, so a feed is generated once per
+    change instead of on every fetch. Last-Modified is when that generation
+    happened and If-Modified-Since or If-None-Match requests get a 304. It is
+    cached apart from the body, so a 304 never reads the feed itself.
+    """
+    def view(request, *args, **kwargs):
+        versions = ':'.join(str(version) for version in scope_versions(scopes(request, *args, **kwargs)))
+        etag = hashlib.md5(f'{versions}|{request.path}'.encode()).hexdigest()
+        key = FEED_KEY_PREFIX + etag
+
+        def generate():
+            response = feed(request, *args, **kwargs)
+            entry = (response.content, response['Content-Type'], int(time.time()))
+            cache.set_many({key: entry, key + ':modified': entry[2]}, feed_cache_timeout())
+            return entry
+
+        entry = None
+        last_modified = cache.get(key + ':modified')
+        if last_modified is None:
+            entry = generate()
+            last_modified = entry[2]
+        response = get_conditional_response(request, etag=f'"{etag}"', last_modified=last_modified)
+        if response is None:
+            # the body is only read when the client's copy is stale, it may have been evicted meanwhile
+            entry = entry or cache.get(key) or generate()
+            content, content_type, last_modified = entry
+            response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = f'"{etag}"'
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+    return view
+
+
+def site_feed(feed):
+    return cached_feed(feed, lambda request: [list_scope()])
+
+
+def author_feed(feed):
+    return cached_feed(feed, lambda request, username: [author_scope(username)])
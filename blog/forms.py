@@ -1,11 +1,90 @@
 from django import forms
 from django.contrib.auth.forms import UserChangeForm, UserCreationForm
+from django.core.exceptions import ValidationError
+from django.urls import reverse_lazy
 
+from .images import mark_uploaded
 from .models import Author, Comment, Post
+from .uploads import CONTENT_TYPES, validate_upload
 
 
-class AuthorRegisterForm(UserCreationForm):
-    profile_photo = forms.ImageField(required=False)
+class DirectUploadInput(forms.HiddenInput):
+    """File picker uploading straight to storage, the hidden input holds the resulting key.
+
+    Like ClearableFileInput, a checkbox removes the current file.
+    """
+    template_name = 'blog/widgets/direct_upload.html'
+
+    def __init__(self, kind, attrs=None):
+        super().__init__(attrs)
+        self.kind = kind
+
+    def clear_checkbox_name(self, name):
+        return f'{name}-clear'
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget'].update(kind=self.kind, upload_url=reverse_lazy('upload_target'),
+                                 accept=','.join(CONTENT_TYPES), clear_checkbox_name=self.clear_checkbox_name(name))
+        return context
+
+    def value_from_datadict(self, data, files, name):
+        if forms.CheckboxInput().value_from_datadict(data, files, self.clear_checkbox_name(name)):
+            # False clears the file field, as with ClearableFileInput
+            return False
+        return super().value_from_datadict(data, files, name)
+
+    def value_omitted_from_data(self, data, files, name):
+        return super().value_omitted_from_data(data, files, name) and self.clear_checkbox_name(name) not in data
+
+
+class DirectUploadField(forms.CharField):
+    """Key of a file uploaded with blog.uploads.presigned_upload(), cleaned by DirectUploadFormMixin."""
+
+    def __init__(self, kind, **kwargs):
+        self.kind = kind
+        kwargs.setdefault('widget', DirectUploadInput(kind))
+        super().__init__(required=False, empty_value=None, **kwargs)
+
+    def to_python(self, value):
+        return False if value is False else super().to_python(value)
+
+
+class DirectUploadFormMixin:
+    """Model form taking files as upload keys, never as bytes.
+
+    Keys are checked against storage and the user they were issued to (None
+    for anonymous visitors); valid ones become the storage name of the file
+    field. Empty ones, and the current storage name edit forms render, leave
+    it unchanged; the widget's clear checkbox removes the file.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.user = kwargs.pop('user', None)
+        super().__init__(*args, **kwargs)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        for name, field in self.fields.items():
+            if isinstance(field, DirectUploadField) and cleaned_data.get(name):
+                if cleaned_data[name] == getattr(self.instance, name).name:
+                    cleaned_data[name] = None
+                    continue
+                try:
+                    cleaned_data[name] = validate_upload(cleaned_data[name], field.kind, self.user)
+                except ValidationError as error:
+                    self.add_error(name, error)
+        return cleaned_data
+
+    def _post_clean(self):
+        super()._post_clean()
+        if any(isinstance(field, DirectUploadField) and self.cleaned_data.get(name)
+               for name, field in self.fields.items()):
+            mark_uploaded(self.instance)
+
+
+class AuthorRegisterForm(DirectUploadFormMixin, UserCreationForm):
+    profile_photo = DirectUploadField('profile_photo')
 
     class Meta:
         model = Author
@@ -20,7 +99,9 @@ class AuthorChangeForm(UserChangeForm):
         fields = ('username', 'email', 'first_name', 'last_name')
 
 
-class AuthorProfileForm(forms.ModelForm):
+class AuthorProfileForm(DirectUploadFormMixin, forms.ModelForm):
+    profile_photo = DirectUploadField('profile_photo')
+
     class Meta:
         model = Author
         fields = ('profile_photo', 'bio', 'birth_date', 'location',)
@@ -35,7 +116,9 @@ class ContactForm(forms.Form):
     message = forms.CharField(label='Message', widget=forms.Textarea)
 
 
-class PostForm(forms.ModelForm):
+class PostForm(DirectUploadFormMixin, forms.ModelForm):
+    image = DirectUploadField('post_image')
+
     class Meta:
         model = Post
         fields = ['title', 'short_description', 'full_description', 'image', 'is_published']
@@ -43,7 +126,6 @@ class PostForm(forms.ModelForm):
             'title': forms.TextInput(attrs={'class': 'form-control'}),
             'short_description': forms.TextInput(attrs={'class': 'form-control'}),
             'full_description': forms.Textarea(attrs={'class': 'form-control'}),
-            'image': forms.FileInput(attrs={'class': 'form-control-file'}),
             'is_published': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
 
@@ -83,7 +165,9 @@ class CommentForm(forms.ModelForm):
         return comment
 
 
-class PostEditForm(forms.ModelForm):
+class PostEditForm(DirectUploadFormMixin, forms.ModelForm):
+    image = DirectUploadField('post_image')
+
     class Meta:
         model = Post
         fields = ['title', 'short_description', 'full_description', 'image', 'is_published']
@@ -0,0 +1,123 @@
+import io
+import posixpath
+import time
+
+from PIL import Image, ImageOps
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from .cache import author_scope, bump_scopes, post_scopes
+from .models import Author, Post
+from .storage import media_url_mode
+
+# Pillow format, file extension and content type of every variant format, preferred first
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+}
+
+# kind: (model, image field, variants field, page scopes showing the image)
+IMAGE_FIELDS = {
+    'post': (Post, 'image', 'image_variants', post_scopes),
+    'author': (Author, 'profile_photo', 'profile_photo_variants', lambda author: [author_scope(author.username)]),
+}
+
+IMAGE_KINDS = {model: kind for kind, (model, *_) in IMAGE_FIELDS.items()}
+
+
+def mark_uploaded(instance):
+    """Have the next save of instance, a Post or Author, generate variants of its image.
+
+    Files uploaded through the request are detected on save, this is for
+    names of files that are already in storage.
+    """
+    instance._image_uploaded = True
+
+
+def variant_widths():
+    return getattr(settings, 'BLOG_IMAGE_VARIANT_WIDTHS', [320, 640, 1280])
+
+
+def variant_quality():
+    return getattr(settings, 'BLOG_IMAGE_VARIANT_QUALITY', 80)
+
+
+def variant_name(name, width, extension):
+    root, _ = posixpath.splitext(name)
+    return f'{root}-{width}w.{extension}'
+
+
+def open_rgb(file):
+    """Load file upright and flattened on white, as JPEG has no alpha channel."""
+    with file.storage.open(file.name) as source, Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+    if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def stored_url(storage, name):
+    """Url of the stored file name to keep with its variant, and the unix time it expires at (None if never)."""
+    expire = getattr(storage, 'querystring_expire', None)
+    if not getattr(storage, 'querystring_auth', False) or not expire or media_url_mode() == 'public':
+        return storage.url(name), None
+    # a fresh presigned url, so its expiry is known
+    return storage.url(name, expire=expire), int(time.time()) + expire
+
+
+def variant_url(storage, variant):
+    """Url of variant, the stored one while it stays valid for BLOG_MEDIA_SIGNED_URL_MIN_TTL seconds."""
+    # variants stored before their expiry was recorded are signed again
+    expires = variant.get('expires', 0)
+    if expires is None or expires - time.time() >= getattr(settings, 'BLOG_MEDIA_SIGNED_URL_MIN_TTL', 900):
+        return variant['url']
+    return storage.url(variant['name'])
+
+
+def make_variants(file):
+    """Save resized copies of file, an image FieldFile, next to it in its storage.
+
+    Every width of BLOG_IMAGE_VARIANT_WIDTHS, capped at the width of the original,
+    is saved in every format of VARIANT_FORMATS. Variants carry no EXIF, ICC or
+    XMP metadata. Returns one dict per variant with its format, width, height,
+    storage name, url and the unix time the url expires at (see stored_url()).
+    """
+    image = open_rgb(file)
+    variants = []
+    for width in sorted({min(width, image.width) for width in variant_widths()}):
+        height = max(round(image.height * width / image.width), 1)
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        resized.info.clear()
+        for variant_format, (pil_format, extension, _) in VARIANT_FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, pil_format, quality=variant_quality())
+            name = file.storage.save(variant_name(file.name, width, extension), ContentFile(buffer.getvalue()))
+            url, expires = stored_url(file.storage, name)
+            variants.append({'format': variant_format, 'width': width, 'height': height, 'name': name,
+                             'url': url, 'expires': expires})
+    return variants
+
+
+def process_image(kind, pk):
+    """Generate the variants of the image of kind with primary key pk and store them on the row."""
+    model, field, variants_field, scopes = IMAGE_FIELDS[kind]
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not getattr(instance, field):
+        return []
+    file = getattr(instance, field)
+    try:
+        variants = make_variants(file)
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        # uploads are only checked by their headers, a corrupt one is removed rather than served
+        if model.objects.filter(pk=pk, **{field: file.name}).update(**{field: '', variants_field: []}):
+            file.storage.delete(file.name)
+            bump_scopes(scopes(instance))
+        return []
+    # skip the update if another upload replaced the image in the meantime, its own task stores its variants
+    if model.objects.filter(pk=pk, **{field: file.name}).update(**{variants_field: variants}):
+        bump_scopes(scopes(instance))
+    return variants
@@ -0,0 +1,192 @@
+import functools
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+
+import redis
+
+from .cache import bump_scopes, comment_page_scopes
+from .models import Comment, Post
+from .search import search_backend
+
+STREAM_KEY = 'blog:comment-submissions'
+CONSUMER_GROUP = 'blog-ingest'
+
+
+def batch_size():
+    return getattr(settings, 'BLOG_COMMENT_QUEUE_BATCH_SIZE', 500)
+
+
+def claim_after():
+    return getattr(settings, 'BLOG_COMMENT_QUEUE_CLAIM_AFTER', 60)
+
+
+class RedisStreamQueue:
+    """Comment submissions in a Redis stream, read through a consumer group.
+
+    Entries stay pending in the group until acknowledged, the ones a consumer
+    did not acknowledge within claim_after seconds (it died or its batch failed)
+    are delivered again, before any newer entry.
+    """
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+        self.consumer = f'{socket.gethostname()}-{os.getpid()}'
+        self.group_created = False
+
+    def ensure_group(self):
+        if self.group_created:
+            return
+        try:
+            self.client.xgroup_create(STREAM_KEY, CONSUMER_GROUP, id='0', mkstream=True)
+        except redis.ResponseError as error:
+            if 'BUSYGROUP' not in str(error):
+                raise
+        self.group_created = True
+
+    def push(self, submission):
+        return self.client.xadd(STREAM_KEY, {'submission': json.dumps(submission)}).decode()
+
+    def read(self, count, claim_after):
+        """Up to count (entry id, submission) pairs, stale unacknowledged entries first."""
+        self.ensure_group()
+        # the reply also lists the ids of deleted entries since Redis 7
+        messages = self.client.xautoclaim(STREAM_KEY, CONSUMER_GROUP, self.consumer, int(claim_after * 1000),
+                                          start_id='0-0', count=count)[1]
+        if len(messages) < count:
+            for _, new in self.client.xreadgroup(CONSUMER_GROUP, self.consumer, {STREAM_KEY: '>'},
+                                                 count=count - len(messages)):
+                messages += new
+        return [(entry_id.decode(), json.loads(fields[b'submission'])) for entry_id, fields in messages if fields]
+
+    def ack(self, entry_ids):
+        if entry_ids:
+            with self.client.pipeline(transaction=False) as pipe:
+                pipe.xack(STREAM_KEY, CONSUMER_GROUP, *entry_ids)
+                pipe.xdel(STREAM_KEY, *entry_ids)
+                pipe.execute()
+
+
+class LocalQueue:
+    """In-process queue with the delivery semantics of RedisStreamQueue.
+
+    Only the process that pushes the submissions can ingest them, so the web
+    process drains it itself once the request commits (see PostDetailView.post).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.delivered = {}
+        self.ids = itertools.count(1)
+
+    def push(self, submission):
+        with self.lock:
+            entry_id = str(next(self.ids))
+            self.entries[entry_id] = submission
+        return entry_id
+
+    def read(self, count, claim_after):
+        now = time.monotonic()
+        read = []
+        with self.lock:
+            # entries are kept in push order, so redeliveries come before newer entries
+            for entry_id, submission in self.entries.items():
+                if len(read) == count:
+                    break
+                delivered_at = self.delivered.get(entry_id)
+                if delivered_at is None or now - delivered_at >= claim_after:
+                    self.delivered[entry_id] = now
+                    read.append((entry_id, submission))
+        return read
+
+    def ack(self, entry_ids):
+        with self.lock:
+            for entry_id in entry_ids:
+                self.entries.pop(entry_id, None)
+                self.delivered.pop(entry_id, None)
+
+
+_queues = {}
+
+
+def comment_queue():
+    """Queue of BLOG_COMMENT_QUEUE ('local' or a Redis URL), None when comments are saved by the request."""
+    location = getattr(settings, 'BLOG_COMMENT_QUEUE', '')
+    if not location:
+        return None
+    if location not in _queues:
+        _queues[location] = LocalQueue() if location == 'local' else RedisStreamQueue(location)
+    return _queues[location]
+
+
+def submission(comment):
+    """Queue entry of comment, a validated unsaved Comment."""
+    return {'id': uuid.uuid4().hex, 'post': comment.post_id, 'author': comment.author, 'text': comment.text}
+
+
+def comments_ingested(comment_ids):
+    bump_scopes(comment_page_scopes(Comment.objects.filter(pk__in=comment_ids)))
+    search_backend().index(Comment, comment_ids)
+
+
+def ingest_batch(queue, count, claim_after):
+    """Save up to count queued submissions, returns (entries read, ids of the new comments).
+
+    The comments are inserted by one bulk_create() and the entries acknowledged
+    after the transaction commits, so a failure leaves them to be delivered
+    again. Submissions that were already inserted (their acknowledgement got
+    lost) or whose post was deleted in the meantime are skipped, only the
+    comments this call inserted are returned.
+    """
+    entries = queue.read(count, claim_after)
+    if not entries:
+        return 0, []
+    submissions = {entry['id']: entry for _, entry in entries}
+    with transaction.atomic():
+        # a consumer claiming the entries of a slow one waits for it on the posts' rows, and then sees its comments
+        post_ids = set(Post.objects.select_for_update().filter(pk__in={entry['post'] for entry in submissions.values()})
+                       .order_by('pk').values_list('pk', flat=True))
+        inserted = set(Comment.objects.filter(submission_id__in=list(submissions))
+                       .values_list('submission_id', flat=True))
+        comments = [
+            Comment(post_id=entry['post'], author=entry['author'], text=entry['text'], submission_id=submission_id)
+            for submission_id, entry in submissions.items()
+            if submission_id not in inserted and entry['post'] in post_ids
+        ]
+        # a conflict on submission_id still fails the batch, which is delivered again
+        Comment.objects.bulk_create(comments)
+        created = list(Comment.objects.filter(submission_id__in=[comment.submission_id for comment in comments])
+                       .order_by('pk').values_list('pk', flat=True))
+        # bulk_create() sends no post_save, so the pages and search index are updated here, once the
+        # comments are visible to the requests that refill the cache and to the indexer
+        if created:
+            transaction.on_commit(functools.partial(comments_ingested, created))
+    queue.ack([entry_id for entry_id, _ in entries])
+    return len(entries), created
+
+
+def drain_comment_queue(notify=None):
+    """Ingest the queued comment submissions until the queue is empty, returns the number of new comments.
+
+    notify(comment_ids) is called with the new comments of every batch.
+    """
+    queue = comment_queue()
+    if queue is None:
+        return 0
+    count = batch_size()
+    total = 0
+    while True:
+        read, created = ingest_batch(queue, count, claim_after())
+        if created and notify is not None:
+            notify(created)
+        total += len(created)
+        if read < count:
+            return total
@@ -0,0 +1,184 @@
+import contextlib
+import contextvars
+import datetime
+import time
+
+from django.core.cache.backends import locmem, redis
+from django.template.backends import django as django_backend
+
+from .metrics import metrics
+
+# RequestStats of the sampled request being served, None otherwise
+request_stats = contextvars.ContextVar('request_stats', default=None)
+
+# TaskStats of the celery task running in this thread, None otherwise
+task_stats = contextvars.ContextVar('task_stats', default=None)
+
+# Message header holding the time.time() a task was published at
+SENT_AT_HEADER = 'blog_sent_at'
+
+MISSING = object()
+
+
+class RequestStats:
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_time = 0.0
+        self.rendering = False
+
+    def server_timing(self, total):
+        """Server-Timing header value, durations in milliseconds."""
+        return (f'total;dur={total * 1000:.1f}, '
+                f'sql;dur={self.sql_time * 1000:.1f};desc="{self.sql_count} queries", '
+                f'cache;desc="{self.cache_hits} hits {self.cache_misses} misses", '
+                f'template;dur={self.template_time * 1000:.1f}')
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper timing the queries of sampled requests."""
+    stats = request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.sql_count += 1
+        stats.sql_time += time.perf_counter() - started
+
+
+def install_query_recorder(connection, **kwargs):
+    """connection_created receiver, the wrapper also sees the queries run by the async ORM's threads."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class InstrumentedCacheMixin:
+    """Counts the hits and misses of cache reads made by sampled requests."""
+
+    def get(self, key, default=None, version=None):
+        stats = request_stats.get()
+        if stats is None:
+            return super().get(key, default, version)
+        value = super().get(key, MISSING, version)
+        if value is MISSING:
+            stats.cache_misses += 1
+            return default
+        stats.cache_hits += 1
+        return value
+
+    def get_many(self, keys, version=None):
+        stats = request_stats.get()
+        if stats is None:
+            return super().get_many(keys, version)
+        keys = list(keys)
+        # the default get_many() goes through get(), reads are counted once here
+        token = request_stats.set(None)
+        try:
+            values = super().get_many(keys, version)
+        finally:
+            request_stats.reset(token)
+        stats.cache_hits += len(values)
+        stats.cache_misses += len(keys) - len(values)
+        return values
+
+
+class RedisCache(InstrumentedCacheMixin, redis.RedisCache):
+    pass
+
+
+class LocMemCache(InstrumentedCacheMixin, locmem.LocMemCache):
+    pass
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        stats = request_stats.get()
+        if stats is None or stats.rendering:
+            return super().render(context, request)
+        stats.rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.rendering = False
+            stats.template_time += time.perf_counter() - started
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Django template engine timing the renders of sampled requests."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+
+class TaskStats:
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.started = time.perf_counter()
+
+
+def task_sent_at(request):
+    """When the task of request could start: its publish time, or its eta if it had one."""
+    sent_at = getattr(request, SENT_AT_HEADER, None) or (request.headers or {}).get(SENT_AT_HEADER)
+    eta = request.eta
+    if isinstance(eta, str):
+        eta = datetime.datetime.fromisoformat(eta)
+    if sent_at and eta:
+        sent_at = max(sent_at, eta.timestamp())
+    return sent_at
+
+
+def stamp_sent_at(headers=None, **kwargs):
+    """before_task_publish receiver, workers measure the queue latency from the stamp."""
+    if headers is not None:
+        headers.setdefault(SENT_AT_HEADER, time.time())
+
+
+def task_started(task=None, **kwargs):
+    """task_prerun receiver."""
+    sent_at = task_sent_at(task.request)
+    if sent_at:
+        # web and worker clocks may disagree a little, the latency is never negative
+        metrics.observe('blog_task_queue_seconds', max(time.time() - sent_at, 0), task=task.name)
+    task_stats.set(TaskStats(task.name, task_stats.get()))
+
+
+def task_finished(task=None, state=None, **kwargs):
+    """task_postrun receiver."""
+    stats = task_stats.get()
+    if stats is not None and stats.name == task.name:
+        metrics.observe('blog_task_run_seconds', time.perf_counter() - stats.started, task=task.name)
+        # eager tasks run inside their caller
+        task_stats.set(stats.parent)
+    metrics.inc('blog_tasks_total', task=task.name, state=state or 'UNKNOWN')
+    metrics.maybe_flush()
+
+
+def task_failed(sender=None, exception=None, **kwargs):
+    """task_failure receiver."""
+    metrics.inc('blog_task_failures_total', task=sender.name, exception=type(exception).__name__)
+
+
+def flush_metrics(**kwargs):
+    """Worker shutdown receiver, the buffered observations are not lost."""
+    metrics.flush()
+
+
+@contextlib.contextmanager
+def timed_email():
+    """Time the email sending of the block, as part of the metrics of the running task."""
+    stats = task_stats.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            metrics.observe('blog_task_email_seconds', time.perf_counter() - started, task=stats.name)
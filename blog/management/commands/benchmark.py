@@ -0,0 +1,214 @@
+import json
+import statistics
+import time
+import tracemalloc
+from unittest import mock
+
+from blog.counters import recount
+from blog.models import Author, Comment, Post
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+# posts: (users, posts per user, comments per post) seeded by "manage.py users --bulk"
+SCALES = {
+    '1k': (10, 100, 3),
+    '100k': (1000, 100, 3),
+    '1m': (10000, 100, 3),
+}
+
+# Comments of the post whose last comment page post_detail_deep reads
+DEEP_COMMENTS = 5000
+COMMENTS_PER_PAGE = 10
+
+BENCHMARK_ADMIN = 'benchmark-admin'
+
+
+def summarize(timings, queries, peak):
+    quantiles = statistics.quantiles(timings, n=100) if len(timings) > 1 else timings * 99
+    return {
+        'requests': len(timings),
+        'p50_ms': round(quantiles[49], 2),
+        'p95_ms': round(quantiles[94], 2),
+        'p99_ms': round(quantiles[98], 2),
+        'queries': round(statistics.mean(queries), 1),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of results against baseline, as messages.
+
+    Latencies and peak memory may grow by the tolerance share, queries per
+    request may not grow at all.
+    """
+    regressions = []
+    for name, measured in results['scenarios'].items():
+        expected = baseline.get('scenarios', {}).get(name)
+        if expected is None:
+            continue
+        for field in ('p50_ms', 'p95_ms', 'p99_ms', 'peak_kib'):
+            if measured[field] > expected[field] * (1 + tolerance):
+                regressions.append(f'{name}: {field} {measured[field]} > {expected[field]} (+{tolerance:.0%})')
+        if measured['queries'] > expected['queries']:
+            regressions.append(f'{name}: queries {measured["queries"]} > {expected["queries"]}')
+    return regressions
+
+
+class Command(BaseCommand):
+    help = ('Seed a dataset scale and measure latency percentiles, queries and peak memory of the blog endpoints, '
+            'optionally against a baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--allow-writes', action='store_true',
+                            help='Run against the configured database, which should be a scratch one: seed data, '
+                                 'comments and a superuser are written to it')
+        parser.add_argument('--scale', choices=SCALES, default='1k', help='Published posts to seed and expect')
+        parser.add_argument('--seed-data', action='store_true',
+                            help='Generate the posts of --scale (and the deep comment page) when they are missing')
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per scenario')
+        parser.add_argument('--memory-requests', type=int, default=5,
+                            help='Extra requests per scenario run under tracemalloc for the peak memory')
+        parser.add_argument('--export-rows', type=int, default=500,
+                            help='Posts selected for the admin export, below DATA_UPLOAD_MAX_NUMBER_FIELDS')
+        parser.add_argument('--page-cache', action='store_true', help='Keep the anonymous page cache on')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Compare against this JSON file of earlier results')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed latency and memory growth over the baseline, as a share')
+
+    def handle(self, *args, **options):
+        if not options['allow_writes']:
+            raise CommandError(f'The benchmark writes to the {connection.settings_dict["NAME"]} database, point '
+                               f'DATABASE_URL at a scratch database and pass --allow-writes')
+        if options['seed_data']:
+            self.seed(options['scale'])
+        if not Post.objects.filter(is_published=True).exists():
+            raise CommandError('No published posts, run with --seed-data first')
+
+        # the test client talks to the 'testserver' host, and sends every comment from the same address
+        overrides = {'BLOG_METRICS_SAMPLE_RATE': 0, 'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+                     'BLOG_RATE_LIMITS': {}}
+        if not options['page_cache']:
+            overrides['BLOG_PAGE_CACHE_TIMEOUT'] = 0
+        # nothing reaches the broker, requests are measured without the workers
+        with override_settings(**overrides), mock.patch('celery.app.task.Task.apply_async'):
+            results = {
+                'scale': options['scale'],
+                'posts': Post.objects.filter(is_published=True).count(),
+                'scenarios': self.run(options),
+            }
+
+        for name, measured in results['scenarios'].items():
+            self.stdout.write(f'{name:>20}: p50 {measured["p50_ms"]:.1f} ms, p95 {measured["p95_ms"]:.1f} ms, '
+                              f'p99 {measured["p99_ms"]:.1f} ms, {measured["queries"]} queries, '
+                              f'peak {measured["peak_kib"]:.0f} KiB')
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+            if baseline.get('scale') != results['scale']:
+                raise CommandError(f'The baseline was measured at the {baseline.get("scale")} scale')
+            regressions = compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regression against the baseline'))
+
+    def seed(self, scale):
+        users, posts_per_user, comments_per_post = SCALES[scale]
+        existing = Post.objects.filter(is_published=True).count()
+        missing = users * posts_per_user - existing
+        if missing > 0:
+            # seeded from the existing rows, so growing a dataset generates new usernames
+            call_command('users', bulk=True, users=-(-missing // posts_per_user), posts=posts_per_user,
+                         comments=comments_per_post, seed=existing, stdout=self.stdout)
+        post = self.deep_post()
+        if post.published_comment_count < DEEP_COMMENTS:
+            Comment.objects.bulk_create(
+                (Comment(post=post, author='Benchmark', text=f'Comment {i}', is_published=True)
+                 for i in range(DEEP_COMMENTS - post.published_comment_count)),
+                batch_size=1000,
+            )
+            recount(Post.objects.filter(pk=post.pk))
+
+    def deep_post(self):
+        return Post.objects.filter(is_published=True).order_by('-published_comment_count', 'pk').first()
+
+    def scenarios(self, export_rows, commenter):
+        """name: (method, url, data, logged in) of every benchmarked request."""
+        deep = self.deep_post()
+        pages = -(-Post.objects.filter(is_published=True).count() // 10)
+        comment_pages = -(-deep.published_comment_count // COMMENTS_PER_PAGE)
+        export_ids = list(Post.objects.order_by('pk').values_list('pk', flat=True)[:export_rows])
+        return {
+            'post_list': ('get', reverse('post_list'), {}, False),
+            'post_list_deep': ('get', reverse('post_list'), {'page': pages // 2 or 1}, False),
+            'post_detail': ('get', reverse('post_detail', args=[deep.pk]), {}, False),
+            'post_detail_deep': ('get', reverse('post_detail', args=[deep.pk]), {'page': comment_pages}, False),
+            'user_posts': ('get', reverse('user_posts', args=[deep.owner.username]), {}, False),
+            'comment_submit': ('post', reverse('post_detail', args=[deep.pk]),
+                               {'author': commenter, 'text': 'Benchmark comment'}, False),
+            'admin_export': ('post', reverse('admin:blog_post_changelist'),
+                             {'action': 'export_selected_posts', '_selected_action': export_ids}, True),
+        }
+
+    def run(self, options):
+        admin, created = Author.objects.get_or_create(username=BENCHMARK_ADMIN, defaults={
+            'email': f'{BENCHMARK_ADMIN}@example.com', 'is_staff': True, 'is_superuser': True,
+        })
+        # marks the comments this run submits, the only ones it deletes
+        commenter = f'Benchmark {get_random_string(12)}'
+        results = {}
+        try:
+            for name, (method, url, data, logged_in) in self.scenarios(options['export_rows'], commenter).items():
+                client = Client()
+                if logged_in:
+                    client.force_login(admin)
+                request = getattr(client, method)
+                self.fetch(request, url, data)
+                timings, queries = [], []
+                for _ in range(options['requests']):
+                    with CaptureQueriesContext(connection) as captured:
+                        started = time.perf_counter()
+                        self.fetch(request, url, data)
+                        timings.append((time.perf_counter() - started) * 1000)
+                    queries.append(len(captured))
+                peak = self.peak_memory(request, url, data, options['memory_requests'])
+                results[name] = summarize(timings, queries, peak)
+        finally:
+            # submitted comments are not kept, anonymous ones get the Guest prefix
+            Comment.objects.filter(author=f'Guest {commenter}').delete()
+            recount(Post.objects.filter(pk=self.deep_post().pk))
+            if created:
+                admin.delete()
+        return results
+
+    def fetch(self, request, url, data):
+        response = request(url, data)
+        if response.status_code >= 400:
+            raise CommandError(f'{url} answered {response.status_code}')
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+
+    def peak_memory(self, request, url, data, requests):
+        tracemalloc.start()
+        try:
+            peak = 0
+            for _ in range(requests):
+                tracemalloc.reset_peak()
+                self.fetch(request, url, data)
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+            return peak
+        finally:
+            tracemalloc.stop()
@@ -0,0 +1,95 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+
+from blog import async_views, views
+from blog.models import Post
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncRequestFactory, RequestFactory
+from django.test.utils import override_settings
+
+PATH = '/blog/post_list'
+
+
+def report(stdout, label, timings, elapsed):
+    quantiles = statistics.quantiles(timings, n=100)
+    stdout.write(f'{label}: {len(timings) / elapsed:.1f} req/s, p50 {quantiles[49]:.1f} ms, '
+                 f'p95 {quantiles[94]:.1f} ms')
+    return len(timings) / elapsed
+
+
+class Command(BaseCommand):
+    help = 'Compare post_list throughput of the sync views in threads (WSGI) and the async views (ASGI)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per server model')
+        parser.add_argument('--concurrency', type=int, default=20, help='Threads, or concurrent async requests')
+        parser.add_argument('--latency', type=float, default=20, help='Simulated latency of every query, in ms')
+
+    def handle(self, *args, requests, concurrency, latency, **options):
+        if not Post.objects.filter(is_published=True).exists():
+            raise CommandError('No published posts, generate some with "manage.py users" first')
+
+        def slow_query(execute, sql, params, many, context):
+            time.sleep(latency / 1000)
+            return execute(sql, params, many, context)
+
+        def add_latency(connection, **kwargs):
+            connection.execute_wrappers.append(slow_query)
+
+        connections.close_all()
+        connection_created.connect(add_latency)
+        try:
+            # every request must reach the database
+            with override_settings(BLOG_PAGE_CACHE_TIMEOUT=0):
+                wsgi = self.run_wsgi(requests, concurrency)
+                asgi = asyncio.run(self.run_asgi(requests, concurrency))
+        finally:
+            connection_created.disconnect(add_latency)
+            connections.close_all()
+        self.stdout.write(self.style.SUCCESS(f'ASGI/WSGI throughput: {asgi / wsgi:.2f}x'))
+
+    def run_wsgi(self, requests, concurrency):
+        view = views.PostListView.as_view()
+
+        def get(_):
+            started = time.perf_counter()
+            request = RequestFactory().get(PATH)
+            request.user = AnonymousUser()
+            view(request).render()
+            return (time.perf_counter() - started) * 1000
+
+        with ThreadPoolExecutor(concurrency) as pool:
+            # open every thread's connection and compile the templates before timing
+            list(pool.map(get, range(concurrency)))
+            started = time.perf_counter()
+            timings = list(pool.map(get, range(requests)))
+            pool.map(lambda _: connections.close_all(), range(concurrency))
+        return report(self.stdout, f'WSGI, {concurrency} threads', timings, time.perf_counter() - started)
+
+    async def run_asgi(self, requests, concurrency):
+        view = async_views.PostListView.as_view()
+        slots = asyncio.Semaphore(concurrency)
+
+        async def get():
+            async with slots:
+                started = time.perf_counter()
+                request = AsyncRequestFactory().get(PATH)
+                request.user = AnonymousUser()
+                response = await view(request)
+                # rendered in a worker thread, as the ASGI handler does
+                await sync_to_async(response.render)()
+                return (time.perf_counter() - started) * 1000
+
+        await get()
+        started = time.perf_counter()
+        timings = await asyncio.gather(*(get() for _ in range(requests)))
+        await sync_to_async(connections.close_all)()
+        return report(self.stdout, f'ASGI, {concurrency} concurrent requests', timings, time.perf_counter() - started)
@@ -0,0 +1,125 @@
+import statistics
+import threading
+import time
+
+from blog.dbpool import ConnectionPool
+from blog.tasks import send_new_comment_notification
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection, connections
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import reverse
+
+
+class ConnectionCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.opened = 0
+
+    def __call__(self, **kwargs):
+        with self.lock:
+            self.opened += 1
+
+
+def run_task():
+    """What a worker does around a task: celery's django fixup closes obsolete connections before and after it."""
+    close_old_connections()
+    # reads one row, like every notification task
+    send_new_comment_notification.run(0)
+    close_old_connections()
+
+
+class Command(BaseCommand):
+    help = ('Measure the connection setup that persistent connections save per request and per task, and the '
+            'connections opened by threaded workers with and without the connection pool')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per configuration')
+        parser.add_argument('--tasks', type=int, default=200, help='Tasks per configuration')
+        parser.add_argument('--conn-max-age', type=int, default=60, help='CONN_MAX_AGE of the persistent runs')
+        parser.add_argument('--threads', type=int, default=8, help='Worker threads of the threaded runs')
+        parser.add_argument('--pool-size', type=int, default=2, help='Connections of the pooled threaded run')
+
+    def handle(self, *args, **options):
+        counter = ConnectionCounter()
+        connection_created.connect(counter)
+        original_max_age = connection.settings_dict['CONN_MAX_AGE']
+        try:
+            for max_age in (0, options['conn_max_age']):
+                self.set_max_age(max_age)
+                label = f'CONN_MAX_AGE={max_age}'
+                self.report(f'{label} request', counter, self.requests, options['requests'])
+                self.report(f'{label} task', counter, self.tasks, options['tasks'])
+                self.report(f'{label} {options["threads"]} threads', counter, self.threaded_tasks,
+                            options['threads'], options['tasks'])
+                self.report(f'{label} pool of {options["pool_size"]}', counter, self.threaded_tasks,
+                            options['threads'], options['tasks'], options['pool_size'])
+        finally:
+            connection_created.disconnect(counter)
+            self.set_max_age(original_max_age)
+
+    def set_max_age(self, max_age):
+        # the settings are shared with the connections other threads create
+        connection.settings_dict['CONN_MAX_AGE'] = max_age
+        connection.close()
+
+    def report(self, name, counter, benchmark, *args):
+        opened = counter.opened
+        timings = benchmark(*args)
+        self.stdout.write(f'{name:>30}: median {statistics.median(timings):.0f} us, '
+                          f'{counter.opened - opened} connections opened for {len(timings)}')
+
+    def requests(self, count):
+        handler = WSGIHandler()
+        environ = RequestFactory().get(reverse('post_list')).environ
+        timings = []
+        # the handler sends request_started and request_finished, which close obsolete connections
+        with override_settings(BLOG_METRICS_SAMPLE_RATE=0, BLOG_PAGE_CACHE_TIMEOUT=0,
+                               ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for _ in range(count):
+                started = time.perf_counter()
+                handler(environ, lambda status, headers: None).close()
+                timings.append((time.perf_counter() - started) * 1_000_000)
+        return timings
+
+    def tasks(self, count):
+        timings = []
+        for _ in range(count):
+            started = time.perf_counter()
+            run_task()
+            timings.append((time.perf_counter() - started) * 1_000_000)
+        return timings
+
+    def threaded_tasks(self, threads, count, pool_size=0):
+        pool = ConnectionPool(pool_size) if pool_size else None
+        timings = []
+        lock = threading.Lock()
+
+        def worker():
+            measured = []
+            for _ in range(count):
+                started = time.perf_counter()
+                if pool is not None:
+                    pool.acquire()
+                try:
+                    run_task()
+                finally:
+                    if pool is not None:
+                        pool.release()
+                measured.append((time.perf_counter() - started) * 1_000_000)
+            with lock:
+                timings.extend(measured)
+            connections.close_all()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        if pool is not None:
+            pool.close()
+        return timings
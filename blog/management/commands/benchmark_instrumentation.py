@@ -0,0 +1,75 @@
+import statistics
+import time
+
+from blog import views
+from blog.middleware import performance_middleware
+from blog.models import Author, Post
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import resolve
+
+PATH = '/blog/post_list'
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-request overhead of the performance middleware on post_list renders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per round and configuration')
+        parser.add_argument('--rounds', type=int, default=5, help='Rounds, configurations alternate between rounds')
+        parser.add_argument('--budget', type=float, default=300,
+                            help='Maximum overhead of a sampled request, in microseconds')
+
+    def handle(self, *args, **options):
+        # the posts only live inside a rolled back transaction
+        try:
+            with transaction.atomic():
+                overhead = self.benchmark(options['requests'], options['rounds'])
+                raise Rollback
+        except Rollback:
+            pass
+        if overhead > options['budget']:
+            raise CommandError(f'Sampled requests cost {overhead:.0f} us more, over the {options["budget"]:.0f} us '
+                               f'budget')
+        self.stdout.write(self.style.SUCCESS(f'Sampled request overhead {overhead:.0f} us, within the '
+                                             f'{options["budget"]:.0f} us budget'))
+
+    def benchmark(self, requests, rounds):
+        owner = Author.objects.create_user(username='benchmark-instrumentation', email='benchmark@example.com')
+        Post.objects.bulk_create(Post(owner=owner, title=f'Post {i}', short_description='short',
+                                      full_description='full', is_published=True) for i in range(10))
+        view = views.PostListView.as_view()
+
+        def render(request):
+            return view(request).render()
+
+        handlers = {'off': render, 'unsampled': performance_middleware(render),
+                    'sampled': performance_middleware(render)}
+        rates = {'off': 0, 'unsampled': 0, 'sampled': 1}
+        timings = {name: [] for name in handlers}
+        # every request renders the page, configurations take turns so drift hits them equally
+        with override_settings(BLOG_PAGE_CACHE_TIMEOUT=0):
+            for _ in range(rounds * requests):
+                for name, handler in handlers.items():
+                    request = RequestFactory().get(PATH)
+                    request.user = AnonymousUser()
+                    request.resolver_match = resolve(PATH)
+                    with override_settings(BLOG_METRICS_SAMPLE_RATE=rates[name]):
+                        started = time.perf_counter()
+                        handler(request)
+                        timings[name].append((time.perf_counter() - started) * 1_000_000)
+
+        medians = {name: statistics.median(values) for name, values in timings.items()}
+        for name, median in medians.items():
+            self.stdout.write(f'{name:>9}: median {median:.0f} us per request')
+        for name in ('unsampled', 'sampled'):
+            self.stdout.write(f'{name:>9} overhead: {medians[name] - medians["off"]:.0f} us')
+        return medians['sampled'] - medians['off']
@@ -0,0 +1,71 @@
+import statistics
+import time
+
+from blog.models import Author, Post, PostImagesStorage
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+MODES = ('signed', 'cached', 'public')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare the render time of a 10-post post_list page in every BLOG_MEDIA_URL_MODE'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--renders', type=int, default=200, help='Renders timed per mode')
+        parser.add_argument('--variants', type=int, default=6, help='Image variants of every post')
+
+    def handle(self, *args, **options):
+        # the posts only live inside a rolled back transaction
+        try:
+            with transaction.atomic():
+                self.benchmark(options['renders'], options['variants'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def benchmark(self, renders, variants):
+        owner = Author.objects.create_user(username='benchmark-media-urls', email='benchmark@example.com')
+        Post.objects.bulk_create(
+            Post(owner=owner, title=f'Post {i}', short_description='short', full_description='full',
+                 is_published=True, image=f'post_images/post-{i}.jpg',
+                 image_variants=[{'format': 'jpeg', 'width': 320 * (v + 1), 'height': 240 * (v + 1),
+                                  'name': f'post_images/post-{i}-{v}.jpg', 'url': ''} for v in range(variants)])
+            for i in range(10)
+        )
+        # presigning works offline, so placeholder credentials are enough
+        storage = PostImagesStorage(access_key='benchmark', secret_key='benchmark',
+                                    bucket_name='benchmark', region_name='fra1',
+                                    endpoint_url='https://fra1.digitaloceanspaces.com')
+        request = RequestFactory().get('/blog/post_list')
+        request.user = AnonymousUser()
+        posts = list(Post.objects.filter(owner=owner).select_related('owner'))
+        for post in posts:
+            post.image.storage = storage
+
+        results = {}
+        for mode in MODES:
+            with override_settings(BLOG_MEDIA_URL_MODE=mode):
+                storage.signed_urls.clear()
+                render_to_string('blog/post_list.html', {'posts': posts}, request)
+                timings = []
+                for _ in range(renders):
+                    started = time.perf_counter()
+                    render_to_string('blog/post_list.html', {'posts': posts}, request)
+                    timings.append((time.perf_counter() - started) * 1000)
+            results[mode] = statistics.median(timings)
+            self.stdout.write(f'{mode:>7}: median {results[mode]:.2f} ms, '
+                              f'p95 {statistics.quantiles(timings, n=20)[-1]:.2f} ms per render')
+
+        for mode in MODES[1:]:
+            self.stdout.write(self.style.SUCCESS(
+                f'{mode} urls render {results["signed"] / results[mode]:.1f}x faster than signed urls'))
@@ -0,0 +1,52 @@
+import statistics
+import time
+
+from blog.ratelimit import rate_limit
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+
+def view(request):
+    return HttpResponse()
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-request overhead of the rate limiter with the configured cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per configuration')
+        parser.add_argument('--clients', type=int, default=100, help='Client IPs the requests are spread over')
+        parser.add_argument('--budget', type=float, default=100,
+                            help='Maximum overhead of a rate limited request, in microseconds')
+
+    def handle(self, *args, **options):
+        # limits high enough that no request is refused, every one is counted
+        limits = {'benchmark': {'ip': f'{options["requests"] * 10}/m', 'user': ''}}
+        handlers = {'off': view, 'limited': rate_limit('benchmark')(view)}
+        timings = {name: [] for name in handlers}
+        with override_settings(BLOG_RATE_LIMITS=limits):
+            # configurations take turns so drift hits them equally
+            for i in range(options['requests']):
+                for name, handler in handlers.items():
+                    request = RequestFactory().post('/', REMOTE_ADDR=f'10.0.{i % options["clients"] // 256}.'
+                                                                     f'{i % options["clients"] % 256}')
+                    request.user = AnonymousUser()
+                    started = time.perf_counter()
+                    response = handler(request)
+                    timings[name].append((time.perf_counter() - started) * 1_000_000)
+                    if response.status_code != 200:
+                        raise CommandError(f'{name} request answered {response.status_code}')
+
+        medians = {name: statistics.median(values) for name, values in timings.items()}
+        for name, median in medians.items():
+            self.stdout.write(f'{name:>8}: median {median:.1f} us per request')
+        overhead = medians['limited'] - medians['off']
+        if overhead > options['budget']:
+            raise CommandError(f'Rate limiting costs {overhead:.1f} us per request, over the '
+                               f'{options["budget"]:.0f} us budget')
+        self.stdout.write(self.style.SUCCESS(f'Rate limiting overhead {overhead:.1f} us per request, within the '
+                                             f'{options["budget"]:.0f} us budget'))
@@ -0,0 +1,19 @@
+from blog.models import Comment, Post
+from blog.search import search_backend
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of posts and comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of rows indexed per query')
+
+    def handle(self, *args, **options):
+        backend = search_backend()
+        for model in (Post, Comment):
+            backend.index_all(model, options['batch_size'])
+            self.stdout.write(f'{model._meta.verbose_name_plural} indexed')
+
+        self.stdout.write(self.style.SUCCESS('Successfully rebuilt the search index'))
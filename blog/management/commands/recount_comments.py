@@ -0,0 +1,25 @@
+from blog.counters import recount
+from blog.models import Post
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Recompute published_comment_count and last_comment_at of every post'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of posts updated per query')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = 0
+        updated = 0
+        while True:
+            batch = list(Post.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                break
+            updated += recount(Post.objects.filter(pk__gt=last_pk, pk__lte=batch[-1]))
+            last_pk = batch[-1]
+            self.stdout.write(f'{updated} posts recounted')
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully recounted comments of {updated} posts'))
@@ -1,11 +1,81 @@
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from blog.cache import bump_scopes, count_scope, list_scope
+from blog.counters import recount
 from blog.models import Author, Comment, Post
+from blog.search import search_backend
 
+from django.contrib.auth.hashers import make_password
 from django.core.management.base import BaseCommand
+from django.db import connections
 from django.utils import timezone
 
 from faker import Faker
 
 
+def write_progress(message):
+    sys.stdout.write(message + '\n')
+    sys.stdout.flush()
+
+
+def bulk_generate(start, stop, posts_per_user, comments_per_post, batch_size, seed, password_hash,
+                  report=write_progress):
+    """Insert users start..stop-1 with their posts and comments using bulk_create.
+
+    Faker is reseeded for every batch of users, so with a seed the generated data
+    does not depend on how the range is split between workers. Usernames and
+    emails carry the user number to stay unique across workers.
+    """
+    fake = Faker()
+    totals = [0, 0, 0]
+    started = time.monotonic()
+    for batch_start in range(start, stop, batch_size):
+        batch_stop = min(batch_start + batch_size, stop)
+        if seed is not None:
+            fake.seed_instance(f'{seed}-{batch_start}')
+        users = Author.objects.bulk_create([
+            Author(
+                username=f'{fake.user_name()}{number}',
+                password=password_hash,
+                email=f'{number}.{fake.email()}',
+                first_name=fake.first_name(),
+                last_name=fake.last_name(),
+                bio=fake.text(),
+                birth_date=fake.date_of_birth(),
+                location=fake.city(),
+            )
+            for number in range(batch_start, batch_stop)
+        ], batch_size=batch_size)
+        posts = Post.objects.bulk_create([
+            Post(
+                owner=user,
+                title=fake.sentence(),
+                short_description=fake.sentence(),
+                full_description='\n\n'.join(fake.paragraphs(nb=3)),
+                is_published=True,
+            )
+            for user in users for _ in range(posts_per_user)
+        ], batch_size=batch_size)
+        comments = Comment.objects.bulk_create([
+            Comment(post=post, author=fake.name(), text=fake.paragraph(), is_published=True)
+            for post in posts for _ in range(comments_per_post)
+        ], batch_size=batch_size)
+        if posts:
+            recount(Post.objects.filter(pk__gte=posts[0].pk, pk__lte=posts[-1].pk))
+        # bulk_create sends no post_save, index the batch here
+        search_backend().index(Post, [post.pk for post in posts])
+        search_backend().index(Comment, [comment.pk for comment in comments])
+
+        for i, created in enumerate((users, posts, comments)):
+            totals[i] += len(created)
+        elapsed = time.monotonic() - started
+        report(f'users {batch_start}-{batch_stop - 1}: {sum(totals)} rows, {sum(totals) / elapsed:.0f} rows/sec')
+    return totals
+
+
 class Command(BaseCommand):
     help = 'Generate fake data for the Author, Post, and Comment models'
 
@@ -13,9 +83,20 @@ class Command(BaseCommand):
         parser.add_argument('--users', type=int, default=10, help='Number of users to create')
         parser.add_argument('--posts', type=int, default=5, help='Number of posts for each user')
         parser.add_argument('--comments', type=int, default=3, help='Number of comments for each post')
+        parser.add_argument('--seed', type=int, help='Seed Faker to generate the same data on every run')
+        parser.add_argument('--bulk', action='store_true',
+                            help='Insert rows with bulk_create and a single password hash, for load tests')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users (and rows per INSERT) per batch')
+        parser.add_argument('--workers', type=int, default=1, help='Processes sharing the users in --bulk mode')
+        parser.add_argument('--password', default='password', help='Password of every user in --bulk mode')
 
     def handle(self, *args, **options):
+        if options['bulk']:
+            return self.handle_bulk(**options)
+
         fake = Faker()
+        if options['seed'] is not None:
+            fake.seed_instance(options['seed'])
         users_count = options['users']
         posts_per_user = options['posts']
         comments_per_post = options['comments']
@@ -51,7 +132,31 @@ class Command(BaseCommand):
                         is_published=True,
                         published_date=timezone.now(),
                     )
+                recount(Post.objects.filter(pk=post.pk))
 
         self.stdout.write(self.style.SUCCESS(f'Successfully generated {users_count} users, '
                                              f'{users_count * posts_per_user} posts, '
                                              f'and {users_count * posts_per_user * comments_per_post} comments'))
+
+    def handle_bulk(self, users, posts, comments, seed, batch_size, workers, password, **options):
+        password_hash = make_password(password)
+        started = time.monotonic()
+        args = (posts, comments, batch_size, seed, password_hash)
+        if workers > 1 and users:
+            # Each worker gets a contiguous range of user numbers aligned on batches
+            per_worker = -(-users // workers // batch_size) * batch_size
+            ranges = [(start, min(start + per_worker, users)) for start in range(0, users, per_worker)]
+            connections.close_all()
+            totals = [0, 0, 0]
+            with ProcessPoolExecutor(len(ranges), mp_context=multiprocessing.get_context('fork')) as pool:
+                futures = [pool.submit(bulk_generate, start, stop, *args) for start, stop in ranges]
+                for future in as_completed(futures):
+                    totals = [total + created for total, created in zip(totals, future.result())]
+        else:
+            totals = bulk_generate(0, users, *args, report=self.stdout.write)
+
+        bump_scopes([list_scope(), count_scope(Post), count_scope(Comment)])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Successfully generated {totals[0]} users, {totals[1]} posts, '
+                                             f'and {totals[2]} comments in {elapsed:.1f}s '
+                                             f'({sum(totals) / elapsed:.0f} rows/sec)'))
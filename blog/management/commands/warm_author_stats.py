@@ -0,0 +1,27 @@
+from blog.models import Author
+from blog.stats import refresh_stats
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Build the cached post and comment stats of every author'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of authors computed per query')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = 0
+        authors = 0
+        changed = 0
+        while True:
+            batch = list(Author.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                break
+            changed += refresh_stats(batch)
+            authors += len(batch)
+            last_pk = batch[-1]
+            self.stdout.write(f'{authors} authors warmed')
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully warmed the stats of {authors} authors, {changed} changed'))
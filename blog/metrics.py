@@ -0,0 +1,184 @@
+import functools
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+METRIC_KEY_PREFIX = 'blog:metrics:'
+# The series index: a counter of slots, the series name of every slot, and a marker per indexed series
+SERIES_COUNT_KEY = 'blog:metrics-series'
+SERIES_SLOT_PREFIX = 'blog:metrics-series:slot:'
+SERIES_MARKER_PREFIX = 'blog:metrics-series:name:'
+
+# Upper bounds, in seconds, of the histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# name: (type, help) of every metric family, in exposition order
+METRICS = {
+    'blog_request_duration_seconds': ('histogram', 'Wall time of sampled requests.'),
+    'blog_request_sql_queries_total': ('counter', 'SQL queries run by sampled requests.'),
+    'blog_request_sql_seconds_total': ('counter', 'Time spent in SQL queries by sampled requests.'),
+    'blog_request_cache_hits_total': ('counter', 'Cache reads finding their key in sampled requests.'),
+    'blog_request_cache_misses_total': ('counter', 'Cache reads missing their key in sampled requests.'),
+    'blog_request_template_seconds_total': ('counter', 'Template render time of sampled requests.'),
+    'blog_task_queue_seconds': ('histogram', 'Time tasks waited between publishing (or their eta) and starting.'),
+    'blog_task_run_seconds': ('histogram', 'Run time of tasks.'),
+    'blog_task_email_seconds': ('histogram', 'Time tasks spent sending a batch of emails.'),
+    'blog_tasks_total': ('counter', 'Finished tasks by state.'),
+    'blog_task_failures_total': ('counter', 'Task failures by exception type.'),
+    'blog_rate_limited_total': ('counter', 'Requests refused by a rate limit.'),
+}
+
+
+def flush_interval():
+    return getattr(settings, 'BLOG_METRICS_FLUSH_INTERVAL', 10)
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+@functools.lru_cache(maxsize=4096)
+def series_name(name, labels):
+    """Name of the series of metric name with labels, a tuple of (label, value) pairs."""
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{label}="{escape(value)}"' for label, value in labels) + '}'
+
+
+@functools.lru_cache(maxsize=1024)
+def histogram_series(name, labels):
+    """Bucket series, with their upper bounds, then the count and sum series of a histogram."""
+    buckets = tuple((series_name(name + '_bucket', labels + (('le', bound),)), bound) for bound in DURATION_BUCKETS)
+    buckets += ((series_name(name + '_bucket', labels + (('le', '+Inf'),)), float('inf')),)
+    return buckets, series_name(name + '_count', labels), series_name(name + '_sum', labels)
+
+
+def family(series):
+    name = series.split('{', 1)[0]
+    for suffix in ('_bucket', '_count', '_sum'):
+        if name.endswith(suffix) and METRICS.get(name[:-len(suffix)], ('',))[0] == 'histogram':
+            return name[:-len(suffix)]
+    return name
+
+
+def stored_in_microseconds(series):
+    name = series.split('{', 1)[0]
+    return name.endswith('_seconds_total') or name.endswith('_seconds_sum')
+
+
+class Metrics:
+    """Counters and histograms shared by every web and worker process through the cache.
+
+    Observations are added up in process and written with cache.incr() at most
+    every BLOG_METRICS_FLUSH_INTERVAL seconds, times as integer microseconds.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.indexed = set()
+        self.flushed_at = time.monotonic()
+
+    def inc(self, name, value=1, **labels):
+        series = series_name(name, tuple(labels.items()))
+        with self.lock:
+            self.pending[series] = self.pending.get(series, 0) + value
+
+    def add_seconds(self, name, seconds, **labels):
+        self.inc(name, round(seconds * 1_000_000), **labels)
+
+    def observe(self, name, seconds, **labels):
+        """Histogram observation of a duration in seconds."""
+        buckets, count, total = histogram_series(name, tuple(labels.items()))
+        with self.lock:
+            pending = self.pending
+            # every bucket is written, so they are indexed in order
+            for series, bound in buckets:
+                pending[series] = pending.get(series, 0) + (seconds <= bound)
+            pending[count] = pending.get(count, 0) + 1
+            pending[total] = pending.get(total, 0) + round(seconds * 1_000_000)
+
+    def flush_due(self):
+        return time.monotonic() - self.flushed_at >= flush_interval()
+
+    def maybe_flush(self):
+        if self.flush_due():
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushed_at = time.monotonic()
+        for series, value in pending.items():
+            if not value and series in self.indexed:
+                continue
+            key = METRIC_KEY_PREFIX + series
+            try:
+                cache.incr(key, value)
+            except ValueError:
+                if not cache.add(key, value, None):
+                    cache.incr(key, value)
+        new = [series for series in pending if series not in self.indexed]
+        if new:
+            self.index(new)
+
+    def index(self, new):
+        """Add the series of new to the shared index, unless another process already did.
+
+        Only atomic cache operations are used: every series gets its own slot
+        from cache.incr(), then its marker is added. Two processes indexing the
+        same series at once both get a slot, render() skips the duplicate.
+        """
+        markers = cache.get_many([SERIES_MARKER_PREFIX + series for series in new])
+        for series in new:
+            if SERIES_MARKER_PREFIX + series not in markers:
+                try:
+                    slot = cache.incr(SERIES_COUNT_KEY)
+                except ValueError:
+                    cache.add(SERIES_COUNT_KEY, 0, None)
+                    slot = cache.incr(SERIES_COUNT_KEY)
+                cache.set(SERIES_SLOT_PREFIX + str(slot), series, None)
+                cache.add(SERIES_MARKER_PREFIX + series, slot, None)
+        self.indexed.update(new)
+
+    def series(self):
+        """Every indexed series, in indexing order."""
+        count = cache.get(SERIES_COUNT_KEY) or 0
+        slots = cache.get_many([SERIES_SLOT_PREFIX + str(slot) for slot in range(1, count + 1)])
+        return list(dict.fromkeys(slots[SERIES_SLOT_PREFIX + str(slot)] for slot in range(1, count + 1)
+                                  if SERIES_SLOT_PREFIX + str(slot) in slots))
+
+    def clear(self):
+        """Forget every series, in process and in the cache."""
+        with self.lock:
+            self.pending = {}
+            self.indexed = set()
+        index = self.series()
+        count = cache.get(SERIES_COUNT_KEY) or 0
+        cache.delete_many([METRIC_KEY_PREFIX + series for series in index]
+                          + [SERIES_MARKER_PREFIX + series for series in index]
+                          + [SERIES_SLOT_PREFIX + str(slot) for slot in range(1, count + 1)] + [SERIES_COUNT_KEY])
+
+    def render(self):
+        """Prometheus text exposition of every series."""
+        self.flush()
+        index = self.series()
+        values = cache.get_many([METRIC_KEY_PREFIX + series for series in index])
+        families = {}
+        for series in index:
+            value = values.get(METRIC_KEY_PREFIX + series)
+            if value is not None:
+                families.setdefault(family(series), []).append((series, value))
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            if name not in families:
+                continue
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+            for series, value in families[name]:
+                lines.append(f'{series} {value / 1_000_000 if stored_in_microseconds(series) else value}')
+        return ''.join(line + '\n' for line in lines)
+
+
+metrics = Metrics()
@@ -0,0 +1,92 @@
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+from .dispatch import TaskBatch, task_batch
+from .instrumentation import RequestStats, request_stats
+from .metrics import metrics
+
+
+def sample_rate():
+    return getattr(settings, 'BLOG_METRICS_SAMPLE_RATE', 0.1)
+
+
+def record(request, response, stats, duration):
+    match = request.resolver_match
+    view = match.view_name if match else 'unresolved'
+    metrics.observe('blog_request_duration_seconds', duration, view=view)
+    metrics.inc('blog_request_sql_queries_total', stats.sql_count, view=view)
+    metrics.add_seconds('blog_request_sql_seconds_total', stats.sql_time, view=view)
+    metrics.inc('blog_request_cache_hits_total', stats.cache_hits, view=view)
+    metrics.inc('blog_request_cache_misses_total', stats.cache_misses, view=view)
+    metrics.add_seconds('blog_request_template_seconds_total', stats.template_time, view=view)
+    response['Server-Timing'] = stats.server_timing(duration)
+
+
+@sync_and_async_middleware
+def performance_middleware(get_response):
+    """Record wall, SQL, cache and template time of a BLOG_METRICS_SAMPLE_RATE share of requests per view.
+
+    Other requests only pay for a random number; the aggregates are served by
+    the metrics view and every sampled response gets a Server-Timing header.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if random.random() >= sample_rate():
+                return await get_response(request)
+            stats = RequestStats()
+            token = request_stats.set(stats)
+            started = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                request_stats.reset(token)
+            record(request, response, stats, time.perf_counter() - started)
+            if metrics.flush_due():
+                await sync_to_async(metrics.flush)()
+            return response
+    else:
+        def middleware(request):
+            if random.random() >= sample_rate():
+                return get_response(request)
+            stats = RequestStats()
+            token = request_stats.set(stats)
+            started = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                request_stats.reset(token)
+            record(request, response, stats, time.perf_counter() - started)
+            metrics.maybe_flush()
+            return response
+    return middleware
+
+
+@sync_and_async_middleware
+def dispatch_middleware(get_response):
+    """Publish the tasks dispatched by a request together, once its view has returned."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            batch = TaskBatch()
+            token = task_batch.set(batch)
+            try:
+                response = await get_response(request)
+            finally:
+                task_batch.reset(token)
+            await sync_to_async(batch.close)()
+            return response
+    else:
+        def middleware(request):
+            batch = TaskBatch()
+            token = task_batch.set(batch)
+            try:
+                response = get_response(request)
+            finally:
+                task_batch.reset(token)
+            batch.close()
+            return response
+    return middleware
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.7 on 2026-10-18 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_alter_post_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['post', '-published_date', '-id'], name='comment_post_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-published_date', '-id'], name='post_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['owner', '-published_date', '-id'], name='post_owner_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_published', False)), fields=['owner', '-published_date', '-id'], name='post_owner_draft_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.1.7 on 2026-10-18 17:36
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+GIN_INDEXES = [
+    ('post_search_idx', 'blog_post'),
+    ('comment_search_idx', 'blog_comment'),
+]
+
+
+def create_gin_indexes(apps, schema_editor):
+    # tsvector and GIN only exist on Postgres, other databases use the in-memory search index
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table in GIN_INDEXES:
+        schema_editor.execute(f'CREATE INDEX {name} ON {table} USING gin (search_vector)')
+
+
+def drop_gin_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in GIN_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_pendingnotification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_gin_indexes, drop_gin_indexes),
+    ]
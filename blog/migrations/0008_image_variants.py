@@ -0,0 +1,23 @@
+# Generated by Django 4.1.7 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='profile_photo_variants',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
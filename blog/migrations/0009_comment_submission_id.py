@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='submission_id',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True, unique=True),
+        ),
+    ]
@@ -1,20 +1,22 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
-from storages.backends.s3boto3 import S3Boto3Storage
+from .storage import MediaStorage
 
 
-class PostImagesStorage(S3Boto3Storage):
+class PostImagesStorage(MediaStorage):
     location = 'post_images'
 
 
-class UserPhotoStorage(S3Boto3Storage):
+class UserPhotoStorage(MediaStorage):
     location = 'user_photo'
 
 
 class Author(AbstractUser):
     profile_photo = models.ImageField(blank=True, verbose_name='Photo', storage=UserPhotoStorage(),
                                       upload_to='user_photo/')
+    profile_photo_variants = models.JSONField(default=list, blank=True, editable=False)
     email = models.EmailField(unique=True)
     is_staff = models.BooleanField(default=False)
     bio = models.TextField(max_length=1200, verbose_name='Bio', blank=True)
@@ -31,8 +33,22 @@ class Post(models.Model):
     short_description = models.CharField(max_length=255)
     full_description = models.TextField()
     image = models.ImageField(upload_to='post_images/', storage=PostImagesStorage(), blank=True)
+    image_variants = models.JSONField(default=list, blank=True, editable=False)
     is_published = models.BooleanField(default=False)
     published_date = models.DateTimeField(auto_now_add=True)
+    published_comment_count = models.PositiveIntegerField(default=0, editable=False)
+    last_comment_at = models.DateTimeField(null=True, blank=True, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-published_date', '-id'], condition=models.Q(is_published=True),
+                         name='post_published_idx'),
+            models.Index(fields=['owner', '-published_date', '-id'], condition=models.Q(is_published=True),
+                         name='post_owner_published_idx'),
+            models.Index(fields=['owner', '-published_date', '-id'], condition=models.Q(is_published=False),
+                         name='post_owner_draft_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -44,6 +60,33 @@ class Comment(models.Model):
     text = models.TextField()
     is_published = models.BooleanField(default=False)
     published_date = models.DateTimeField(auto_now_add=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Id of the queued submission the comment was ingested from, redeliveries are not inserted twice
+    submission_id = models.CharField(max_length=32, null=True, blank=True, unique=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', '-published_date', '-id'], condition=models.Q(is_published=True),
+                         name='comment_post_published_idx'),
+        ]
 
     def __str__(self):
         return f"{self.author}"
+
+
+class PendingNotification(models.Model):
+    """Email waiting to be sent as part of a digest to its recipient."""
+    kind = models.CharField(max_length=32)
+    recipient = models.EmailField()
+    from_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'recipient', 'created_at'], name='pending_notification_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} to {self.recipient}'
@@ -0,0 +1,73 @@
+import datetime
+import itertools
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .instrumentation import timed_email
+from .models import PendingNotification
+
+DIGEST_SEPARATOR = '\n\n' + '-' * 40 + '\n\n'
+
+
+def digest_window(kind):
+    return getattr(settings, 'BLOG_NOTIFICATION_DIGEST_WINDOWS', {}).get(kind, 0)
+
+
+def deliver(kind, emails):
+    """Send emails, EmailMessage instances, or buffer them for the digest of their recipients.
+
+    Kinds without a digest window in BLOG_NOTIFICATION_DIGEST_WINDOWS are sent
+    right away, over a single connection.
+    """
+    if not emails:
+        return
+    if not digest_window(kind):
+        with timed_email(), get_connection() as connection:
+            connection.send_messages(emails)
+        return
+    PendingNotification.objects.bulk_create(
+        PendingNotification(kind=kind, recipient=recipient, from_email=email.from_email, subject=email.subject,
+                            body=email.body)
+        for email in emails for recipient in email.to
+    )
+
+
+def digest_email(recipient, notifications):
+    if len(notifications) == 1:
+        notification = notifications[0]
+        return EmailMessage(notification.subject, notification.body, notification.from_email, [recipient])
+    subject = f'{len(notifications)} new notifications'
+    body = DIGEST_SEPARATOR.join(f'{notification.subject}\n\n{notification.body}' for notification in notifications)
+    return EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [recipient])
+
+
+def flush_digests(now=None):
+    """Send one email per recipient whose oldest buffered notification has waited a full window.
+
+    Everything buffered for such a recipient goes into the digest. Rows are locked
+    (skipping rows another flush holds) and deleted in the transaction that sends
+    them, so a failed send leaves them for the next flush.
+    """
+    now = now or timezone.now()
+    due = PendingNotification.objects.none()
+    for kind, window in getattr(settings, 'BLOG_NOTIFICATION_DIGEST_WINDOWS', {}).items():
+        recipients = (PendingNotification.objects.filter(kind=kind).values('recipient')
+                      .annotate(oldest=Min('created_at')).filter(oldest__lte=now - datetime.timedelta(seconds=window))
+                      .values('recipient'))
+        due |= PendingNotification.objects.filter(recipient__in=recipients)
+
+    with transaction.atomic():
+        pending = list(due.select_for_update(skip_locked=True).order_by('recipient', 'pk'))
+        emails = [
+            digest_email(recipient, list(notifications))
+            for recipient, notifications in itertools.groupby(pending, key=lambda notification: notification.recipient)
+        ]
+        if emails:
+            with timed_email(), get_connection() as connection:
+                connection.send_messages(emails)
+            PendingNotification.objects.filter(pk__in=[notification.pk for notification in pending]).delete()
+    return len(emails)
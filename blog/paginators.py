@@ -0,0 +1,185 @@
+import base64
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from .cache import ascope_versions, count_scope, scope_versions
+
+
+def count_timeout():
+    return getattr(settings, 'BLOG_PAGINATION_COUNT_TIMEOUT', 60)
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator that keeps COUNT(*) in the cache instead of running it on every request.
+
+    Cached counts are dropped whenever a row of the model is written, and expire
+    after BLOG_PAGINATION_COUNT_TIMEOUT seconds in any case.
+    """
+
+    def count_key(self, version):
+        return 'blog:count:' + hashlib.md5(f'{version}|{self.object_list.query}'.encode()).hexdigest()
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        version = scope_versions([count_scope(self.object_list.model)])[0]
+        return cache.get_or_set(self.count_key(version), lambda: Paginator.count.func(self), count_timeout())
+
+    async def acount(self):
+        """count, with the async cache and ORM, for use in async views before any page is built."""
+        if 'count' not in self.__dict__ and hasattr(self.object_list, 'query'):
+            version = (await ascope_versions([count_scope(self.object_list.model)]))[0]
+            key = self.count_key(version)
+            count = await cache.aget(key)
+            if count is None:
+                count = await self.object_list.acount()
+                await cache.aset(key, count, count_timeout())
+            self.__dict__['count'] = count
+        return self.count
+
+
+class CursorPage:
+    """Page of a keyset pagination, compatible with the parts of Page used in templates."""
+
+    def __init__(self, object_list, number, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Cursor page %s>' % self.number
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+class CursorPaginator(CachedCountPaginator):
+    """Keyset paginator ordered by (published_date, id), newest first.
+
+    Pages are addressed by opaque cursor tokens instead of offsets, so fetching a
+    deep page costs the same as fetching the first one and no COUNT(*) is needed.
+    count/num_pages/page_range are still available through the cached count.
+    """
+
+    def __init__(self, object_list, per_page, **kwargs):
+        super().__init__(object_list.order_by('-published_date', '-id'), per_page, **kwargs)
+
+    @staticmethod
+    def encode_cursor(obj, number, reverse=False):
+        data = {'d': obj.published_date.isoformat(), 'i': obj.pk, 'n': number, 'r': reverse}
+        return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            published_date = parse_datetime(data['d'])
+            if published_date is None:
+                return None
+            return published_date, int(data['i']), int(data['n']), bool(data['r'])
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return None
+
+    def keyset(self, cursor):
+        """Decoded position of cursor and the queryset of the rows after it, one more than a page."""
+        position = self.decode_cursor(cursor) if cursor else None
+        queryset = self.object_list
+        if position:
+            published_date, pk, _, reverse = position
+            if reverse:
+                keyset = Q(published_date__gt=published_date) | Q(published_date=published_date, pk__gt=pk)
+                queryset = queryset.filter(keyset).order_by('published_date', 'id')
+            else:
+                keyset = Q(published_date__lt=published_date) | Q(published_date=published_date, pk__lt=pk)
+                queryset = queryset.filter(keyset)
+        return position, queryset[:self.per_page + 1]
+
+    def build_page(self, position, rows):
+        number, reverse = (position[2], position[3]) if position else (1, False)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+            if not has_more:
+                number = 1
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or reverse:
+                next_cursor = self.encode_cursor(rows[-1], number + 1)
+            if (has_more and reverse) or (position and not reverse):
+                previous_cursor = self.encode_cursor(rows[0], number - 1, reverse=True)
+        return CursorPage(rows, max(number, 1), self, next_cursor, previous_cursor)
+
+    def page(self, cursor=None):
+        position, queryset = self.keyset(cursor)
+        return self.build_page(position, list(queryset))
+
+    async def apage(self, cursor=None):
+        position, queryset = self.keyset(cursor)
+        return self.build_page(position, [row async for row in queryset])
+
+    def get_page(self, cursor=None):
+        return self.page(cursor)
+
+
+def paginate(request, queryset, per_page, page_kwarg='page', cursor_query_param='cursor'):
+    """Return a page of queryset for request.
+
+    Keyset pagination is opt-in through BLOG_CURSOR_PAGINATION; when it is on, the
+    ?page= links built from page_range still work through the cached-count paginator.
+    """
+    if getattr(settings, 'BLOG_CURSOR_PAGINATION', False) and page_kwarg not in request.GET:
+        return CursorPaginator(queryset, per_page).page(request.GET.get(cursor_query_param))
+    return CachedCountPaginator(queryset, per_page).get_page(request.GET.get(page_kwarg))
+
+
+async def apaginate(request, queryset, per_page, page_kwarg='page', cursor_query_param='cursor'):
+    """paginate() for async views, the rows of the page are loaded with the async ORM."""
+    if getattr(settings, 'BLOG_CURSOR_PAGINATION', False) and page_kwarg not in request.GET:
+        return await CursorPaginator(queryset, per_page).apage(request.GET.get(cursor_query_param))
+    paginator = CachedCountPaginator(queryset, per_page)
+    await paginator.acount()
+    page = paginator.get_page(request.GET.get(page_kwarg))
+    page.object_list = [row async for row in page.object_list]
+    return page
+
+
+class CursorPaginationMixin:
+    """ListView mixin paginating through paginate() instead of the default Paginator."""
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        page = paginate(self.request, queryset, page_size, self.page_kwarg, self.cursor_query_param)
+        return page.paginator, page, page.object_list, page.has_other_pages()
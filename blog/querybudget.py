@@ -0,0 +1,52 @@
+import functools
+import json
+import os
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryBudget(CaptureQueriesContext):
+    """Context manager failing when more than max_queries queries run inside it.
+
+    Every measurement is appended as a JSON line to the file named by the
+    QUERY_BUDGET_REPORT environment variable, so CI can keep the counts.
+    """
+
+    def __init__(self, max_queries, label=None, using='default'):
+        super().__init__(connections[using])
+        self.max_queries = max_queries
+        self.label = label
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+        self.record()
+        if len(self) > self.max_queries:
+            queries = '\n'.join(f'{i}. {query["sql"]}' for i, query in enumerate(self.captured_queries, start=1))
+            raise QueryBudgetExceeded(
+                f'{self.label or "block"} ran {len(self)} queries, budget is {self.max_queries}:\n{queries}'
+            )
+
+    def record(self):
+        path = os.environ.get('QUERY_BUDGET_REPORT')
+        if not path:
+            return
+        with open(path, 'a') as report:
+            report.write(json.dumps({'label': self.label, 'queries': len(self), 'budget': self.max_queries}) + '\n')
+
+
+def query_budget(max_queries, label=None, using='default'):
+    """Decorator form of QueryBudget, for test methods or any other callable."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with QueryBudget(max_queries, label or func.__qualname__, using):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,157 @@
+import functools
+import math
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from django.http import HttpResponse
+
+import redis
+
+from .metrics import metrics
+
+try:
+    from django_redis import get_redis_connection
+    from django_redis.cache import RedisCache as DjangoRedisCache
+except ImportError:
+    DjangoRedisCache = None
+
+KEY_PREFIX = 'blog:ratelimit:'
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+RATE_RE = re.compile(r'^(\d+)/(\d*)([smhd])$')
+
+# name: rates of the client IP and of the logged in user, for every rate limited view
+DEFAULT_RATE_LIMITS = {
+    'comment': {'ip': '10/m', 'user': '10/m'},
+    'contact': {'ip': '5/h', 'user': '5/h'},
+    'upload': {'ip': '30/h', 'user': '60/h'},
+}
+
+
+def rate_limits():
+    return getattr(settings, 'BLOG_RATE_LIMITS', DEFAULT_RATE_LIMITS)
+
+
+def client_ip(request):
+    return request.META.get(getattr(settings, 'BLOG_RATE_LIMIT_IP_META', 'REMOTE_ADDR'), '')
+
+
+@functools.lru_cache(maxsize=64)
+def parse_rate(rate):
+    """(requests, period in seconds) of a rate such as '10/m' or '100/5m'."""
+    match = RATE_RE.match(rate)
+    if match is None:
+        raise ValueError(f'Invalid rate {rate!r}, expected requests/period such as 10/m')
+    requests, multiplier, unit = match.groups()
+    return int(requests), int(multiplier or 1) * PERIODS[unit]
+
+
+_clients = {}
+
+
+def redis_client(alias='default'):
+    """Client of the Redis server the cache alias writes to, None when the cache is not on Redis.
+
+    django-redis hands out its own connection, Django's RedisCache has no public
+    one, so a client is made from the first server of its LOCATION and OPTIONS.
+    """
+    cache = caches[alias]
+    if DjangoRedisCache is not None and isinstance(cache, DjangoRedisCache):
+        return get_redis_connection(alias)
+    if not isinstance(cache, RedisCache):
+        return None
+    config = settings.CACHES[alias]
+    location = config['LOCATION']
+    servers = re.split('[;,]', location) if isinstance(location, str) else location
+    if servers[0] not in _clients:
+        options = {name: value for name, value in config.get('OPTIONS', {}).items()
+                   if name not in ('parser_class', 'pool_class', 'serializer')}
+        _clients[servers[0]] = redis.Redis.from_url(servers[0], **options)
+    return _clients[servers[0]]
+
+
+def increment(windows):
+    """Count a request in windows, (current key, previous key, timeout) triples.
+
+    Returns the (current, previous) count of every window. On Redis all of them
+    take one MULTI/EXEC round trip, other caches increment under their own lock.
+    """
+    cache = caches['default']
+    client = redis_client()
+    if client is not None:
+        keys = [(cache.make_and_validate_key(current), cache.make_and_validate_key(previous), timeout)
+                for current, previous, timeout in windows]
+        with client.pipeline() as pipe:
+            for current, previous, timeout in keys:
+                pipe.incr(current)
+                pipe.expire(current, timeout)
+                pipe.get(previous)
+            results = pipe.execute()
+        return [(results[i], int(results[i + 2] or 0)) for i in range(0, len(results), 3)]
+    counts = []
+    for current, previous, timeout in windows:
+        try:
+            count = cache.incr(current)
+        except ValueError:
+            # first request of the period, unless a concurrent one just added it
+            count = 1 if cache.add(current, 1, timeout) else cache.incr(current)
+        counts.append((count, cache.get(previous, 0)))
+    return counts
+
+
+def hit(limits, now=None):
+    """Count a request against limits, (key, requests, period) triples, with sliding windows.
+
+    The window of a limit is estimated from the counts of the current and the
+    previous fixed period, the latter weighted by how much of it still overlaps
+    the window. Refused requests count too, so a client that keeps trying stays
+    refused. Returns the seconds to wait when a limit is exceeded, else 0.
+    """
+    now = time.time() if now is None else now
+    windows = []
+    for key, _, period in limits:
+        number = int(now // period)
+        windows.append((f'{KEY_PREFIX}{key}:{number}', f'{KEY_PREFIX}{key}:{number - 1}', 2 * period))
+    wait = 0
+    for (_, requests, period), (current, previous) in zip(limits, increment(windows)):
+        elapsed = now % period
+        if previous * (1 - elapsed / period) + current > requests:
+            wait = max(wait, math.ceil(period - elapsed))
+    return wait
+
+
+def request_limits(request, name):
+    """(key, requests, period) of every BLOG_RATE_LIMITS[name] rate applying to request."""
+    rates = rate_limits().get(name) or {}
+    limits = []
+    if rates.get('ip'):
+        limits.append((f'{name}:ip:{client_ip(request)}', *parse_rate(rates['ip'])))
+    if rates.get('user') and request.user.is_authenticated:
+        limits.append((f'{name}:user:{request.user.pk}', *parse_rate(rates['user'])))
+    return limits
+
+
+def rate_limit(name, methods=('POST',)):
+    """Limit the methods requests of a view to the BLOG_RATE_LIMITS[name] rates.
+
+    Every client IP and every logged in user has its own sliding window,
+    requests over a rate get a 429 with a Retry-After header.
+    """
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method in methods:
+                limits = request_limits(request, name)
+                wait = hit(limits) if limits else 0
+                if wait:
+                    metrics.inc('blog_rate_limited_total', view=name)
+                    response = HttpResponse('Too many requests, please try again later.', status=429)
+                    response['Retry-After'] = str(wait)
+                    return response
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,151 @@
+import functools
+import operator
+import re
+import threading
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import Case, F, FloatField, Value, When
+
+from .models import Comment, Post
+
+SEARCH_CONFIG = 'english'
+
+# Searched fields with their weight, highest first
+SEARCH_FIELDS = {
+    Post: (('title', 'A'), ('short_description', 'B'), ('full_description', 'C')),
+    Comment: (('author', 'A'), ('text', 'B')),
+}
+
+# Same defaults as Postgres ts_rank
+WEIGHT_SCORES = {'A': 1.0, 'B': 0.4, 'C': 0.2, 'D': 0.1}
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class PostgresSearchBackend:
+    """Full-text search on the search_vector columns, GIN indexed by migration 0007."""
+
+    def vector(self, model):
+        vectors = (SearchVector(field, weight=weight, config=SEARCH_CONFIG) for field, weight in SEARCH_FIELDS[model])
+        return functools.reduce(operator.add, vectors)
+
+    def index(self, model, pks):
+        model.objects.filter(pk__in=pks).update(search_vector=self.vector(model))
+
+    def index_all(self, model, batch_size):
+        last_pk = 0
+        while True:
+            batch = list(model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                return
+            model.objects.filter(pk__gt=last_pk, pk__lte=batch[-1]).update(search_vector=self.vector(model))
+            last_pk = batch[-1]
+
+    def remove(self, model, pks):
+        pass
+
+    def query(self, text):
+        return SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+
+    def matching(self, queryset, text):
+        return queryset.filter(search_vector=self.query(text))
+
+    def search(self, queryset, text):
+        query = self.query(text)
+        return (queryset.filter(search_vector=query).annotate(rank=SearchRank(F('search_vector'), query))
+                .order_by('-rank', '-pk'))
+
+
+class InvertedIndexSearchBackend:
+    """Pure-Python inverted index for databases without full-text search (SQLite in tests).
+
+    The index lives in process memory and is built from the database on first
+    use, so it only sees writes made by this process after that.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.postings = {}
+        self.documents = {}
+
+    def reset(self):
+        with self.lock:
+            self.postings = {}
+            self.documents = {}
+
+    def add(self, model, rows):
+        postings = self.postings[model]
+        documents = self.documents[model]
+        for pk, *values in rows:
+            self.discard(model, pk)
+            scores = {}
+            for (_, weight), value in zip(SEARCH_FIELDS[model], values):
+                for term in tokenize(value or ''):
+                    scores[term] = scores.get(term, 0) + WEIGHT_SCORES[weight]
+            for term, score in scores.items():
+                postings.setdefault(term, {})[pk] = score
+            documents[pk] = list(scores)
+
+    def discard(self, model, pk):
+        for term in self.documents[model].pop(pk, ()):
+            self.postings[model][term].pop(pk, None)
+
+    def rows(self, model, queryset):
+        return queryset.values_list('pk', *(field for field, _ in SEARCH_FIELDS[model]))
+
+    def ensure_built(self, model):
+        if model not in self.postings:
+            self.postings[model] = {}
+            self.documents[model] = {}
+            self.add(model, self.rows(model, model.objects.all()).iterator())
+
+    def index(self, model, pks):
+        with self.lock:
+            if model in self.postings:
+                self.add(model, self.rows(model, model.objects.filter(pk__in=pks)))
+
+    def index_all(self, model, batch_size):
+        with self.lock:
+            self.postings.pop(model, None)
+            self.ensure_built(model)
+
+    def remove(self, model, pks):
+        with self.lock:
+            if model in self.postings:
+                for pk in pks:
+                    self.discard(model, pk)
+
+    def scores(self, model, text):
+        """Score of every document containing all the terms of text."""
+        with self.lock:
+            self.ensure_built(model)
+            postings = [self.postings[model].get(term, {}) for term in tokenize(text)]
+        if not postings:
+            return {}
+        matches = set(postings[0]).intersection(*postings[1:])
+        return {pk: sum(posting[pk] for posting in postings) for pk in matches}
+
+    def matching(self, queryset, text):
+        return queryset.filter(pk__in=list(self.scores(queryset.model, text)))
+
+    def search(self, queryset, text):
+        scores = self.scores(queryset.model, text)
+        rank = Case(*(When(pk=pk, then=Value(score)) for pk, score in scores.items()),
+                    default=Value(0.0), output_field=FloatField())
+        return queryset.filter(pk__in=list(scores)).annotate(rank=rank).order_by('-rank', '-pk')
+
+
+_backends = {}
+
+
+def search_backend():
+    """Backend for the default database, Postgres full-text search or the in-memory index."""
+    vendor = connection.vendor
+    if vendor not in _backends:
+        _backends[vendor] = PostgresSearchBackend() if vendor == 'postgresql' else InvertedIndexSearchBackend()
+    return _backends[vendor]
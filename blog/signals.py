@@ -0,0 +1,85 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import author_scope, bump_scopes, comment_scopes, post_scopes
+from .counters import recount
+from .dispatch import dispatch
+from .images import IMAGE_FIELDS, IMAGE_KINDS
+from .models import Author, Comment, Post
+from .search import search_backend
+from .tasks import generate_image_variants, refresh_author_stats
+
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_post_pages(sender, instance, **kwargs):
+    bump_scopes(post_scopes(instance))
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def invalidate_comment_pages(sender, instance, **kwargs):
+    bump_scopes(comment_scopes(instance))
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_deleted_comment(sender, instance, origin=None, **kwargs):
+    # comments deleted along with their post (or its author) leave no counter behind
+    deleted_with_post = isinstance(origin, (Post, Author)) or getattr(origin, 'model', None) in (Post, Author)
+    if instance.is_published and not deleted_with_post:
+        recount(Post.objects.filter(pk=instance.post_id))
+
+
+@receiver(post_save, sender=Author)
+def invalidate_author_pages(sender, instance, update_fields=None, **kwargs):
+    # logins only touch last_login, which no page shows
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        bump_scopes([author_scope(instance.username)])
+
+
+@receiver([post_save, post_delete], sender=Post)
+def refresh_owner_stats(sender, instance, **kwargs):
+    dispatch(refresh_author_stats, [instance.owner_id])
+
+
+@receiver(post_save, sender=Comment)
+def refresh_stats_of_commented_owner(sender, instance, created, **kwargs):
+    # new comments await moderation, they are only received once published
+    if instance.is_published or not created:
+        dispatch(refresh_author_stats, [], [instance.post_id])
+
+
+@receiver(post_delete, sender=Comment)
+def refresh_stats_of_uncommented_owner(sender, instance, **kwargs):
+    # once committed, so after uncount_deleted_comment() fixed the post's counter
+    if instance.is_published:
+        dispatch(refresh_author_stats, [], [instance.post_id])
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+def update_search_index(sender, instance, **kwargs):
+    search_backend().index(sender, [instance.pk])
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Comment)
+def remove_from_search_index(sender, instance, **kwargs):
+    search_backend().remove(sender, [instance.pk])
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Author)
+def reset_image_variants(sender, instance, **kwargs):
+    _, field, variants_field, _ = IMAGE_FIELDS[IMAGE_KINDS[sender]]
+    file = getattr(instance, field)
+    uploaded = bool(file) and (not file._committed or instance.__dict__.get('_image_uploaded', False))
+    if not file or uploaded:
+        # variants of a removed or replaced image must not be served
+        setattr(instance, variants_field, [])
+    instance._image_uploaded = uploaded
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Author)
+def process_uploaded_image(sender, instance, **kwargs):
+    if instance.__dict__.pop('_image_uploaded', False):
+        dispatch(generate_image_variants, IMAGE_KINDS[sender], instance.pk)
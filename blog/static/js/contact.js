@@ -38,6 +38,12 @@
                 $("#contactModal .modal-content").html(data.html_form);
               }
             },
+            error: function(xhr) {
+              if (xhr.status === 429) {
+                $("#contactModal .modal-content").html("<p>Too many messages, please try again later.</p>");
+              }
+              btn.prop('disabled', false);
+            },
         });
         return false;
     };
@@ -0,0 +1,71 @@
+from asgiref.sync import sync_to_async
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Q, Sum
+
+from .cache import author_scope, bump_scopes
+from .models import Author, Post
+
+STATS_KEY_PREFIX = 'blog:author-stats:'
+
+EMPTY_STATS = {'posts': 0, 'published_posts': 0, 'unpublished_posts': 0, 'comments_received': 0,
+               'last_post_date': None}
+
+
+def stats_key(author_id):
+    return f'{STATS_KEY_PREFIX}{author_id}'
+
+
+def compute_stats(author_ids):
+    """Stats of every author of author_ids, from one query grouping their posts.
+
+    Comments received are the published ones, read from the posts' counters.
+    """
+    stats = {author_id: dict(EMPTY_STATS) for author_id in author_ids}
+    published = Q(is_published=True)
+    rows = (Post.objects.filter(owner_id__in=author_ids).order_by().values('owner_id')
+            .annotate(posts=Count('pk'), published_posts=Count('pk', filter=published),
+                      comments_received=Sum('published_comment_count'),
+                      last_post_date=Max('published_date', filter=published)))
+    for row in rows:
+        row['unpublished_posts'] = row['posts'] - row['published_posts']
+        stats[row.pop('owner_id')] = row
+    return stats
+
+
+def refresh_stats(author_ids=(), post_ids=()):
+    """Rebuild the cached stats of author_ids and of the owners of post_ids, returns how many changed.
+
+    Only the pages of authors whose stats changed are invalidated.
+    """
+    author_ids = set(author_ids)
+    if post_ids:
+        author_ids.update(Post.objects.filter(pk__in=post_ids).values_list('owner_id', flat=True))
+    if not author_ids:
+        return 0
+    stats = compute_stats(author_ids)
+    cached = cache.get_many([stats_key(author_id) for author_id in author_ids])
+    changed = [author_id for author_id, values in stats.items() if cached.get(stats_key(author_id)) != values]
+    if changed:
+        cache.set_many({stats_key(author_id): stats[author_id] for author_id in changed}, None)
+        usernames = Author.objects.filter(pk__in=changed).values_list('username', flat=True)
+        bump_scopes([author_scope(username) for username in usernames])
+    return len(changed)
+
+
+def author_stats(author):
+    """Cached stats of author, built on a cache miss."""
+    stats = cache.get(stats_key(author.pk))
+    if stats is None:
+        stats = compute_stats([author.pk])[author.pk]
+        cache.set(stats_key(author.pk), stats, None)
+    return stats
+
+
+async def aauthor_stats(author):
+    """author_stats() with the async cache API."""
+    stats = await cache.aget(stats_key(author.pk))
+    if stats is None:
+        stats = (await sync_to_async(compute_stats)([author.pk]))[author.pk]
+        await cache.aset(stats_key(author.pk), stats, None)
+    return stats
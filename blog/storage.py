@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict
+
+from botocore.exceptions import ClientError
+
+from django.conf import settings
+from django.utils.encoding import filepath_to_uri
+from django.utils.functional import cached_property
+
+from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
+
+KEY_PLACEHOLDER = '__key__'
+
+
+def media_url_mode():
+    return getattr(settings, 'BLOG_MEDIA_URL_MODE', 'signed')
+
+
+class MediaStorage(S3Boto3Storage):
+    """S3 storage whose url() avoids boto3 presigning on every call.
+
+    BLOG_MEDIA_URL_MODE chooses how urls are built:
+
+    - "signed": a presigned url per call, like S3Boto3Storage;
+    - "public": BLOG_MEDIA_PUBLIC_URL, or the bucket url computed once, joined
+      with the key, for public-read files;
+    - "cached": presigned urls reused while they stay valid for at least
+      BLOG_MEDIA_SIGNED_URL_MIN_TTL seconds, since pages embedding them are
+      cached too. At most BLOG_MEDIA_SIGNED_URL_CACHE_SIZE urls are kept per
+      storage, the oldest (first to expire) are evicted first.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.signed_urls_lock = threading.Lock()
+        self.signed_urls = OrderedDict()
+
+    @cached_property
+    def bucket_url(self):
+        if self.custom_domain:
+            return f'{self.url_protocol}//{self.custom_domain}/'
+        # let boto3 pick the addressing style once, with a placeholder key
+        url = self.bucket.meta.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket_name, 'Key': KEY_PLACEHOLDER})
+        return self._strip_signing_parameters(url).split(KEY_PLACEHOLDER)[0]
+
+    def public_url(self, name):
+        base_url = getattr(settings, 'BLOG_MEDIA_PUBLIC_URL', '') or self.bucket_url
+        return base_url + filepath_to_uri(self._normalize_name(clean_name(name)))
+
+    def cached_url(self, name):
+        now = time.monotonic()
+        with self.signed_urls_lock:
+            while self.signed_urls and next(iter(self.signed_urls.values()))[1] <= now:
+                self.signed_urls.popitem(last=False)
+            cached = self.signed_urls.get(name)
+        if cached is not None:
+            return cached[0]
+
+        url = super().url(name)
+        reuse_for = self.querystring_expire - getattr(settings, 'BLOG_MEDIA_SIGNED_URL_MIN_TTL', 900)
+        if reuse_for > 0:
+            with self.signed_urls_lock:
+                # every entry gets the same lifetime, so insertion order is expiry order
+                self.signed_urls.pop(name, None)
+                self.signed_urls[name] = (url, now + reuse_for)
+                while len(self.signed_urls) > getattr(settings, 'BLOG_MEDIA_SIGNED_URL_CACHE_SIZE', 10000):
+                    self.signed_urls.popitem(last=False)
+        return url
+
+    def url(self, name, parameters=None, expire=None, http_method=None):
+        mode = media_url_mode()
+        if parameters or expire is not None or http_method or mode == 'signed':
+            return super().url(name, parameters, expire, http_method)
+        if mode == 'public':
+            return self.public_url(name)
+        return self.cached_url(name)
+
+    def presigned_post(self, name, content_type, max_size, expire):
+        """Url and form fields letting a browser POST the file name straight to the bucket."""
+        fields = {'Content-Type': content_type}
+        conditions = [{'Content-Type': content_type}, ['content-length-range', 1, max_size]]
+        if self.default_acl:
+            fields['acl'] = self.default_acl
+            conditions.append({'acl': self.default_acl})
+        return self.bucket.meta.client.generate_presigned_post(
+            self.bucket_name, self._normalize_name(clean_name(name)), Fields=fields, Conditions=conditions,
+            ExpiresIn=expire)
+
+    def head(self, name):
+        """(size, content type) of the stored file name, None if there is no such file."""
+        try:
+            response = self.bucket.meta.client.head_object(Bucket=self.bucket_name,
+                                                           Key=self._normalize_name(clean_name(name)))
+        except ClientError as error:
+            if error.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return None
+            raise
+        return response['ContentLength'], response.get('ContentType', '')
+
+    def read_start(self, name, size):
+        """First size bytes of the stored file name, fetched with a ranged GET."""
+        response = self.bucket.meta.client.get_object(Bucket=self.bucket_name,
+                                                      Key=self._normalize_name(clean_name(name)),
+                                                      Range=f'bytes=0-{size - 1}')
+        return response['Body'].read()
+
+
+def export_url_expire():
+    return getattr(settings, 'BLOG_EXPORT_URL_EXPIRE', 24 * 60 * 60)
+
+
+class ExportStorage(S3Boto3Storage):
+    """Private storage of the admin CSV exports, their files are only reachable through presigned urls.
+
+    They hold unpublished posts and comments and author emails, so the public
+    AWS_DEFAULT_ACL and AWS_S3_CUSTOM_DOMAIN of the media files do not apply.
+    """
+
+    default_acl = 'private'
+    querystring_auth = True
+    custom_domain = None
+    file_overwrite = False
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('querystring_expire', export_url_expire())
+        super().__init__(**kwargs)
@@ -1,25 +1,87 @@
+import itertools
+
 from celery import shared_task
 
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, send_mail
 from django.urls import reverse
 
-from .models import Comment, Post
+from .dispatch import dispatch
+from .exports import EXPORTS, range_batches, selected_rows, write_export
+from .images import process_image
+from .ingestion import drain_comment_queue
+from .instrumentation import timed_email
+from .models import Comment
+from .notifications import deliver, flush_digests
+from .stats import refresh_stats
+from .storage import export_url_expire
+
+# Everything new_comments_email() reads, loaded in one query
+COMMENT_EMAIL_FIELDS = ('author', 'text', 'post__title', 'post__owner__username', 'post__owner__email')
 
 
 @shared_task
-def send_user_email(post_id, comment_id):
-    post = Post.objects.get(id=post_id)
-    comment = Comment.objects.get(id=comment_id)
-    if comment.is_published:
-        post_owner_email = post.owner.email
-        post_url = reverse('post_detail', args=[post.id])
-        subject = f'New comment on your post "{post.title}"'
-        message = f'Hi, {post.owner.username}! You have a new comment on your post "{post.title}".\n\n'
+def send_user_email(comment_id, legacy_comment_id=None):
+    if legacy_comment_id is not None:
+        # queued as (post_id, comment_id) by an earlier release
+        comment_id = legacy_comment_id
+    comment = (Comment.objects.filter(pk=comment_id, is_published=True).select_related('post__owner')
+               .only(*COMMENT_EMAIL_FIELDS).first())
+    if comment is None:
+        return
+    deliver('comment_published', [new_comments_email(comment.post.owner, [comment])])
+
+
+def new_comments_email(owner, comments):
+    """Email telling owner about comments, published comments on their posts."""
+    if len(comments) == 1:
+        comment = comments[0]
+        subject = f'New comment on your post "{comment.post.title}"'
+        message = f'Hi, {owner.username}! You have a new comment on your post "{comment.post.title}".\n\n'
+    else:
+        subject = f'{len(comments)} new comments on your posts'
+        message = f'Hi, {owner.username}! You have {len(comments)} new comments on your posts.\n'
+    for comment in comments:
+        post_url = reverse('post_detail', args=[comment.post_id])
+        if len(comments) > 1:
+            message += f'\nPost: {comment.post.title}\n'
         message += f'Author: {comment.author}\n'
         message += f'Text: {comment.text}\n'
-        message += f'Link: {post_url}#comment-{comment_id}'
-        send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [post_owner_email], fail_silently=False)
+        message += f'Link: {post_url}#comment-{comment.id}\n'
+    return EmailMessage(subject, message.rstrip('\n'), settings.DEFAULT_FROM_EMAIL, [owner.email])
+
+
+@shared_task
+def send_user_emails(comment_ids):
+    """Send each post owner a single email about their published comments among comment_ids."""
+    comments = (Comment.objects.filter(pk__in=comment_ids, is_published=True).select_related('post__owner')
+                .only(*COMMENT_EMAIL_FIELDS).order_by('post__owner_id', 'pk'))
+    emails = []
+    for _, owner_comments in itertools.groupby(comments, key=lambda comment: comment.post.owner_id):
+        owner_comments = list(owner_comments)
+        emails.append(new_comments_email(owner_comments[0].post.owner, owner_comments))
+    deliver('comment_published', emails)
+
+
+def notify_post_owners(comments):
+    """Enqueue new comment emails for comments, (comment id, post owner id) pairs.
+
+    Comments are grouped per post owner and BLOG_NOTIFICATION_BATCH_SIZE owners
+    share one send_user_emails task. The tasks are dispatched, so they are only
+    published once the caller's transaction commits, all through one producer
+    within a request.
+    """
+    owners = {}
+    for comment_id, owner_id in comments:
+        owners.setdefault(owner_id, []).append(comment_id)
+    batch_size = getattr(settings, 'BLOG_NOTIFICATION_BATCH_SIZE', 50)
+    per_owner = list(owners.values())
+    batches = [
+        list(itertools.chain.from_iterable(per_owner[start:start + batch_size]))
+        for start in range(0, len(per_owner), batch_size)
+    ]
+    for batch in batches:
+        dispatch(send_user_emails, batch)
 
 
 @shared_task
@@ -27,32 +89,86 @@ def send_new_post_notification(post_id):
     post_url = reverse('post_detail', args=[post_id])
     post_absolute_url = post_url
     message = f"New post added: {post_absolute_url}"
-    send_mail(
+    deliver('new_post', [EmailMessage(
         subject="New post added",
-        message=message,
+        body=message,
         from_email="notifications@blog.com",
-        recipient_list=["admin@noreply.com"],
-        fail_silently=False,
+        to=["admin@noreply.com"],
+    )])
+
+
+def new_comment_email(post_id):
+    post_url = reverse('post_detail', args=[post_id])
+    post_absolute_url = post_url
+    message = f"New comment to post ({post_absolute_url})"
+    return EmailMessage(
+        'New comment created',
+        message,
+        'noreply@example.com',
+        ['admin@noreply.com'],
     )
 
 
 @shared_task
 def send_new_comment_notification(comment_id):
-    comment = Comment.objects.get(pk=comment_id)
-    post_url = reverse('post_detail', args=[comment.post.id])
-    post_absolute_url = post_url
-    message = f"New comment to post ({post_absolute_url})"
-    send_mail(
-            'New comment created',
-            message,
-            'noreply@example.com',
-            ['admin@noreply.com'],
-            fail_silently=False,
-        )
+    post_id = Comment.objects.filter(pk=comment_id).values_list('post_id', flat=True).first()
+    if post_id is None:
+        return
+    deliver('new_comment', [new_comment_email(post_id)])
+
+
+@shared_task
+def send_new_comment_notifications(comment_ids):
+    """send_new_comment_notification() for every comment of comment_ids, delivered together."""
+    post_ids = Comment.objects.filter(pk__in=comment_ids).order_by('pk').values_list('post_id', flat=True)
+    deliver('new_comment', [new_comment_email(post_id) for post_id in post_ids])
+
+
+@shared_task
+def ingest_comments():
+    return drain_comment_queue(notify=send_new_comment_notifications.delay)
 
 
 @shared_task
 def send_contact_email(name, from_email, message):
     subject = 'Feedback from {}'.format(name)
     body = 'You have new feedback from {} ({})\n\n{}'.format(name, from_email, message)
-    send_mail(subject, body, 'notifications@blog.com', ['admin@noreply.com'], fail_silently=False)
+    with timed_email():
+        send_mail(subject, body, 'notifications@blog.com', ['admin@noreply.com'], fail_silently=False)
+
+
+def email_export(kind, url, email):
+    message = f'Your {kind} export is ready: {url}\n\nThe link expires in {export_url_expire() // 3600} hours.'
+    with timed_email():
+        send_mail(f'Export of {kind} is ready', message, settings.DEFAULT_FROM_EMAIL, [email], fail_silently=False)
+
+
+@shared_task
+def export_selection_csv(kind, selection, path, email):
+    """Export the rows of an admin action's selection, see blog.exports.selection()."""
+    url = write_export(kind, [selected_rows(kind, selection)], path)
+    email_export(kind, url, email)
+    return url
+
+
+@shared_task
+def export_csv(kind, ranges, path, email):
+    """Export rows by primary key runs, for messages queued before export_selection_csv replaced it."""
+    url = write_export(kind, range_batches(EXPORTS[kind][0], ranges), path)
+    email_export(kind, url, email)
+    return url
+
+
+@shared_task
+def flush_notification_digests():
+    return flush_digests()
+
+
+@shared_task
+def generate_image_variants(kind, pk):
+    return process_image(kind, pk)
+
+
+@shared_task
+def refresh_author_stats(author_ids, post_ids=()):
+    return refresh_stats(author_ids, post_ids)
@@ -0,0 +1,36 @@
+from blog.images import VARIANT_FORMATS, variant_url
+
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def srcset(variants, variant_format='jpeg'):
+    """srcset attribute value listing the variants of variant_format, "url 320w, url 640w"."""
+    return ', '.join(f"{variant['url']} {variant['width']}w" for variant in variants
+                     if variant['format'] == variant_format)
+
+
+@register.inclusion_tag('blog/responsive_image.html')
+def responsive_image(image, variants, sizes='100vw', css_class='', alt=''):
+    """<picture> serving the variants of image, or the original while they are being generated."""
+    # stored urls are only signed again once they are about to expire
+    variants = [dict(variant, url=variant_url(image.storage, variant)) for variant in variants]
+    sources = [
+        {'type': content_type, 'srcset': srcset(variants, variant_format)}
+        for variant_format, (_, _, content_type) in VARIANT_FORMATS.items()
+        if any(variant['format'] == variant_format for variant in variants)
+    ]
+    # browsers without srcset support get the largest variant of the last (most compatible) format
+    fallback = max((variant for variant in variants if variant['format'] == list(VARIANT_FORMATS)[-1]),
+                   key=lambda variant: variant['width'], default=None)
+    return {
+        'sources': sources,
+        'src': fallback['url'] if fallback else image.url,
+        'width': fallback and fallback['width'],
+        'height': fallback and fallback['height'],
+        'sizes': sizes,
+        'css_class': css_class,
+        'alt': alt,
+    }
@@ -1,3 +1,2021 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.contrib.admin.sites import site
+from django.contrib.auth.models import AnonymousUser
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, IntegrityError, connection, connections, transaction
+from django.http import Http404, HttpResponse
+from django.template import Context, Template
+from django.test import AsyncRequestFactory, Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+try:
+    from moto import mock_aws
+except ImportError:  # moto is in requirements_dev.txt
+    mock_aws = None
+
+from PIL import Image
+
+import redis
+
+try:
+    import requests
+except ImportError:  # requests is in requirements_dev.txt
+    requests = None
+
+from core.celery import app as celery_app
+
+from . import async_views, dbpool, ingestion
+from .cache import author_scope, count_scope
+from .counters import recount
+from .dbpool import ConnectionPool
+from .dispatch import dispatch
+from .feeds import FEED_KEY_PREFIX
+from .middleware import dispatch_middleware
+from .models import Author, Comment, PendingNotification, Post, PostImagesStorage, UserPhotoStorage
+from .notifications import flush_digests
+from .paginators import CachedCountPaginator, CursorPaginator
+from .instrumentation import SENT_AT_HEADER, stamp_sent_at, task_sent_at
+from .metrics import Metrics, metrics
+from .querybudget import QueryBudget, QueryBudgetExceeded, query_budget
+from .ratelimit import hit, parse_rate
+from .search import search_backend, tokenize
+from .stats import EMPTY_STATS, author_stats, compute_stats, refresh_stats
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# Tests run without Redis and S3
+local_services = override_settings(
+    CACHES=LOCMEM_CACHES,
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+)
+
+
+class eager_celery:
+    """Run tasks, groups included, synchronously instead of sending them to the broker."""
+
+    def __enter__(self):
+        self.previous = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+
+    def __exit__(self, *exc_info):
+        celery_app.conf.task_always_eager = self.previous
+
+
+@local_services
+class BlogTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+
+def make_posts(owner, count, is_published=True):
+    now = timezone.now()
+    posts = Post.objects.bulk_create(
+        Post(owner=owner, title=f'Post {i}', short_description='short', full_description='full',
+             is_published=is_published)
+        for i in range(count)
+    )
+    # auto_now_add ignores explicit values, so spread the dates afterwards; every
+    # third post shares its date with the previous one to exercise the id tie-break
+    for i, post in enumerate(posts):
+        post.published_date = now - datetime.timedelta(minutes=i - i % 3 // 2)
+    Post.objects.bulk_update(posts, ['published_date'])
+    return posts
+
+
+class CursorPaginatorTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create_user(username='author', email='author@example.com', password='pass')
+        make_posts(cls.author, 25)
+
+    def setUp(self):
+        super().setUp()
+        self.queryset = Post.objects.filter(is_published=True).order_by('-published_date', '-id')
+        self.expected = list(self.queryset)
+
+    def test_walks_forward_and_back(self):
+        paginator = CursorPaginator(self.queryset, 10)
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        third = paginator.page(second.next_cursor)
+        self.assertEqual(list(first) + list(second) + list(third), self.expected)
+        self.assertFalse(first.has_previous())
+        self.assertFalse(third.has_next())
+        self.assertEqual((first.number, second.number, third.number), (1, 2, 3))
+
+        back = paginator.page(third.previous_cursor)
+        self.assertEqual(list(back), list(second))
+        self.assertEqual(back.number, 2)
+        start = paginator.page(back.previous_cursor)
+        self.assertEqual(list(start), list(first))
+        self.assertEqual(start.number, 1)
+        self.assertFalse(start.has_previous())
+
+    def test_page_skips_count(self):
+        paginator = CursorPaginator(self.queryset, 10)
+        cursor = paginator.page().next_cursor
+        with CaptureQueriesContext(connection) as ctx:
+            paginator.page(cursor)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn('COUNT(', ctx.captured_queries[0]['sql'].upper())
+
+    def test_invalid_cursor_returns_first_page(self):
+        page = CursorPaginator(self.queryset, 10).page('not-a-cursor')
+        self.assertEqual(list(page), self.expected[:10])
+
+    def test_count_is_cached(self):
+        self.assertEqual(CachedCountPaginator(self.queryset, 10).count, 25)
+        with self.assertNumQueries(0):
+            self.assertEqual(list(CachedCountPaginator(self.queryset, 10).page_range), [1, 2, 3])
+
+
+class PostListPaginationTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create_user(username='author', email='author@example.com', password='pass')
+        make_posts(cls.author, 15)
+
+    def test_offset_pages(self):
+        response = self.client.get(reverse('post_list'), {'page': 2})
+        self.assertEqual(response.context['posts'].number, 2)
+        self.assertEqual(len(response.context['posts']), 5)
+        self.assertEqual(list(response.context['posts'].paginator.page_range), [1, 2])
+        response = self.client.get(reverse('post_list'), {'page': 'nope'})
+        self.assertEqual(response.context['posts'].number, 1)
+
+    @override_settings(BLOG_CURSOR_PAGINATION=True)
+    def test_cursor_pages(self):
+        response = self.client.get(reverse('post_list'))
+        posts = response.context['posts']
+        self.assertContains(response, f'?cursor={posts.next_cursor}')
+        response = self.client.get(reverse('post_list'), {'cursor': posts.next_cursor})
+        self.assertEqual(len(response.context['posts']), 5)
+        self.assertEqual(list(response.context['posts'].paginator.page_range), [1, 2])
+
+
+class QueryPlanTests(BlogTestCase):
+    """Every blog_post/blog_comment query issued by the views must be served by an index.
+
+    Plans come from EXPLAIN QUERY PLAN on SQLite and EXPLAIN on Postgres, where
+    sequential scans are disabled so the check does not depend on table sizes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create_user(username='author', email='author@example.com', password='pass')
+        cls.posts = make_posts(cls.author, 30)
+        make_posts(cls.author, 5, is_published=False)
+        Comment.objects.bulk_create(
+            Comment(post=cls.posts[0], author='Guest', text='text', is_published=i % 2 == 0) for i in range(30)
+        )
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN ' + sql)
+            else:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+    def bad_plan(self, plan):
+        if connection.vendor == 'postgresql':
+            return 'Seq Scan on blog_' in plan or ' Sort ' in f' {plan} '
+        for line in plan.splitlines():
+            line = line.strip()
+            if line.startswith('SCAN blog_') and ' USING ' not in line:
+                return True
+            if 'TEMP B-TREE FOR ORDER BY' in line:
+                return True
+        return False
+
+    def assertIndexedQueries(self, url, data=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        checked = 0
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or not ('"blog_post"' in sql or '"blog_comment"' in sql):
+                continue
+            plan = self.explain(sql)
+            checked += 1
+            self.assertFalse(self.bad_plan(plan), f'{url} issued a query without a usable index:\n{sql}\n{plan}')
+        self.assertTrue(checked)
+        return response
+
+    def test_post_list(self):
+        self.assertIndexedQueries(reverse('post_list'))
+        self.assertIndexedQueries(reverse('post_list'), {'page': 2})
+
+    @override_settings(BLOG_CURSOR_PAGINATION=True)
+    def test_post_list_cursor(self):
+        response = self.assertIndexedQueries(reverse('post_list'))
+        self.assertIndexedQueries(reverse('post_list'), {'cursor': response.context['posts'].next_cursor})
+
+    def test_user_posts(self):
+        self.assertIndexedQueries(reverse('user_posts', args=[self.author.username]), {'page': 2})
+
+    def test_post_detail(self):
+        self.assertIndexedQueries(reverse('post_detail', args=[self.posts[0].pk]), {'page': 2})
+
+    @override_settings(BLOG_CURSOR_PAGINATION=True)
+    def test_post_detail_cursor(self):
+        url = reverse('post_detail', args=[self.posts[0].pk])
+        response = self.assertIndexedQueries(url)
+        self.assertIndexedQueries(url, {'cursor': response.context['page_obj'].next_cursor})
+
+    def test_unpublished_posts(self):
+        self.client.force_login(self.author)
+        self.assertIndexedQueries(reverse('unpublished_posts'))
+
+
+class QueryBudgetTests(BlogTestCase):
+    """Views issue a fixed number of queries, whatever the page size."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create_user(username='author', email='author@example.com', password='pass')
+        cls.posts = make_posts(cls.author, 20)
+        make_posts(cls.author, 12, is_published=False)
+        Comment.objects.bulk_create(
+            Comment(post=cls.posts[0], author='Guest', text='text', is_published=True) for _ in range(12)
+        )
+
+    def setUp(self):
+        super().setUp()
+        # profile stats are warm, as after "manage.py warm_author_stats"
+        refresh_stats([self.author.pk])
+
+    def assertBudget(self, max_queries, url, data=None):
+        with QueryBudget(max_queries, label=url):
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_list(self):
+        self.assertBudget(2, reverse('post_list'))
+
+    def test_user_posts(self):
+        self.assertBudget(3, reverse('user_posts', args=[self.author.username]))
+
+    def test_post_detail(self):
+        self.assertBudget(3, reverse('post_detail', args=[self.posts[0].pk]))
+
+    def test_user_profile(self):
+        self.assertBudget(1, reverse('user_profile', args=[self.author.username]))
+
+    def test_unpublished_posts(self):
+        self.client.force_login(self.author)
+        self.assertBudget(4, reverse('unpublished_posts'))
+
+    def test_budget_exceeded(self):
+        @query_budget(1)
+        def two_queries():
+            list(Post.objects.all())
+            list(Comment.objects.all())
+
+        with self.assertRaises(QueryBudgetExceeded):
+            two_queries()
+
+
+class PageCacheTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create_user(username='author', email='author@example.com', password='pass')
+        cls.admin = Author.objects.create_superuser(username='admin', email='admin@example.com', password='pass')
+        cls.posts = make_posts(cls.author, 3)
+
+    def assertCached(self, url):
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            return self.client.get(url)
+
+    def test_anonymous_pages_are_cached(self):
+        for url in [reverse('post_list'), reverse('user_posts', args=[self.author.username]),
+                    reverse('post_detail', args=[self.posts[0].pk])]:
+            self.assertEqual(self.assertCached(url).status_code, 200)
+
+    def test_authenticated_pages_are_not_cached(self):
+        self.client.force_login(self.author)
+        self.client.get(reverse('post_list'))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('post_list'))
+        self.assertTrue(ctx.captured_queries)
+
+    def test_post_save_evicts_pages(self):
+        post = self.posts[0]
+        urls = [reverse('post_list'), reverse('user_posts', args=[self.author.username]),
+                reverse('post_detail', args=[post.pk])]
+        for url in urls:
+            self.assertCached(url)
+        post.title = 'Renamed post'
+        post.save()
+        for url in urls:
+            self.assertContains(self.client.get(url), 'Renamed post')
+
+    def test_comment_save_evicts_detail_page(self):
+        url = reverse('post_detail', args=[self.posts[0].pk])
+        self.assertCached(url)
+        Comment.objects.create(post=self.posts[0], author='Guest', text='Fresh comment', is_published=True)
+        self.assertContains(self.client.get(url), 'Fresh comment')
+
+    def test_admin_bulk_actions_evict_pages(self):
+        from .admin import CommentAdmin, PostAdmin
+
+        request = RequestFactory().post('/')
+        request.user = self.admin
+        url = reverse('post_list')
+        self.assertCached(url)
+        PostAdmin(Post, site).make_unpublished(request, Post.objects.filter(pk=self.posts[0].pk))
+        self.assertNotContains(self.client.get(url), f'>{self.posts[0].title}<')
+        PostAdmin(Post, site).make_published(request, Post.objects.filter(pk=self.posts[0].pk, is_published=False))
+        self.assertContains(self.client.get(url), f'>{self.posts[0].title}<')
+
+        comment = Comment.objects.create(post=self.posts[0], author='Guest', text='Hidden soon', is_published=True)
+        detail_url = reverse('post_detail', args=[self.posts[0].pk])
+        self.assertCached(detail_url)
+        CommentAdmin(Comment, site).make_unpublished(request, Comment.objects.filter(pk=comment.pk))
+        self.assertNotContains(self.client.get(detail_url), 'Hidden soon')
+
+    @mock.patch('blog.views.send_new_comment_notification.apply_async')
+    def test_cached_detail_page_issues_fresh_csrf_token(self, apply_async):
+        url = reverse('post_detail', args=[self.posts[0].pk])
+        Client().get(url)
+        client = Client(enforce_csrf_checks=True)
+        with self.assertNumQueries(0):
+            response = client.get(url)
+        token = response.content.decode().split('name="csrfmiddlewaretoken" value="')[1].split('"')[0]
+        self.assertIn('csrftoken', response.cookies)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(url, {'author': 'Bob', 'text': 'Hello', 'csrfmiddlewaretoken': token})
+        self.assertEqual(response.status_code, 302)
+        apply_async.assert_called_once()
+
+
+class CommentCounterTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create_user(username='author', email='author@example.com', password='pass')
+        cls.admin = Author.objects.create_superuser(username='admin', email='admin@example.com', password='pass')
+        cls.post = make_posts(cls.author, 1)[0]
+
+    def setUp(self):
+        super().setUp()
+        self.request = RequestFactory().post('/')
+        self.request.user = self.admin
+        self.request._messages = mock.Mock()
+        self.comments = Comment.objects.bulk_create(
+            Comment(post=self.post, author='Guest', text='text') for _ in range(3)
+        )
+
+    def assertCounters(self, count):
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.published_comment_count, count)
+        latest = Comment.objects.filter(post=self.post, is_published=True).order_by('-published_date').first()
+        self.assertEqual(self.post.last_comment_at, latest.published_date if latest else None)
+
+    @mock.patch('blog.admin.notify_post_owners')
+    def test_admin_actions(self, notify):
+        from .admin import CommentAdmin
+
+        admin = CommentAdmin(Comment, site)
+        admin.make_published(self.request, Comment.objects.all())
+        self.assertCounters(3)
+        admin.make_published(self.request, Comment.objects.all())
+        self.assertCounters(3)
+        admin.make_unpublished(self.request, Comment.objects.filter(pk=self.comments[-1].pk))
+        self.assertCounters(2)
+        admin.make_unpublished(self.request, Comment.objects.all())
+        self.assertCounters(0)
+
+    def test_deleting_published_comments(self):
+        from .admin import CommentAdmin
+
+        Comment.objects.update(is_published=True)
+        recount(Post.objects.filter(pk=self.post.pk))
+        Comment.objects.get(pk=self.comments[-1].pk).delete()
+        self.assertCounters(2)
+        Comment.objects.create(post=self.post, author='Guest', text='Awaiting moderation').delete()
+        self.assertCounters(2)
+        CommentAdmin(Comment, site).delete_queryset(self.request, Comment.objects.filter(pk=self.comments[0].pk))
+        self.assertCounters(1)
+        # comments deleted with their post are not recounted
+        with mock.patch('blog.signals.recount') as recount_posts:
+            self.post.delete()
+        recount_posts.assert_not_called()
+
+    @mock.patch('blog.admin.dispatch')
+    def test_admin_save_model(self, dispatch):
+        from .admin import CommentAdmin, send_user_email
+
+        admin = CommentAdmin(Comment, site)
+        comment = self.comments[0]
+        comment.is_published = True
+        admin.save_model(self.request, comment, mock.Mock(changed_data=['is_published']), True)
+        self.assertCounters(1)
+        dispatch.assert_called_once_with(send_user_email, comment.pk)
+        comment.is_published = False
+        admin.save_model(self.request, comment, mock.Mock(changed_data=['is_published']), True)
+        self.assertCounters(0)
+
+    def test_recount_command(self):
+        Comment.objects.filter(pk__in=[c.pk for c in self.comments[:2]]).update(is_published=True)
+        Post.objects.update(published_comment_count=42)
+        call_command('recount_comments', batch_size=1, stdout=mock.Mock())
+        self.assertCounters(2)
+
+
+class UsersCommandTests(BlogTestCase):
+    def test_bulk_mode(self):
+        call_command('users', bulk=True, users=5, posts=2, comments=3, seed=1, batch_size=2, stdout=mock.Mock())
+        self.assertEqual(Author.objects.count(), 5)
+        self.assertEqual(Post.objects.count(), 10)
+        self.assertEqual(Comment.objects.count(), 30)
+        self.assertFalse(Post.objects.exclude(published_comment_count=3).exists())
+        self.assertEqual(len(set(Author.objects.values_list('password', flat=True))), 1)
+        self.assertTrue(Author.objects.first().check_password('password'))
+
+    def test_seed_is_deterministic(self):
+        call_command('users', bulk=True, users=3, posts=1, comments=0, seed=7, batch_size=2, stdout=mock.Mock())
+        usernames = list(Author.objects.order_by('pk').values_list('username', flat=True))
+        Author.objects.all().delete()
+        call_command('users', bulk=True, users=3, posts=1, comments=0, seed=7, batch_size=2, stdout=mock.Mock())
+        self.assertEqual(list(Author.objects.order_by('pk').values_list('username', flat=True)), usernames)
+
+
+class ExportTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create_user(username='author', email='author@example.com', password='pass')
+        cls.admin = Author.objects.create_superuser(username='admin', email='admin@example.com', password='pass')
+        cls.posts = make_posts(cls.author, 5)
+        Comment.objects.bulk_create(Comment(post=post, author='Guest', text='text') for post in cls.posts)
+
+    def setUp(self):
+        super().setUp()
+        self.request = RequestFactory().post('/')
+        self.request.user = self.admin
+        self.request._messages = mock.Mock()
+
+    def read_csv(self, response):
+        return list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+
+    def test_streams_posts(self):
+        from .admin import PostAdmin
+
+        response = PostAdmin(Post, site).export_selected_posts(self.request, Post.objects.all())
+        with self.assertNumQueries(1):
+            rows = self.read_csv(response)
+        self.assertEqual(rows[0], ['Published Date', 'Owner', 'Title', 'short_description', 'full_description'])
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][1], 'author')
+
+    def test_streams_comments(self):
+        from .admin import CommentAdmin
+
+        response = CommentAdmin(Comment, site).export_selected_comments(self.request, Comment.objects.all())
+        with self.assertNumQueries(1):
+            rows = self.read_csv(response)
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][0], self.posts[0].title)
+
+    @override_settings(BLOG_EXPORT_ASYNC_THRESHOLD=2)
+    @mock.patch('blog.admin.export_selection_csv.delay')
+    def test_large_selection_exports_in_background(self, delay):
+        from .admin import PostAdmin
+
+        pks = [post.pk for post in self.posts]
+        queryset = Post.objects.filter(pk__in=pks[:2] + pks[3:])
+        self.assertIsNone(PostAdmin(Post, site).export_selected_posts(self.request, queryset))
+        kind, selection, path, email = delay.call_args.args
+        self.assertEqual((kind, email), ('posts', 'admin@example.com'))
+        self.assertEqual(selection, {'pks': pks[:2] + pks[3:]})
+        message = self.request._messages.add.call_args.args[1]
+        self.assertEqual(message, 'Export of 4 posts is running in the background, the link will be emailed to '
+                                  'admin@example.com')
+
+    @override_settings(BLOG_EXPORT_ASYNC_THRESHOLD=2)
+    @mock.patch('blog.admin.export_selection_csv.delay')
+    def test_select_all_sends_the_changelist_filters(self, delay):
+        from .admin import PostAdmin
+        from .tasks import export_selection_csv
+
+        drafts = make_posts(self.author, 3, is_published=False)
+        request = RequestFactory().post('/?is_published__exact=0', {'select_across': '1'})
+        request.user = self.admin
+        request._messages = mock.Mock()
+        PostAdmin(Post, site).export_selected_posts(request, Post.objects.filter(is_published=False))
+        kind, selection, path, email = delay.call_args.args
+        self.assertEqual(selection, {'filters': 'is_published__exact=0', 'last_pk': drafts[-1].pk,
+                                     'user': self.admin.pk})
+        # added after the action, left out
+        make_posts(self.author, 1, is_published=False)
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root, BLOG_EXPORT_STORAGE='django.core.files.storage.FileSystemStorage',
+        ):
+            export_selection_csv(kind, selection, 'exports/posts.csv', email)
+            with open(f'{media_root}/exports/posts.csv') as export:
+                rows = list(csv.reader(export))
+        self.assertEqual(sorted(row[2] for row in rows[1:]), sorted(post.title for post in drafts))
+
+    def test_export_csv_of_queued_pk_ranges(self):
+        from .tasks import export_csv
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root, BLOG_EXPORT_STORAGE='django.core.files.storage.FileSystemStorage',
+        ):
+            pks = [comment.pk for comment in Comment.objects.order_by('pk')]
+            export_csv('comments', [[pks[0], pks[1]], [pks[3], pks[3]]], 'exports/comments.csv', 'admin@example.com')
+            with open(f'{media_root}/exports/comments.csv') as export:
+                rows = list(csv.reader(export))
+        self.assertEqual(rows[0], ['Post', 'Author', 'Published Date'])
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(mail.outbox[0].to, ['admin@example.com'])
+
+    @unittest.skipIf(mock_aws is None, 'moto is not installed')
+    @override_settings(AWS_STORAGE_BUCKET_NAME='media', AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing',
+                       AWS_S3_REGION_NAME='us-east-1', AWS_S3_ENDPOINT_URL=None)
+    def test_exports_are_private(self):
+        from .exports import export_path, export_storage
+        from .tasks import export_selection_csv
+
+        path = export_path('comments')
+        self.assertRegex(path, r'^exports/comments-\d{8}-\d{6}-[0-9A-Za-z]{32}\.csv$')
+        self.assertNotEqual(path, export_path('comments'))
+        with s3_media():
+            url = export_selection_csv('comments', {'pks': [Comment.objects.earliest('pk').pk]}, path,
+                                       'admin@example.com')
+            client = export_storage().bucket.meta.client
+            grants = client.get_object_acl(Bucket='media', Key=path)['Grants']
+        self.assertFalse([grant for grant in grants if 'AllUsers' in grant['Grantee'].get('URI', '')])
+        self.assertIn('Signature=', url)
+        self.assertIn(url, mail.outbox[0].body)
+        self.assertIn('The link expires in 24 hours.', mail.outbox[0].body)
+
+
+class BulkPublishTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Author.objects.create_superuser(username='admin', email='admin@example.com', password='pass')
+        cls.owners = [
+            Author.objects.create_user(username=f'owner{i}', email=f'owner{i}@example.com', password='pass')
+            for i in range(3)
+        ]
+        cls.posts = [post for owner in cls.owners for post in make_posts(owner, 2)]
+        Comment.objects.bulk_create(
+            Comment(post=post, author='Guest', text=f'text {i}') for post in cls.posts for i in range(4)
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.request = RequestFactory().post('/')
+        self.request.user = self.admin
+        self.request._messages = mock.Mock()
+
+    def publish(self):
+        from .admin import CommentAdmin
+
+        CommentAdmin(Comment, site).make_published(self.request, Comment.objects.all())
+
+    @override_settings(BLOG_NOTIFICATION_BATCH_SIZE=2)
+    def test_publishes_in_bulk_and_groups_notifications(self):
+        from .tasks import send_user_emails
+
+        with mock.patch('blog.dispatch.publish') as publish:
+            with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(6):
+                self.publish()
+            # nothing reaches the broker before the transaction commits
+            publish.assert_not_called()
+            for callback in callbacks:
+                callback()
+        self.assertFalse(Comment.objects.filter(is_published=False).exists())
+        calls = [call for (calls,), _ in publish.call_args_list for call in calls
+                 if call[0] is send_user_emails]
+        self.assertEqual(sorted(len(batch) for _, (batch,) in calls), [8, 16])
+
+    @override_settings(BLOG_NOTIFICATION_DIGEST_WINDOWS={})
+    def test_one_email_per_owner_and_idempotent(self):
+        with eager_celery():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.publish()
+            self.assertEqual(sorted(email.to[0] for email in mail.outbox), [o.email for o in self.owners])
+            self.assertIn('8 new comments', mail.outbox[0].subject)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.publish()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(Post.objects.filter(published_comment_count=4).count(), 6)
+
+
+@override_settings(BLOG_NOTIFICATION_DIGEST_WINDOWS={'new_comment': 60, 'comment_published': 30})
+class NotificationDigestTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = Author.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        cls.post = make_posts(cls.owner, 1)[0]
+        cls.comments = Comment.objects.bulk_create(
+            Comment(post=cls.post, author='Guest', text=f'text {i}', is_published=True) for i in range(3)
+        )
+
+    def test_events_are_buffered_and_flushed_as_one_digest(self):
+        from .tasks import send_new_comment_notification, send_user_email
+
+        for comment in self.comments:
+            send_new_comment_notification(comment.pk)
+            send_user_email(comment.pk)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(PendingNotification.objects.count(), 6)
+
+        self.assertEqual(flush_digests(), 0)
+        later = timezone.now() + datetime.timedelta(seconds=61)
+        with mock.patch('blog.notifications.get_connection', wraps=mail.get_connection) as get_connection:
+            self.assertEqual(flush_digests(now=later), 2)
+        get_connection.assert_called_once()
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox), ['admin@noreply.com', 'owner@example.com'])
+        self.assertTrue(all(email.subject == '3 new notifications' for email in mail.outbox))
+        self.assertFalse(PendingNotification.objects.exists())
+
+    def test_each_kind_has_its_own_window(self):
+        from .tasks import send_new_comment_notification, send_user_email
+
+        send_new_comment_notification(self.comments[0].pk)
+        send_user_email(self.comments[0].pk)
+        flush_digests(now=timezone.now() + datetime.timedelta(seconds=31))
+        self.assertEqual([email.to for email in mail.outbox], [['owner@example.com']])
+        self.assertEqual(mail.outbox[0].subject, f'New comment on your post "{self.post.title}"')
+        self.assertEqual(PendingNotification.objects.get().recipient, 'admin@noreply.com')
+
+    def test_kinds_without_window_are_sent_right_away(self):
+        from .tasks import send_new_post_notification
+
+        send_new_post_notification(self.post.pk)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(PendingNotification.objects.exists())
+
+
+@override_settings(BLOG_NOTIFICATION_DIGEST_WINDOWS={})
+class TaskQueryTests(BlogTestCase):
+    """Every task reads what it needs in at most one query."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owners = [
+            Author.objects.create_user(username=f'owner{i}', email=f'owner{i}@example.com', password='pass')
+            for i in range(2)
+        ]
+        cls.posts = [make_posts(owner, 1)[0] for owner in cls.owners]
+        cls.comments = Comment.objects.bulk_create(
+            Comment(post=post, author='Guest', text='text', is_published=True) for post in cls.posts for _ in range(2)
+        )
+        cls.draft = Comment.objects.create(post=cls.posts[0], author='Guest', text='text')
+
+    def test_send_user_email(self):
+        from .tasks import send_user_email
+
+        with QueryBudget(1, 'send_user_email'):
+            send_user_email(self.comments[0].pk)
+        self.assertEqual(mail.outbox[0].to, ['owner0@example.com'])
+        self.assertIn('Text: text', mail.outbox[0].body)
+
+    def test_send_user_email_accepts_messages_queued_with_the_post_id(self):
+        from .tasks import send_user_email
+
+        send_user_email.apply(args=(self.comments[0].post_id, self.comments[0].pk))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(self.comments[0].text, mail.outbox[0].body)
+
+    def test_send_user_email_skips_unpublished_comments(self):
+        from .tasks import send_user_email
+
+        with QueryBudget(1, 'send_user_email'):
+            send_user_email(self.draft.pk)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_send_user_emails(self):
+        from .tasks import send_user_emails
+
+        with QueryBudget(1, 'send_user_emails'):
+            send_user_emails([comment.pk for comment in self.comments] + [self.draft.pk])
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_send_new_comment_notification(self):
+        from .tasks import send_new_comment_notification
+
+        with QueryBudget(1, 'send_new_comment_notification'):
+            send_new_comment_notification(self.comments[0].pk)
+        self.assertIn(reverse('post_detail', args=[self.posts[0].pk]), mail.outbox[0].body)
+
+    def test_send_new_post_notification(self):
+        from .tasks import send_new_post_notification
+
+        with QueryBudget(0, 'send_new_post_notification'):
+            send_new_post_notification(self.posts[0].pk)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class SearchTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        # the SQLite fallback keeps its index in memory, across test rollbacks
+        search_backend().reset()
+        self.owner = Author.objects.create_user(username='owner', password='pass')
+        self.title_match = Post.objects.create(owner=self.owner, title='Django performance', short_description='s',
+                                               full_description='f', is_published=True)
+        self.body_match = Post.objects.create(owner=self.owner, title='Notes', short_description='s',
+                                              full_description='Tuning Django performance', is_published=True)
+        self.draft = Post.objects.create(owner=self.owner, title='Django performance draft', short_description='s',
+                                         full_description='f')
+
+    def search(self, query):
+        return list(search_backend().search(Post.objects.filter(is_published=True), query))
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('Hello, World-wide web!'), ['hello', 'world', 'wide', 'web'])
+
+    def test_ranks_title_matches_first(self):
+        self.assertEqual(self.search('django performance'), [self.title_match, self.body_match])
+
+    def test_matches_every_term(self):
+        self.assertEqual(self.search('performance tuning'), [self.body_match])
+        self.assertEqual(self.search('performance unknown'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.search('django')
+        self.title_match.title = 'Flask'
+        self.title_match.save()
+        self.assertEqual(self.search('flask'), [self.title_match])
+        self.assertEqual(self.search('django'), [self.body_match])
+        self.body_match.delete()
+        self.assertEqual(self.search('django'), [])
+
+    def test_search_view(self):
+        make_posts(self.owner, 12)
+        response = Client().get(reverse('search'), {'q': 'post'})
+        self.assertEqual(len(response.context['posts']), 10)
+        self.assertContains(response, '?q=post&page=2')
+        response = Client().get(reverse('search'), {'q': 'django'})
+        self.assertEqual(list(response.context['posts']), [self.title_match, self.body_match])
+        self.assertNotContains(response, 'draft')
+
+    def test_admin_comment_search_matches_post_title(self):
+        by_post = Comment.objects.create(post=self.title_match, author='Guest', text='Nice')
+        other = Post.objects.create(owner=self.owner, title='Other', short_description='s', full_description='f')
+        by_text = Comment.objects.create(post=other, author='Guest', text='Django rocks')
+        Comment.objects.create(post=other, author='Guest', text='Nice')
+        model_admin = site._registry[Comment]
+        results, _ = model_admin.get_search_results(None, Comment.objects.all(), 'django')
+        self.assertEqual(set(results), {by_post, by_text})
+
+    def test_rebuild_search_index(self):
+        self.search('notes')
+        Post.objects.filter(pk=self.body_match.pk).update(title='Rebuilt')
+        self.assertEqual(self.search('rebuilt'), [])
+        call_command('rebuild_search_index', stdout=mock.Mock())
+        self.assertEqual(self.search('rebuilt'), [self.body_match])
+
+
+class local_media:
+    """Store post images and profile photos in a temporary directory instead of S3."""
+
+    def __enter__(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = FileSystemStorage(location=self.tmp.name, base_url='/media/')
+        self.patches = [
+            mock.patch.object(Post._meta.get_field('image'), 'storage', self.storage),
+            mock.patch.object(Author._meta.get_field('profile_photo'), 'storage', self.storage),
+        ]
+        for patch in self.patches:
+            patch.start()
+        return self.storage
+
+    def __exit__(self, *exc_info):
+        for patch in self.patches:
+            patch.stop()
+        self.tmp.cleanup()
+
+
+def image_upload(name='photo.jpg', size=(800, 600), mode='RGB', image_format='JPEG'):
+    image = Image.new(mode, size, 'red')
+    exif = Image.Exif()
+    exif[0x010f] = 'Camera maker'
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, exif=exif)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@override_settings(BLOG_IMAGE_VARIANT_WIDTHS=[320, 640, 1280])
+class ImageVariantTests(BlogTestCase):
+    def upload_post(self, **kwargs):
+        owner = Author.objects.create_user(username='owner', password='pass')
+        with eager_celery(), self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(owner=owner, title='Post', short_description='s', full_description='f',
+                                       is_published=True, image=image_upload(**kwargs))
+        post.refresh_from_db()
+        return post
+
+    def test_variants_are_generated_on_upload(self):
+        with local_media() as storage:
+            post = self.upload_post()
+            variants = post.image_variants
+            self.assertEqual([(v['format'], v['width'], v['height']) for v in variants], [
+                ('webp', 320, 240), ('jpeg', 320, 240),
+                ('webp', 640, 480), ('jpeg', 640, 480),
+                ('webp', 800, 600), ('jpeg', 800, 600),
+            ])
+            for variant in variants:
+                self.assertEqual(variant['url'], storage.url(variant['name']))
+                with storage.open(variant['name']) as file, Image.open(file) as image:
+                    self.assertEqual(image.format, variant['format'].upper())
+                    self.assertEqual(image.size, (variant['width'], variant['height']))
+                    self.assertEqual(dict(image.getexif()), {})
+
+    def test_transparent_images_are_flattened(self):
+        with local_media() as storage:
+            post = self.upload_post(name='logo.png', size=(200, 100), mode='RGBA', image_format='PNG')
+            self.assertEqual({variant['width'] for variant in post.image_variants}, {200})
+            jpeg = next(variant for variant in post.image_variants if variant['format'] == 'jpeg')
+            with storage.open(jpeg['name']) as file, Image.open(file) as image:
+                self.assertEqual(image.mode, 'RGB')
+
+    def test_new_upload_resets_variants(self):
+        with local_media():
+            post = self.upload_post()
+            post.image = image_upload(name='other.jpg')
+            with mock.patch('blog.signals.generate_image_variants') as task, eager_celery(), \
+                    self.captureOnCommitCallbacks(execute=True):
+                post.save()
+            task.apply_async.assert_called_once_with(('post', post.pk), producer=mock.ANY)
+            post.refresh_from_db()
+            self.assertEqual(post.image_variants, [])
+
+    def test_corrupt_upload_is_removed(self):
+        truncated = image_upload().read()[:2000]
+        with local_media() as storage:
+            owner = Author.objects.create_user(username='owner', password='pass')
+            with eager_celery(), self.captureOnCommitCallbacks(execute=True):
+                post = Post.objects.create(owner=owner, title='Post', short_description='s', full_description='f',
+                                           is_published=True, image=SimpleUploadedFile('photo.jpg', truncated))
+            name = Post.objects.filter(pk=post.pk).values_list('image', flat=True).get()
+            self.assertEqual(name, '')
+            self.assertFalse(storage.exists(post.image.name))
+
+    def test_profile_photo_variants(self):
+        with local_media(), eager_celery(), self.captureOnCommitCallbacks(execute=True):
+            author = Author.objects.create_user(username='author', password='pass',
+                                                profile_photo=image_upload(size=(400, 400)))
+        author.refresh_from_db()
+        self.assertEqual({variant['width'] for variant in author.profile_photo_variants}, {320, 400})
+
+    def test_responsive_image(self):
+        with local_media():
+            post = self.upload_post()
+            html = Template(
+                '{% load blog_images %}{% responsive_image post.image post.image_variants sizes="50vw" %}'
+            ).render(Context({'post': post}))
+            webp = post.image_variants[0]['url']
+            self.assertIn(f'<source type="image/webp" srcset="{webp} 320w, ', html)
+            self.assertIn('sizes="50vw"', html)
+            self.assertIn('width="800" height="600"', html)
+            response = Client().get(reverse('post_list'))
+            self.assertContains(response, webp)
+
+    def test_responsive_image_uses_the_stored_urls(self):
+        with local_media() as storage:
+            post = self.upload_post()
+            with mock.patch.object(storage, 'url') as url:
+                html = Template('{% load blog_images %}{% responsive_image post.image post.image_variants %}').render(
+                    Context({'post': post}))
+            url.assert_not_called()
+            self.assertIn(post.image_variants[0]['url'], html)
+
+    @override_settings(BLOG_MEDIA_URL_MODE='signed', BLOG_MEDIA_SIGNED_URL_MIN_TTL=900)
+    def test_stored_signed_urls_are_signed_again_before_they_expire(self):
+        from .images import stored_url, variant_url
+
+        storage = mock.Mock(querystring_auth=True, querystring_expire=3600)
+        storage.url.side_effect = lambda name, expire=None: f'https://media/{name}?expires={expire}'
+        url, expires = stored_url(storage, 'a.webp')
+        self.assertEqual(url, 'https://media/a.webp?expires=3600')
+        variant = {'name': 'a.webp', 'url': url, 'expires': expires}
+        with mock.patch('blog.images.time.time', return_value=expires - 900):
+            self.assertEqual(variant_url(storage, variant), url)
+        with mock.patch('blog.images.time.time', return_value=expires - 899):
+            self.assertEqual(variant_url(storage, variant), 'https://media/a.webp?expires=None')
+        # variants stored without their expiry
+        self.assertEqual(variant_url(storage, {'name': 'a.webp', 'url': url}), 'https://media/a.webp?expires=None')
+
+    def test_responsive_image_without_variants(self):
+        with local_media():
+            post = self.upload_post()
+            post.image_variants = []
+            html = Template('{% load blog_images %}{% responsive_image post.image post.image_variants %}').render(
+                Context({'post': post}))
+            self.assertIn(f'<img src="{post.image.url}"', html)
+            self.assertNotIn('<source', html)
+
+
+class MediaUrlTests(SimpleTestCase):
+    def setUp(self):
+        # presigning needs no network, only credentials
+        self.storage = PostImagesStorage(access_key='key', secret_key='secret', bucket_name='bucket',
+                                         region_name='fra1', endpoint_url='https://fra1.digitaloceanspaces.com')
+        client = self.storage.bucket.meta.client
+        self.presign = mock.patch.object(client, 'generate_presigned_url', wraps=client.generate_presigned_url)
+
+    @override_settings(BLOG_MEDIA_URL_MODE='signed')
+    def test_signed_urls(self):
+        with self.presign as presign:
+            url = self.storage.url('post_images/a b.jpg')
+            self.storage.url('post_images/a b.jpg')
+        self.assertIn('Signature=', url)
+        self.assertEqual(presign.call_count, 2)
+
+    @override_settings(BLOG_MEDIA_URL_MODE='public')
+    def test_public_urls(self):
+        with override_settings(BLOG_MEDIA_URL_MODE='signed'):
+            signed = self.storage.url('post_images/a b.jpg')
+        self.assertEqual(self.storage.url('post_images/a b.jpg'), self.storage._strip_signing_parameters(signed))
+        with self.presign as presign:
+            self.storage.url('post_images/c.jpg')
+        self.assertEqual(presign.call_count, 0)
+        with override_settings(BLOG_MEDIA_PUBLIC_URL='https://cdn.example.com/'):
+            self.assertEqual(self.storage.url('c.jpg'), 'https://cdn.example.com/post_images/c.jpg')
+
+    @override_settings(BLOG_MEDIA_URL_MODE='cached', BLOG_MEDIA_SIGNED_URL_MIN_TTL=600)
+    def test_cached_urls_expire_before_their_signature(self):
+        with self.presign as presign, mock.patch('blog.storage.time.monotonic', return_value=1000):
+            url = self.storage.url('a.jpg')
+            self.assertEqual(self.storage.url('a.jpg'), url)
+            self.assertEqual(presign.call_count, 1)
+        # reused for querystring_expire (3600) - 600 seconds
+        with self.presign as presign, mock.patch('blog.storage.time.monotonic', return_value=1000 + 2999):
+            self.storage.url('a.jpg')
+            self.assertEqual(presign.call_count, 0)
+        with self.presign as presign, mock.patch('blog.storage.time.monotonic', return_value=1000 + 3000):
+            self.storage.url('a.jpg')
+            self.assertEqual(presign.call_count, 1)
+
+    @override_settings(BLOG_MEDIA_URL_MODE='cached', BLOG_MEDIA_SIGNED_URL_CACHE_SIZE=2)
+    def test_cached_urls_are_bounded(self):
+        for name in ('a.jpg', 'b.jpg', 'c.jpg'):
+            self.storage.url(name)
+        self.assertEqual(list(self.storage.signed_urls), ['b.jpg', 'c.jpg'])
+
+    @override_settings(BLOG_MEDIA_URL_MODE='cached', BLOG_MEDIA_SIGNED_URL_MIN_TTL=3600)
+    def test_short_lived_signatures_are_not_cached(self):
+        self.storage.url('a.jpg')
+        self.assertEqual(self.storage.signed_urls, {})
+
+    @override_settings(BLOG_MEDIA_URL_MODE='public')
+    def test_explicit_expiry_is_signed(self):
+        self.assertIn('Signature=', self.storage.url('a.jpg', expire=60))
+
+
+class s3_media:
+    """Store post images and profile photos in a moto S3 bucket."""
+
+    def __enter__(self):
+        self.aws = mock_aws()
+        self.aws.start()
+        credentials = {'access_key': 'testing', 'secret_key': 'testing', 'bucket_name': 'media',
+                       'region_name': 'us-east-1'}
+        storages = [PostImagesStorage(**credentials), UserPhotoStorage(**credentials)]
+        storages[0].bucket.meta.client.create_bucket(Bucket='media')
+        self.patches = [
+            mock.patch.object(Post._meta.get_field('image'), 'storage', storages[0]),
+            mock.patch.object(Author._meta.get_field('profile_photo'), 'storage', storages[1]),
+        ]
+        for patch in self.patches:
+            patch.start()
+        return storages
+
+    def __exit__(self, *exc_info):
+        for patch in self.patches:
+            patch.stop()
+        self.aws.stop()
+
+
+@unittest.skipIf(mock_aws is None or requests is None, 'moto or requests is not installed')
+@override_settings(BLOG_UPLOAD_MAX_SIZE=1024 * 1024)
+class DirectUploadTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.media = s3_media()
+        self.media.__enter__()
+        self.addCleanup(self.media.__exit__)
+        self.author = Author.objects.create_user(username='author', email='author@example.com', password='pass')
+
+    def upload(self, kind, upload=True, content=None):
+        response = self.client.post(reverse('upload_target'), {'kind': kind, 'content_type': 'image/jpeg'})
+        self.assertEqual(response.status_code, 200)
+        target = response.json()
+        if upload:
+            # what the browser does with the presigned POST
+            content = image_upload().read() if content is None else content
+            sent = requests.post(target['url'], data=target['fields'],
+                                 files={'file': ('photo.jpg', content, 'image/jpeg')})
+            self.assertLess(sent.status_code, 300)
+        return target['key']
+
+    def create_post(self, key):
+        return self.client.post(reverse('create_post'), {'title': 'Post', 'short_description': 's',
+                                                         'full_description': 'f', 'image': key})
+
+    def test_upload_target_checks_kind_and_login(self):
+        response = self.client.post(reverse('upload_target'), {'kind': 'post_image', 'content_type': 'image/jpeg'})
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post(reverse('upload_target'), {'kind': 'profile_photo', 'content_type': 'text/html'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_create_post_with_uploaded_image(self):
+        self.client.force_login(self.author)
+        key = self.upload('post_image')
+        with mock.patch('blog.signals.generate_image_variants') as task, eager_celery(), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.create_post(key)
+        post = Post.objects.get()
+        self.assertRedirects(response, reverse('post_detail', args=[post.pk]), fetch_redirect_response=False)
+        self.assertRegex(post.image.name, r'^post_images/[0-9a-f]{32}\.jpg$')
+        self.assertEqual(post.image.size, len(image_upload().read()))
+        task.apply_async.assert_called_once_with(('post', post.pk), producer=mock.ANY)
+
+    def test_only_the_start_of_uploads_is_read(self):
+        self.client.force_login(self.author)
+        key = self.upload('post_image')
+        client = Post._meta.get_field('image').storage.bucket.meta.client
+        with mock.patch.object(client, 'get_object', wraps=client.get_object) as get_object:
+            self.create_post(key)
+        self.assertTrue(Post.objects.exists())
+        get_object.assert_called_once_with(Bucket='media', Key=mock.ANY, Range='bytes=0-131071')
+
+    def test_rejects_keys_not_uploaded_or_not_issued(self):
+        self.client.force_login(self.author)
+        response = self.create_post(self.upload('post_image', upload=False))
+        self.assertFormError(response.context['form'], 'image', 'The file has not been uploaded yet.')
+        response = self.create_post(self.upload('post_image') + 'x')
+        self.assertFormError(response.context['form'], 'image', 'Invalid upload, please upload the file again.')
+        response = self.create_post(self.upload('profile_photo'))
+        self.assertFormError(response.context['form'], 'image', 'Invalid upload, please upload the file again.')
+        self.assertFalse(Post.objects.exists())
+
+    def test_rejects_keys_of_other_users(self):
+        key = self.upload('profile_photo')
+        self.client.force_login(self.author)
+        response = self.client.post(reverse('edit_profile'), {'username': 'author', 'email': 'author@example.com',
+                                                              'profile_photo': key})
+        self.assertFormError(response.context['profile_form'], 'profile_photo',
+                             'Invalid upload, please upload the file again.')
+
+    def test_rejects_oversized_uploads(self):
+        self.client.force_login(self.author)
+        key = self.upload('post_image')
+        with override_settings(BLOG_UPLOAD_MAX_SIZE=10):
+            response = self.create_post(key)
+        self.assertFormError(response.context['form'], 'image', 'Upload a valid image.')
+
+    def test_rejects_files_that_are_not_images(self):
+        self.client.force_login(self.author)
+        key = self.upload('post_image', content=b'<script>alert(1)</script>')
+        response = self.create_post(key)
+        self.assertFormError(response.context['form'], 'image', 'Upload a valid image.')
+        self.assertFalse(Post.objects.exists())
+        # deleted from the bucket
+        response = self.create_post(key)
+        self.assertFormError(response.context['form'], 'image', 'The file has not been uploaded yet.')
+
+    @override_settings(BLOG_RATE_LIMITS={'upload': {'ip': '2/h', 'user': ''}})
+    def test_upload_target_is_rate_limited(self):
+        self.upload('profile_photo', upload=False)
+        self.upload('profile_photo', upload=False)
+        response = self.client.post(reverse('upload_target'), {'kind': 'profile_photo', 'content_type': 'image/jpeg'})
+        self.assertEqual(response.status_code, 429)
+
+    def test_register_with_uploaded_photo(self):
+        key = self.upload('profile_photo')
+        response = self.client.post(reverse('register'), {
+            'username': 'new', 'email': 'new@example.com', 'password1': 'Secret-pass-1',
+            'password2': 'Secret-pass-1', 'profile_photo': key,
+        })
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+        self.assertTrue(Author.objects.get(username='new').profile_photo.name.startswith('user_photo/'))
+
+    def test_empty_key_keeps_the_image(self):
+        self.client.force_login(self.author)
+        self.create_post(self.upload('post_image'))
+        post = Post.objects.get()
+        name = post.image.name
+        self.client.post(reverse('update_post', args=[post.pk]), {'title': 'Edited', 'short_description': 's',
+                                                                  'full_description': 'f', 'image': ''})
+        post.refresh_from_db()
+        self.assertEqual((post.title, post.image.name), ('Edited', name))
+
+    def test_clear_checkbox_removes_the_profile_photo(self):
+        Author.objects.filter(pk=self.author.pk).update(profile_photo='user_photo/photo.jpg')
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('edit_profile'))
+        self.assertContains(response, 'name="profile_photo-clear"')
+        data = {'username': 'author', 'email': 'author@example.com', 'profile_photo': 'user_photo/photo.jpg'}
+        self.client.post(reverse('edit_profile'), data)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.profile_photo.name, 'user_photo/photo.jpg')
+        response = self.client.post(reverse('edit_profile'), {**data, 'profile_photo-clear': 'on'})
+        self.assertRedirects(response, reverse('edit_profile'), fetch_redirect_response=False)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.profile_photo.name, '')
+
+    def test_resubmitted_edit_form_keeps_the_image(self):
+        self.client.force_login(self.author)
+        self.create_post(self.upload('post_image'))
+        post = Post.objects.get()
+        name = post.image.name
+        form = self.client.get(reverse('update_post', args=[post.pk])).context['form']
+        # the edit form renders the current storage name in the hidden input
+        self.assertEqual(form['image'].value(), post.image)
+        response = self.client.post(reverse('update_post', args=[post.pk]), {
+            'title': 'Edited', 'short_description': 's', 'full_description': 'f', 'image': name,
+        })
+        self.assertRedirects(response, reverse('post_detail', args=[post.pk]), fetch_redirect_response=False)
+        post.refresh_from_db()
+        self.assertEqual((post.title, post.image.name), ('Edited', name))
+
+
+class AsyncViewTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create_user(username='author', email='author@example.com', password='pass')
+        make_posts(cls.author, 15)
+        cls.posts = list(Post.objects.order_by('-published_date', '-id'))
+        Comment.objects.bulk_create(
+            Comment(post=cls.posts[0], author='Guest', text=f'Comment {i}', is_published=True) for i in range(12)
+        )
+
+    async def call(self, view, path, user=None, method='get', data=None, **kwargs):
+        if method == 'post':
+            # AsyncRequestFactory cannot parse its own multipart bodies in Django 4.1
+            request = AsyncRequestFactory().post(path, urlencode(data), content_type='application/x-www-form-urlencoded')
+        else:
+            request = AsyncRequestFactory().get(path, data)
+        request.user = user or AnonymousUser()
+        request.session = {}
+        response = await view(request, **kwargs)
+        if callable(getattr(response, 'render', None)):
+            await sync_to_async(response.render)()
+        return response
+
+    async def test_post_list(self):
+        response = await self.call(async_views.PostListView.as_view(), '/blog/post_list', data={'page': 2})
+        self.assertEqual(list(response.context_data['posts']), self.posts[10:])
+        self.assertEqual(response.context_data['posts'].number, 2)
+        self.assertContains(response, self.posts[10].title)
+
+    @override_settings(BLOG_CURSOR_PAGINATION=True)
+    async def test_post_list_cursor_pages(self):
+        view = async_views.PostListView.as_view()
+        first = (await self.call(view, '/blog/post_list')).context_data['posts']
+        second = (await self.call(view, '/blog/post_list', data={'cursor': first.next_cursor})).context_data['posts']
+        self.assertEqual(list(first) + list(second), self.posts)
+
+    async def test_post_detail(self):
+        view = async_views.PostDetailView.as_view()
+        response = await self.call(view, '/blog/post_detail/', pk=self.posts[0].pk)
+        self.assertEqual(len(response.context_data['page_obj']), 10)
+        self.assertNotIn('is_owner', response.context_data)
+        response = await self.call(view, '/blog/post_detail/', user=self.author, pk=self.posts[0].pk)
+        self.assertTrue(response.context_data['is_owner'])
+        with self.assertRaises(Http404):
+            await self.call(view, '/blog/post_detail/', pk=0)
+
+    async def test_comment_post_uses_sync_view(self):
+        with mock.patch('blog.views.send_new_comment_notification'):
+            response = await self.call(async_views.PostDetailView.as_view(), '/blog/post_detail/', method='post',
+                                       data={'author': 'Bob', 'text': 'Async comment'}, pk=self.posts[1].pk)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(await Comment.objects.filter(text='Async comment').aexists())
+
+    async def test_user_posts_and_profile(self):
+        response = await self.call(async_views.UserPostListView.as_view(), '/blog/user/', username='author')
+        self.assertEqual(len(response.context_data['posts']), 10)
+        self.assertEqual(response.context_data['user_profile'], self.author)
+        response = await self.call(async_views.user_profile, '/blog/profile/', username='author')
+        self.assertContains(response, 'author')
+        with self.assertRaises(Http404):
+            await self.call(async_views.user_profile, '/blog/profile/', username='nobody')
+
+    async def test_anonymous_pages_are_cached(self):
+        view = async_views.PostListView.as_view()
+        first = await self.call(view, '/blog/post_list')
+        second = await self.call(view, '/blog/post_list')
+        self.assertFalse(hasattr(second, 'context_data'))
+        self.assertEqual(second.content, first.content)
+
+
+class ApiTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create_user(username='author', email='author@example.com', password='pass',
+                                                bio='Writes things')
+        cls.posts = make_posts(cls.author, 25)
+        make_posts(cls.author, 2, is_published=False)
+        Comment.objects.bulk_create(Comment(post=cls.posts[0], author='Guest', text=f'Comment {i}', is_published=True)
+                                    for i in range(3))
+
+    def test_post_list_pages_and_fields(self):
+        response = self.client.get(reverse('api:post_list'), {'fields': 'title,id', 'page_size': 10})
+        data = response.json()
+        self.assertEqual(data['count'], 25)
+        self.assertEqual(data['results'][0], {'id': self.posts[0].pk, 'title': self.posts[0].title})
+        self.assertEqual(len(data['results']), 10)
+        data = self.client.get(data['next']).json()
+        expected = Post.objects.filter(is_published=True).order_by('-published_date', '-id')[10]
+        self.assertEqual(data['results'][0]['id'], expected.pk)
+        self.assertIn('fields=title', data['previous'])
+
+    def test_post_list_cursor_pages(self):
+        expected = list(Post.objects.filter(is_published=True).order_by('-published_date', '-id')
+                        .values_list('pk', flat=True))
+        with override_settings(BLOG_CURSOR_PAGINATION=True):
+            url, seen = reverse('api:post_list') + '?fields=id&page_size=10', []
+            while url:
+                data = self.client.get(url).json()
+                self.assertNotIn('count', data)
+                seen += [post['id'] for post in data['results']]
+                url = data['next']
+        self.assertEqual(seen, expected)
+
+    def test_unknown_field(self):
+        response = self.client.get(reverse('api:post_list'), {'fields': 'title,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Unknown fields: password'})
+
+    def test_post_detail_with_comments(self):
+        data = self.client.get(reverse('api:post_detail', args=[self.posts[0].pk])).json()
+        self.assertEqual(data['author'], 'author')
+        self.assertEqual(data['full_description'], 'full')
+        self.assertEqual(data['comment_count'], 0)
+        self.assertEqual([comment['text'] for comment in data['comments']['results']],
+                         ['Comment 2', 'Comment 1', 'Comment 0'])
+        # Last-Modified and the post, no comments
+        with self.assertNumQueries(2):
+            data = self.client.get(reverse('api:post_detail', args=[self.posts[0].pk]), {'fields': 'title'}).json()
+        self.assertEqual(data, {'title': self.posts[0].title})
+
+    def test_unpublished_and_missing(self):
+        draft = Post.objects.filter(is_published=False).first()
+        for url in [reverse('api:post_detail', args=[draft.pk]), reverse('api:author_detail', args=['nobody'])]:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response.json(), {'error': 'Not found.'})
+
+    def test_author_profile(self):
+        data = self.client.get(reverse('api:author_detail', args=['author'])).json()
+        self.assertEqual(data['bio'], 'Writes things')
+        self.assertIsNone(data['profile_photo'])
+        self.assertNotIn('email', data)
+        posts = self.client.get(data['posts'] + '&fields=author').json()
+        self.assertEqual(posts['count'], 25)
+
+    def test_etag_answers_repeat_polls_without_queries(self):
+        url = reverse('api:post_detail', args=[self.posts[0].pk])
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Comment.objects.create(post=self.posts[0], author='Guest', text='New comment', is_published=True)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_edits_change_list_and_author_etags(self):
+        list_url = reverse('api:post_list')
+        author_url = reverse('api:author_detail', args=['author'])
+        etags = [self.client.get(url)['ETag'] for url in (list_url, author_url)]
+        self.posts[3].title = 'Edited'
+        self.posts[3].save()
+        self.author.refresh_from_db()
+        self.author.bio = 'New bio'
+        self.author.save()
+        for url, etag in zip((list_url, author_url), etags):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_comment_moderation_changes_list_etag(self):
+        from .admin import CommentAdmin
+
+        url = reverse('api:post_list') + '?fields=id,comment_count'
+        comment = Comment.objects.create(post=self.posts[1], author='Guest', text='Awaiting moderation')
+        etag = self.client.get(url)['ETag']
+        request = RequestFactory().post('/')
+        request._messages = mock.Mock()
+        with mock.patch('blog.admin.notify_post_owners'), mock.patch('blog.admin.dispatch'):
+            CommentAdmin(Comment, site).make_published(request, Comment.objects.filter(pk=comment.pk))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn({'id': self.posts[1].pk, 'comment_count': 1}, response.json()['results'])
+
+    @override_settings(BLOG_MEDIA_URL_MODE='signed')
+    def test_validators_expire_with_image_urls(self):
+        url = reverse('api:post_list')
+        lifetime = PostImagesStorage().querystring_expire
+        # periods after the posts' publication
+        start = (int(time.time()) // lifetime + 10) * lifetime
+        with mock.patch('blog.api.views.time.time', return_value=start):
+            response = self.client.get(url)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        with mock.patch('blog.api.views.time.time', return_value=start + lifetime):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+                             200)
+        with override_settings(BLOG_MEDIA_URL_MODE='public'), \
+                mock.patch('blog.api.views.time.time', return_value=start + lifetime):
+            etag = self.client.get(url)['ETag']
+        with override_settings(BLOG_MEDIA_URL_MODE='public'), \
+                mock.patch('blog.api.views.time.time', return_value=start + 2 * lifetime):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_last_modified_follows_published_date(self):
+        url = reverse('api:post_list')
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE='Mon, 01 Jan 2001 00:00:00 GMT').status_code,
+                         200)
+
+
+class FeedTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create_user(username='author', email='author@example.com', password='pass')
+        cls.other = Author.objects.create_user(username='other', email='other@example.com', password='pass')
+        cls.posts = make_posts(cls.author, 3)
+        make_posts(cls.other, 2)
+        make_posts(cls.author, 1, is_published=False)
+
+    def test_formats(self):
+        response = self.client.get(reverse('posts_rss'))
+        self.assertEqual(response['Content-Type'], 'application/rss+xml; charset=utf-8')
+        self.assertEqual(response.content.count(b'<item>'), 5)
+        response = self.client.get(reverse('posts_atom'))
+        self.assertEqual(response.content.count(b'<entry>'), 5)
+        data = self.client.get(reverse('posts_json')).json()
+        self.assertEqual(data['version'], 'https://jsonfeed.org/version/1.1')
+        self.assertEqual(len(data['items']), 5)
+        latest = Post.objects.filter(is_published=True).latest('published_date', 'id')
+        self.assertEqual(data['items'][0]['url'], 'http://testserver' + reverse('post_detail', args=[latest.pk]))
+        self.assertEqual(data['items'][0]['content_text'], 'full')
+
+    def test_author_feed(self):
+        data = self.client.get(reverse('user_posts_json', args=['author'])).json()
+        expected = Post.objects.filter(owner=self.author, is_published=True).order_by('-published_date', '-id')
+        self.assertEqual([item['title'] for item in data['items']], [post.title for post in expected])
+        self.assertEqual({item['authors'][0]['name'] for item in data['items']}, {'author'})
+        self.assertEqual(self.client.get(reverse('user_posts_rss', args=['nobody'])).status_code, 404)
+
+    def test_feed_is_generated_once_per_change(self):
+        url = reverse('posts_atom')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        self.posts[0].title = 'Edited title'
+        self.posts[0].save()
+        self.assertContains(self.client.get(url), 'Edited title')
+        Comment.objects.create(post=self.posts[0], author='Guest', text='Comment', is_published=True)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_conditional_requests(self):
+        url = reverse('user_posts_rss', args=['author'])
+        response = self.client.get(url)
+        last_modified, etag = response['Last-Modified'], response['ETag']
+        with self.assertNumQueries(0), mock.patch('blog.feeds.cache.get', wraps=cache.get) as cache_get:
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # only the generation time is read, not the feed
+        self.assertNotIn(mock.call(FEED_KEY_PREFIX + etag.strip('"')), cache_get.call_args_list)
+        self.assertIn(mock.call(FEED_KEY_PREFIX + etag.strip('"') + ':modified'), cache_get.call_args_list)
+        Post.objects.create(owner=self.author, title='New post', short_description='short', full_description='full',
+                            is_published=True)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'New post')
+        # other authors' feeds are not regenerated
+        self.client.get(reverse('user_posts_rss', args=['other']))
+        Post.objects.create(owner=self.author, title='Another post', short_description='short',
+                            full_description='full', is_published=True)
+        with self.assertNumQueries(0):
+            self.client.get(reverse('user_posts_rss', args=['other']))
+
+    def test_pages_link_their_feeds(self):
+        self.assertContains(self.client.get(reverse('post_list')), reverse('posts_atom'))
+        self.assertContains(self.client.get(reverse('user_posts', args=['author'])),
+                            reverse('user_posts_json', args=['author']))
+
+
+@override_settings(BLOG_METRICS_SAMPLE_RATE=1, BLOG_METRICS_FLUSH_INTERVAL=0, BLOG_METRICS_TOKEN='secret',
+                   CACHES={'default': {'BACKEND': 'blog.instrumentation.LocMemCache'}})
+class PerformanceMiddlewareTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create_user(username='author', email='author@example.com', password='pass')
+        cls.posts = make_posts(cls.author, 3)
+
+    def setUp(self):
+        super().setUp()
+        metrics.clear()
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        return dict(line.rsplit(' ', 1) for line in response.content.decode().splitlines()
+                    if not line.startswith('#'))
+
+    def test_records_per_view(self):
+        response = self.client.get(reverse('post_list'))
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, sql;dur=[\d.]+;desc="\d+ queries", '
+                                                    r'cache;desc="\d+ hits \d+ misses", template;dur=[\d.]+$')
+        self.client.get(reverse('post_list'))
+        self.client.get(reverse('post_detail', args=[self.posts[0].pk]))
+        samples = self.scrape()
+        self.assertEqual(samples['blog_request_duration_seconds_count{view="post_list"}'], '2')
+        self.assertEqual(samples['blog_request_duration_seconds_bucket{view="post_list",le="+Inf"}'], '2')
+        self.assertEqual(samples['blog_request_duration_seconds_count{view="post_detail"}'], '1')
+        self.assertGreater(int(samples['blog_request_sql_queries_total{view="post_list"}']), 0)
+        self.assertGreater(float(samples['blog_request_template_seconds_total{view="post_list"}']), 0)
+        # the first request misses the page cache and the second one hits it
+        self.assertGreaterEqual(int(samples['blog_request_cache_hits_total{view="post_list"}']), 1)
+        self.assertGreaterEqual(int(samples['blog_request_cache_misses_total{view="post_list"}']), 1)
+
+    def test_cache_hit_takes_no_sql_or_template_time(self):
+        url = reverse('post_detail', args=[self.posts[0].pk])
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertIn('sql;dur=0.0;desc="0 queries"', response['Server-Timing'])
+        self.assertIn('template;dur=0.0', response['Server-Timing'])
+
+    def test_unsampled_requests(self):
+        with override_settings(BLOG_METRICS_SAMPLE_RATE=0):
+            response = self.client.get(reverse('post_list'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('blog_request_duration_seconds_count{view="post_list"}', self.scrape())
+
+    def test_buffered_until_flush(self):
+        with override_settings(BLOG_METRICS_FLUSH_INTERVAL=3600):
+            metrics.flush()
+            self.client.get(reverse('post_list'))
+            self.assertIsNone(cache.get('blog:metrics:blog_request_duration_seconds_count{view="post_list"}'))
+            self.assertEqual(self.scrape()['blog_request_duration_seconds_count{view="post_list"}'], '1')
+
+    async def test_async_requests(self):
+        response = await self.async_client.get(reverse('post_list'))
+        self.assertNotIn('desc="0 queries"', response['Server-Timing'])
+
+    def test_processes_index_their_series_concurrently(self):
+        first, second = Metrics(), Metrics()
+        first.inc('blog_rate_limited_total', view='comment')
+        second.inc('blog_rate_limited_total', view='contact')
+        # both found the series unindexed before either added it
+        with mock.patch('blog.metrics.cache.get_many', return_value={}):
+            first.flush()
+            second.flush()
+            second.index(['blog_rate_limited_total{view="comment"}'])
+        samples = self.scrape()
+        self.assertEqual(samples['blog_rate_limited_total{view="comment"}'], '1')
+        self.assertEqual(samples['blog_rate_limited_total{view="contact"}'], '1')
+        self.assertEqual(metrics.series()[:2], ['blog_rate_limited_total{view="comment"}',
+                                                'blog_rate_limited_total{view="contact"}'])
+
+    def test_metrics_access(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.client.force_login(Author.objects.create_user(username='staff', email='staff@example.com',
+                                                           is_staff=True))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+
+@override_settings(BLOG_METRICS_FLUSH_INTERVAL=0)
+class TaskMetricsTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.clear()
+
+    def samples(self):
+        return dict(line.rsplit(' ', 1) for line in metrics.render().splitlines() if not line.startswith('#'))
+
+    def test_queue_latency_run_time_and_email_time(self):
+        from .tasks import send_contact_email
+
+        with eager_celery():
+            send_contact_email.apply_async(('Bob', 'bob@example.com', 'Hi'), headers={SENT_AT_HEADER: time.time() - 2})
+        self.assertEqual(len(mail.outbox), 1)
+        samples = self.samples()
+        task = 'task="blog.tasks.send_contact_email"'
+        self.assertEqual(samples[f'blog_task_queue_seconds_count{{{task}}}'], '1')
+        self.assertGreaterEqual(float(samples[f'blog_task_queue_seconds_sum{{{task}}}']), 2)
+        self.assertEqual(samples[f'blog_task_queue_seconds_bucket{{{task},le="1"}}'], '0')
+        self.assertEqual(samples[f'blog_task_run_seconds_count{{{task}}}'], '1')
+        self.assertEqual(samples[f'blog_task_email_seconds_count{{{task}}}'], '1')
+        self.assertEqual(samples[f'blog_tasks_total{{{task},state="SUCCESS"}}'], '1')
+
+    def test_eta_is_not_queue_time(self):
+        request = mock.Mock(headers={SENT_AT_HEADER: 100.0},
+                            eta=datetime.datetime.fromtimestamp(160, datetime.timezone.utc).isoformat())
+        del request.blog_sent_at
+        self.assertEqual(task_sent_at(request), 160)
+
+    def test_publish_stamps_the_sent_time(self):
+        headers = {}
+        stamp_sent_at(headers=headers)
+        self.assertAlmostEqual(headers[SENT_AT_HEADER], time.time(), delta=5)
+
+    @mock.patch('blog.tasks.deliver', side_effect=ConnectionRefusedError)
+    def test_failures(self, deliver):
+        from .tasks import send_new_post_notification
+
+        with eager_celery():
+            send_new_post_notification.delay(1)
+            send_new_post_notification.delay(2)
+        samples = self.samples()
+        task = 'task="blog.tasks.send_new_post_notification"'
+        self.assertEqual(samples[f'blog_task_failures_total{{{task},exception="ConnectionRefusedError"}}'], '2')
+        self.assertEqual(samples[f'blog_tasks_total{{{task},state="FAILURE"}}'], '2')
+        self.assertEqual(samples[f'blog_task_run_seconds_count{{{task}}}'], '2')
+        # eager tasks are not published, there is no queue time to record
+        self.assertNotIn(f'blog_task_queue_seconds_count{{{task}}}', samples)
+
+    def test_nested_eager_tasks_keep_their_caller(self):
+        from .tasks import notify_post_owners
+
+        author = Author.objects.create_user(username='author', email='author@example.com')
+        post = make_posts(author, 1)[0]
+        comment = Comment.objects.create(post=post, author='Guest', text='Hi', is_published=True)
+        with eager_celery(), override_settings(BLOG_NOTIFICATION_DIGEST_WINDOWS={}), \
+                self.captureOnCommitCallbacks(execute=True):
+            notify_post_owners([(comment.pk, author.pk)])
+        samples = self.samples()
+        self.assertEqual(samples['blog_task_email_seconds_count{task="blog.tasks.send_user_emails"}'], '1')
+
+
+class BenchmarkCommandTests(BlogTestCase):
+    def test_measures_every_scenario_and_compares_with_baseline(self):
+        from .management.commands.benchmark import Command, compare
+
+        author = Author.objects.create_user(username='author', email='author@example.com')
+        posts = make_posts(author, 15)
+        Comment.objects.bulk_create(Comment(post=posts[0], author='Guest', text=f'Comment {i}', is_published=True)
+                                    for i in range(25))
+        with self.assertRaisesMessage(CommandError, 'pass --allow-writes'):
+            call_command('benchmark', requests=3, stdout=io.StringIO())
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as output:
+            fetch = Command.fetch
+
+            def fetch_while_a_reader_comments(command, request, url, data):
+                # a real comment submitted while the benchmark runs
+                if not Comment.objects.filter(author='Reader').exists():
+                    Comment.objects.create(post=posts[1], author='Reader', text='Real comment')
+                return fetch(command, request, url, data)
+
+            with mock.patch.object(Command, 'fetch', fetch_while_a_reader_comments):
+                call_command('benchmark', requests=3, memory_requests=1, export_rows=5, output=output.name,
+                             allow_writes=True, stdout=io.StringIO())
+            results = json.load(output)
+        self.assertEqual(set(results['scenarios']), {'post_list', 'post_list_deep', 'post_detail', 'post_detail_deep',
+                                                     'user_posts', 'comment_submit', 'admin_export'})
+        for measured in results['scenarios'].values():
+            self.assertLessEqual(measured['p50_ms'], measured['p99_ms'])
+            self.assertGreater(measured['queries'], 0)
+            self.assertGreater(measured['peak_kib'], 0)
+        # submitted comments and the admin user are removed, other comments are kept
+        self.assertEqual(Comment.objects.count(), 26)
+        self.assertFalse(Author.objects.filter(username='benchmark-admin').exists())
+
+        self.assertEqual(compare(results, results, 0), [])
+        slower = json.loads(json.dumps(results))
+        slower['scenarios']['post_list']['p95_ms'] *= 2
+        slower['scenarios']['user_posts']['queries'] += 1
+        self.assertEqual(len(compare(slower, results, 0.2)), 2)
+
+
+def redis_available(url):
+    try:
+        return redis.Redis.from_url(url, socket_connect_timeout=0.2).ping()
+    except redis.RedisError:
+        return False
+
+
+@override_settings(BLOG_COMMENT_QUEUE='local', BLOG_COMMENT_QUEUE_BATCH_SIZE=3, BLOG_COMMENT_QUEUE_CLAIM_AFTER=0)
+class CommentIngestionTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create_user(username='author', email='author@example.com')
+        cls.post = make_posts(cls.author, 1)[0]
+
+    def setUp(self):
+        super().setUp()
+        ingestion._queues.clear()
+
+    def submit(self, count):
+        for i in range(count):
+            response = self.client.post(reverse('post_detail', args=[self.post.pk]),
+                                        {'author': 'Reader', 'text': f'Comment {i}'})
+            self.assertRedirects(response, reverse('post_detail', args=[self.post.pk]) + '?comment=pending')
+
+    def ingested_texts(self):
+        return list(Comment.objects.order_by('pk').values_list('text', flat=True))
+
+    def test_local_queue_delivers_unacknowledged_entries_again_first(self):
+        queue = ingestion.LocalQueue()
+        for i in range(4):
+            queue.push({'n': i})
+        first = queue.read(2, claim_after=60)
+        self.assertEqual([entry['n'] for _, entry in first], [0, 1])
+        self.assertEqual([entry['n'] for _, entry in queue.read(5, claim_after=60)], [2, 3])
+        self.assertEqual(queue.read(5, claim_after=60), [])
+        queue.ack([first[0][0]])
+        # entry 1 was never acknowledged and comes back ahead of the newer ones
+        self.assertEqual([entry['n'] for _, entry in queue.read(5, claim_after=0)], [1, 2, 3])
+
+    def test_submissions_are_pending_until_ingested_in_order(self):
+        self.submit(7)
+        self.assertEqual(Comment.objects.count(), 0)
+        response = self.client.get(reverse('post_detail', args=[self.post.pk]), {'comment': 'pending'})
+        self.assertContains(response, 'awaiting moderation')
+
+        from .tasks import ingest_comments, send_new_comment_notifications
+
+        with mock.patch.object(send_new_comment_notifications, 'delay') as delay:
+            self.assertEqual(ingest_comments(), 7)
+        self.assertEqual(self.ingested_texts(), [f'Comment {i}' for i in range(7)])
+        self.assertFalse(Comment.objects.filter(is_published=True).exists())
+        self.assertEqual(Comment.objects.filter(author='Guest Reader').count(), 7)
+        # one notification task per batch of BLOG_COMMENT_QUEUE_BATCH_SIZE
+        self.assertEqual([len(call.args[0]) for call in delay.call_args_list], [3, 3, 1])
+        self.assertEqual(ingest_comments(), 0)
+
+    def test_batch_notifications_are_delivered_together(self):
+        self.submit(2)
+        from .tasks import ingest_comments
+
+        with eager_celery(), override_settings(BLOG_NOTIFICATION_DIGEST_WINDOWS={}):
+            ingest_comments()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertIn(reverse('post_detail', args=[self.post.pk]), mail.outbox[0].body)
+
+    def test_failed_batch_is_delivered_again(self):
+        self.submit(4)
+        with mock.patch.object(Comment.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                ingestion.drain_comment_queue()
+        self.assertEqual(Comment.objects.count(), 0)
+        self.assertEqual(ingestion.drain_comment_queue(), 4)
+        self.assertEqual(self.ingested_texts(), [f'Comment {i}' for i in range(4)])
+
+    def test_redelivered_submissions_are_inserted_once(self):
+        self.submit(2)
+        notify = mock.Mock()
+        # the acknowledgement is lost after the comments were committed
+        with mock.patch.object(ingestion.LocalQueue, 'ack'):
+            self.assertEqual(ingestion.drain_comment_queue(notify), 2)
+        self.assertEqual(ingestion.drain_comment_queue(notify), 0)
+        self.assertEqual(Comment.objects.count(), 2)
+        self.assertEqual(notify.call_count, 1)
+        self.assertEqual(ingestion.comment_queue().read(5, claim_after=0), [])
+
+    def test_only_the_comments_a_consumer_inserted_are_notified(self):
+        self.submit(3)
+        first = ingestion.comment_queue().read(1, claim_after=60)[0][1]
+        bulk_create = Comment.objects.bulk_create
+
+        def concurrent_insert(comments, **kwargs):
+            # a consumer that claimed the same entries commits one of them meanwhile
+            Comment.objects.create(post=self.post, author='Guest Reader', text=first['text'],
+                                   submission_id=first['id'])
+            return bulk_create(comments, **kwargs)
+
+        notify = mock.Mock()
+        with mock.patch.object(Comment.objects, 'bulk_create', side_effect=concurrent_insert):
+            with self.assertRaises(IntegrityError):
+                ingestion.drain_comment_queue(notify)
+        notify.assert_not_called()
+        Comment.objects.create(post=self.post, author='Guest Reader', text=first['text'], submission_id=first['id'])
+        self.assertEqual(ingestion.drain_comment_queue(notify), 2)
+        notify.assert_called_once_with(list(Comment.objects.exclude(submission_id=first['id'])
+                                            .order_by('pk').values_list('pk', flat=True)))
+
+    def test_local_queue_is_drained_by_the_web_process(self):
+        from .tasks import send_new_comment_notifications
+
+        with mock.patch.object(send_new_comment_notifications, 'delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.submit(2)
+        self.assertEqual(self.ingested_texts(), ['Comment 0', 'Comment 1'])
+        self.assertEqual(sum(len(call.args[0]) for call in delay.call_args_list), 2)
+
+    def test_pages_and_index_are_updated_after_the_batch_commits(self):
+        self.submit(2)
+        with mock.patch.object(ingestion, 'bump_scopes') as bump_scopes, \
+                mock.patch.object(ingestion, 'search_backend') as search_backend:
+            with self.captureOnCommitCallbacks() as callbacks:
+                ingestion.drain_comment_queue()
+            bump_scopes.assert_not_called()
+            search_backend.return_value.index.assert_not_called()
+            for callback in callbacks:
+                callback()
+        created = list(Comment.objects.order_by('pk').values_list('pk', flat=True))
+        search_backend.return_value.index.assert_called_once_with(Comment, created)
+        self.assertIn(count_scope(Comment), bump_scopes.call_args.args[0])
+
+    def test_submissions_to_deleted_posts_are_dropped(self):
+        self.submit(1)
+        Post.objects.filter(pk=self.post.pk).delete()
+        self.assertEqual(ingestion.drain_comment_queue(), 0)
+        self.assertEqual(ingestion.comment_queue().read(5, claim_after=0), [])
+
+    @override_settings(BLOG_COMMENT_QUEUE='')
+    def test_without_queue_comments_are_saved_by_the_request(self):
+        with eager_celery():
+            response = self.client.post(reverse('post_detail', args=[self.post.pk]),
+                                        {'author': 'Reader', 'text': 'Now'})
+        self.assertRedirects(response, reverse('post_detail', args=[self.post.pk]))
+        self.assertEqual(self.ingested_texts(), ['Now'])
+
+    @unittest.skipUnless(redis_available('redis://localhost:6379/15'), 'needs a Redis server on localhost:6379')
+    def test_redis_stream_queue(self):
+        queue = ingestion.RedisStreamQueue('redis://localhost:6379/15')
+        queue.client.delete(ingestion.STREAM_KEY)
+        for i in range(3):
+            queue.push({'n': i})
+        first = queue.read(2, claim_after=60)
+        self.assertEqual([entry['n'] for _, entry in first], [0, 1])
+        queue.ack([first[0][0]])
+        self.assertEqual([entry['n'] for _, entry in queue.read(5, claim_after=0)], [1, 2])
+        queue.client.delete(ingestion.STREAM_KEY)
+
+
+class DispatchTests(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        from .tasks import send_new_post_notification
+
+        self.task = send_new_post_notification
+        patcher = mock.patch.object(send_new_post_notification, 'apply_async')
+        self.apply_async = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sent(self):
+        return [call.args[0] for call in self.apply_async.call_args_list]
+
+    def test_waits_for_the_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            dispatch(self.task, 1)
+            self.assertEqual(self.sent(), [])
+            try:
+                with transaction.atomic():
+                    dispatch(self.task, 2)
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+        # the rolled back call is never sent
+        self.assertEqual(self.sent(), [(1,)])
+
+    def test_request_publishes_its_calls_once_through_one_producer(self):
+        def view(request):
+            with self.captureOnCommitCallbacks(execute=True):
+                dispatch(self.task, 1)
+                dispatch(self.task, 2)
+                dispatch(self.task, 1)
+            self.assertEqual(self.sent(), [])
+            return HttpResponse()
+
+        dispatch_middleware(view)(RequestFactory().get('/'))
+        self.assertEqual(self.sent(), [(1,), (2,)])
+        self.assertEqual(len({id(call.kwargs['producer']) for call in self.apply_async.call_args_list}), 1)
+
+    def test_calls_committed_after_the_response_are_sent_right_away(self):
+        def view(request):
+            dispatch(self.task, 1)
+            return HttpResponse()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            dispatch_middleware(view)(RequestFactory().get('/'))
+            self.assertEqual(self.sent(), [])
+        self.assertEqual(self.sent(), [(1,)])
+
+    def test_post_notification_is_sent_when_published_not_on_edits(self):
+        author = Author.objects.create_user(username='author', email='author@example.com', password='pass')
+        post = make_posts(author, 1, is_published=False)[0]
+        self.client.force_login(author)
+        data = {'title': 'Post', 'short_description': 's', 'full_description': 'f'}
+        for edit in (data, {**data, 'is_published': 'on'}, {**data, 'title': 'Edited', 'is_published': 'on'}):
+            with eager_celery(), self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('update_post', args=[post.pk]), edit)
+        self.assertEqual(self.sent(), [(post.pk,)])
+
+
+class ConnectionPoolTests(BlogTestCase):
+    def test_threads_share_at_most_size_connections(self):
+        pool = ConnectionPool(2)
+        lent = []
+        lock = threading.Lock()
+
+        def worker():
+            for _ in range(5):
+                pool.acquire()
+                try:
+                    with connections['default'].cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                    with lock:
+                        lent.append(connections['default'])
+                finally:
+                    pool.release()
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        pool.close()
+        self.assertEqual(len(lent), 20)
+        self.assertLessEqual(len({id(connection) for connection in lent}), 2)
+
+    @override_settings(BLOG_CELERY_DB_POOL_SIZE=4)
+    def test_pool_is_only_installed_for_threaded_workers(self):
+        self.addCleanup(setattr, dbpool, '_pool', None)
+        dbpool.install_pool(sender=mock.Mock(pool_cls='prefork'))
+        self.assertIsNone(dbpool._pool)
+        dbpool.install_pool(sender=mock.Mock(pool_cls='threads'))
+        self.assertIsInstance(dbpool._pool, ConnectionPool)
+        # forked children drop the pool of their parent
+        dbpool._pool.pid = -1
+        dbpool.reset_pool()
+        self.assertIsNone(dbpool._pool)
+
+    def test_benchmark_command(self):
+        output = io.StringIO()
+        call_command('benchmark_connections', requests=2, tasks=2, threads=2, pool_size=1, stdout=output)
+        self.assertIn('CONN_MAX_AGE=60 pool of 1', output.getvalue())
+
+
+class AuthorStatsTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create_user(username='author', email='author@example.com', password='pass')
+        cls.other = Author.objects.create_user(username='other', email='other@example.com', password='pass')
+        cls.posts = make_posts(cls.author, 3)
+        make_posts(cls.author, 2, is_published=False)
+        cls.comments = Comment.objects.bulk_create(Comment(post=cls.posts[0], author='Guest', text='text')
+                                                   for _ in range(4))
+        Comment.objects.filter(pk__in=[comment.pk for comment in cls.comments[:3]]).update(is_published=True)
+        recount(Post.objects.all())
+
+    def test_compute_stats(self):
+        stats = compute_stats([self.author.pk, self.other.pk])
+        self.assertEqual(stats[self.other.pk], EMPTY_STATS)
+        latest = Post.objects.filter(owner=self.author, is_published=True).latest('published_date')
+        self.assertEqual(stats[self.author.pk], {'posts': 5, 'published_posts': 3, 'unpublished_posts': 2,
+                                                 'comments_received': 3, 'last_post_date': latest.published_date})
+
+    def test_stats_follow_deleted_comments(self):
+        refresh_stats([self.author.pk])
+        with eager_celery(), self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.get(pk=self.comments[0].pk).delete()
+        self.assertEqual(author_stats(self.author)['comments_received'], 2)
+
+    def test_warmed_profile_pages_run_no_aggregate(self):
+        output = io.StringIO()
+        call_command('warm_author_stats', batch_size=1, stdout=output)
+        self.assertIn('Successfully warmed the stats of 2 authors, 2 changed', output.getvalue())
+        self.client.force_login(self.author)
+        for url in (reverse('user_profile', args=[self.author.username]),
+                    reverse('user_posts', args=[self.author.username])):
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertRegex(response.content.decode(), r'(?i)comments received:(</strong>)? 3')
+            for query in captured:
+                self.assertNotRegex(query['sql'], r'SUM\(|MAX\(')
+        self.assertContains(response, '<strong>Posts:</strong> 3')
+        response = self.client.get(reverse('user_profile', args=[self.author.username]))
+        self.assertContains(response, 'Posts: 3 (2 unpublished)')
+
+    def test_stats_follow_publishing_and_new_posts(self):
+        from .admin import CommentAdmin
+
+        refresh_stats([self.author.pk, self.other.pk])
+        request = RequestFactory().post('/')
+        request.user = self.author
+        request._messages = mock.Mock()
+        with eager_celery(), self.captureOnCommitCallbacks(execute=True), \
+                mock.patch('blog.admin.notify_post_owners'):
+            CommentAdmin(Comment, site).make_published(request, Comment.objects.filter(pk=self.comments[3].pk))
+        self.assertEqual(author_stats(self.author)['comments_received'], 4)
+
+        with eager_celery(), self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(owner=self.other, title='New', short_description='s', full_description='f',
+                                is_published=True)
+        self.assertEqual(author_stats(self.other)['published_posts'], 1)
+        with mock.patch('blog.signals.dispatch') as dispatch:
+            Comment.objects.create(post=self.posts[1], author='Guest', text='awaiting moderation')
+        dispatch.assert_not_called()
+
+    def test_only_changed_authors_invalidate_their_pages(self):
+        refresh_stats([self.author.pk, self.other.pk])
+        with mock.patch('blog.stats.bump_scopes') as bump:
+            self.assertEqual(refresh_stats([self.author.pk, self.other.pk]), 0)
+            Post.objects.filter(owner=self.author).update(is_published=True)
+            self.assertEqual(refresh_stats([], [self.posts[0].pk]), 1)
+        bump.assert_called_once_with([author_scope(self.author.username)])
+
+
+@override_settings(BLOG_RATE_LIMITS={'comment': {'ip': '3/m', 'user': '2/m'}, 'contact': {'ip': '1/h', 'user': ''}})
+class RateLimitTests(BlogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create_user(username='author', email='author@example.com', password='pass')
+        cls.post = make_posts(cls.author, 1)[0]
+
+    def comment(self, ip='10.0.0.1'):
+        with eager_celery():
+            return self.client.post(reverse('post_detail', args=[self.post.pk]), {'author': 'Bob', 'text': 'Spam'},
+                                    REMOTE_ADDR=ip)
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('10/m'), (10, 60))
+        self.assertEqual(parse_rate('100/5m'), (100, 300))
+        with self.assertRaises(ValueError):
+            parse_rate('10 per minute')
+
+    def test_sliding_window(self):
+        limits = [('test', 3, 60)]
+        self.assertEqual([hit(limits, now=120 + i) for i in range(4)], [0, 0, 0, 57])
+        # half of the previous period still overlaps the window: 4 * 0.5 + 1 requests
+        self.assertEqual(hit(limits, now=210), 0)
+        self.assertEqual(hit(limits, now=210), 30)
+        self.assertEqual(hit(limits, now=300), 0)
+
+    def test_comments_are_limited_per_ip(self):
+        self.assertEqual([self.comment().status_code for _ in range(4)], [302, 302, 302, 429])
+        response = self.comment()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(self.comment(ip='10.0.0.2').status_code, 302)
+        self.assertEqual(Comment.objects.count(), 4)
+        # reading the post is not limited
+        self.assertEqual(self.client.get(reverse('post_detail', args=[self.post.pk]),
+                                         REMOTE_ADDR='10.0.0.1').status_code, 200)
+
+    def test_logged_in_users_are_limited_across_addresses(self):
+        self.client.force_login(self.author)
+        statuses = [self.comment(ip=f'10.0.0.{i}').status_code for i in range(3)]
+        self.assertEqual(statuses, [302, 302, 429])
+
+    def test_contact_is_limited(self):
+        data = {'name': 'Bob', 'email': 'bob@example.com', 'message': 'Hi'}
+        with eager_celery():
+            self.assertEqual(self.client.post(reverse('contact_us'), data).status_code, 200)
+            self.assertEqual(self.client.post(reverse('contact_us'), data).status_code, 429)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(self.client.get(reverse('contact_us')).status_code, 200)
+
+    def test_redis_client_of_the_cache(self):
+        from .ratelimit import redis_client
+
+        self.assertIsNone(redis_client())
+        redis_cache = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                   'LOCATION': 'redis://primary:6380/3,redis://replica:6380/3',
+                                   'OPTIONS': {'socket_timeout': 2}}}
+        with override_settings(CACHES=redis_cache):
+            client = redis_client()
+            self.assertIs(redis_client(), client)
+        connection = client.connection_pool.connection_kwargs
+        self.assertEqual((connection['host'], connection['port'], connection['db'], connection['socket_timeout']),
+                         ('primary', 6380, 3, 2))
+
+    @unittest.skipUnless(redis_available('redis://localhost:6379/15'), 'needs a Redis server on localhost:6379')
+    def test_redis_pipeline(self):
+        redis_cache = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                   'LOCATION': 'redis://localhost:6379/15', 'KEY_PREFIX': 'ratelimit-test'}}
+        with override_settings(CACHES=redis_cache):
+            limits = [(f'redis-{time.time()}', 2, 60)]
+            self.assertEqual([bool(hit(limits, now=60)) for _ in range(3)], [False, False, True])
+
+    def test_benchmark_command(self):
+        output = io.StringIO()
+        call_command('benchmark_ratelimit', requests=20, clients=5, budget=10_000, stdout=output)
+        self.assertIn('within the', output.getvalue())
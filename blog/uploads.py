@@ -0,0 +1,104 @@
+import io
+import uuid
+
+from PIL import Image
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ValidationError
+
+from .models import Author, Post
+
+# kind: (model, image field) of the files browsers upload straight to storage
+UPLOAD_KINDS = {
+    'post_image': (Post, 'image'),
+    'profile_photo': (Author, 'profile_photo'),
+}
+
+# Accepted content types and the extension their files get
+CONTENT_TYPES = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/webp': '.webp',
+    'image/gif': '.gif',
+}
+
+# Pillow format of the files of every accepted content type
+IMAGE_FORMATS = {
+    'image/jpeg': 'JPEG',
+    'image/png': 'PNG',
+    'image/webp': 'WEBP',
+    'image/gif': 'GIF',
+}
+
+KEY_SALT = 'blog.uploads'
+
+# Bytes read to identify an upload, enough for the headers of every format (JPEG metadata segments included)
+SNIFF_SIZE = 128 * 1024
+
+
+def max_upload_size():
+    return getattr(settings, 'BLOG_UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
+
+
+def upload_field(kind):
+    model, field = UPLOAD_KINDS[kind]
+    return model._meta.get_field(field)
+
+
+def user_id(user):
+    return user.pk if user is not None and user.is_authenticated else None
+
+
+def presigned_upload(kind, user, content_type):
+    """Presigned POST for a new file of kind, plus the key the form submits once it is uploaded.
+
+    The key is a signed token naming the file, its kind and the user it was
+    issued to, so forms only accept files this server handed out.
+    """
+    field = upload_field(kind)
+    name = f'{field.upload_to}{uuid.uuid4().hex}{CONTENT_TYPES[content_type]}'
+    target = field.storage.presigned_post(name, content_type, max_upload_size(),
+                                          getattr(settings, 'BLOG_UPLOAD_EXPIRE', 600))
+    target['key'] = signing.dumps({'kind': kind, 'name': name, 'user': user_id(user)}, salt=KEY_SALT)
+    return target
+
+
+def validate_upload(key, kind, user):
+    """Storage name of the file uploaded for key, if it is a finished upload of kind issued to user.
+
+    Raises ValidationError otherwise.
+    """
+    try:
+        upload = signing.loads(key, salt=KEY_SALT, max_age=getattr(settings, 'BLOG_UPLOAD_KEY_MAX_AGE', 24 * 60 * 60))
+    except signing.BadSignature:
+        raise ValidationError('Invalid upload, please upload the file again.', code='invalid')
+    if upload['kind'] != kind or upload['user'] != user_id(user):
+        raise ValidationError('Invalid upload, please upload the file again.', code='invalid')
+
+    storage = upload_field(kind).storage
+    head = storage.head(upload['name'])
+    if head is None:
+        raise ValidationError('The file has not been uploaded yet.', code='missing')
+    size, content_type = head
+    valid = size <= max_upload_size() and content_type in CONTENT_TYPES
+    if not valid or image_format(storage, upload['name']) != IMAGE_FORMATS[content_type]:
+        # the bucket would keep serving it
+        storage.delete(upload['name'])
+        raise ValidationError('Upload a valid image.', code='invalid_image')
+    return upload['name']
+
+
+def image_format(storage, name):
+    """Pillow format of the stored file name, identified from its first SNIFF_SIZE bytes, None if unknown.
+
+    Web workers never download whole uploads: only the headers are parsed
+    here, the generate_image_variants task decodes the full image and drops
+    uploads that turn out to be corrupt.
+    """
+    try:
+        with Image.open(io.BytesIO(storage.read_start(name, SNIFF_SIZE))) as image:
+            return image.format
+    except Exception:
+        # Pillow raises all kinds of errors on forged headers
+        return None
@@ -1,20 +1,34 @@
+from django.conf import settings
 from django.contrib.auth.views import LoginView
-from django.urls import path
+from django.urls import include, path
 
-from . import views
+from . import async_views, feeds, views
+
+# Read views in their async versions when served under ASGI
+read_views = async_views if getattr(settings, 'BLOG_ASYNC_VIEWS', False) else views
 
 urlpatterns = [
     path('register', views.register, name='register'),
     path('edit_profile/', views.edit_profile, name='edit_profile'),
     path('login/', LoginView.as_view(template_name='blog/login.html'), name='login'),
+    path('uploads/', views.upload_target, name='upload_target'),
     path('create_post', views.create_post, name="create_post"),
-    path('post_detail/<int:pk>/', views.PostDetailView.as_view(), name='post_detail'),
+    path('post_detail/<int:pk>/', read_views.PostDetailView.as_view(), name='post_detail'),
     path('post/<int:pk>/update/', views.update_post, name='update_post'),
-    path('post_list', views.PostListView.as_view(), name='post_list'),
-    path('user/<str:username>/', views.UserPostListView.as_view(), name='user_posts'),
-    path('profile/<str:username>/', views.user_profile, name='user_profile'),
+    path('post_list', read_views.PostListView.as_view(), name='post_list'),
+    path('search', views.search, name='search'),
+    path('user/<str:username>/', read_views.UserPostListView.as_view(), name='user_posts'),
+    path('profile/<str:username>/', read_views.user_profile, name='user_profile'),
     path('contact_us/', views.contact, name='contact_us'),
     path('unpublished_posts/', views.unpublished_posts, name='unpublished_posts'),
     path('password/', views.CustomPasswordChangeView.as_view(), name='password_change'),
     path('logout/', views.logout_view, name='logout'),
+    path('feeds/posts.rss', feeds.site_feed(feeds.PostsFeed()), name='posts_rss'),
+    path('feeds/posts.atom', feeds.site_feed(feeds.AtomPostsFeed()), name='posts_atom'),
+    path('feeds/posts.json', feeds.site_feed(feeds.JsonPostsFeed()), name='posts_json'),
+    path('feeds/user/<str:username>.rss', feeds.author_feed(feeds.AuthorPostsFeed()), name='user_posts_rss'),
+    path('feeds/user/<str:username>.atom', feeds.author_feed(feeds.AtomAuthorPostsFeed()), name='user_posts_atom'),
+    path('feeds/user/<str:username>.json', feeds.author_feed(feeds.JsonAuthorPostsFeed()), name='user_posts_json'),
+    path('metrics/', views.prometheus_metrics, name='metrics'),
+    path('api/v1/', include('blog.api.urls')),
 ]
@@ -1,24 +1,38 @@
 from blog.forms import AuthorChangeForm, AuthorProfileForm, AuthorRegisterForm, CommentForm, ContactForm, PostForm
 from blog.models import Author, Comment, Post
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import LoginView, PasswordChangeView
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
-from django.http import JsonResponse
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
 from django.urls import reverse, reverse_lazy
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.views.generic import DetailView, ListView
 
-from .tasks import send_contact_email, send_new_comment_notification, send_new_post_notification
+from .cache import author_scope, cache_anonymous_page, list_scope, post_scope
+from .counters import count_published
+from .dispatch import dispatch
+from .ingestion import LocalQueue, comment_queue, submission
+from .metrics import metrics
+from .paginators import CachedCountPaginator, CursorPaginationMixin, paginate
+from .ratelimit import rate_limit
+from .search import search_backend
+from .stats import author_stats
+from .tasks import ingest_comments, send_contact_email, send_new_comment_notification, send_new_post_notification
+from .uploads import CONTENT_TYPES, UPLOAD_KINDS, presigned_upload
 
 
 def register(request):
     if request.method == 'POST':
-        form = AuthorRegisterForm(request.POST, request.FILES)
+        form = AuthorRegisterForm(request.POST)
         if form.is_valid():
             form.save()
             return redirect('login')
@@ -27,6 +41,19 @@ def register(request):
     return render(request, 'blog/register.html', {'form': form})
 
 
+@require_POST
+@rate_limit('upload')
+def upload_target(request):
+    """Presigned POST the browser sends an image to, the form then submits the returned key."""
+    kind = request.POST.get('kind')
+    content_type = request.POST.get('content_type')
+    if kind not in UPLOAD_KINDS or content_type not in CONTENT_TYPES:
+        return JsonResponse({'error': 'Unsupported file.'}, status=400)
+    if kind == 'post_image' and not request.user.is_authenticated:
+        return JsonResponse({'error': 'Log in to upload post images.'}, status=403)
+    return JsonResponse(presigned_upload(kind, request.user, content_type))
+
+
 class CustomLoginView(LoginView):
     template_name = 'blog/login.html'
     redirect_authenticated_user = True
@@ -43,16 +70,16 @@ def logout_view(request):
 @login_required
 def create_post(request):
     if request.method == 'POST':
-        form = PostForm(request.POST, request.FILES)
+        form = PostForm(request.POST, user=request.user)
         if form.is_valid():
             post = form.save(commit=False)
             post.owner = request.user
             post.save()
             if post.is_published:
-                send_new_post_notification.delay(post.pk)
+                dispatch(send_new_post_notification, post.pk)
             return redirect('post_detail', pk=post.pk)
     else:
-        form = PostForm()
+        form = PostForm(user=request.user)
     return render(request, 'blog/post_form.html', {'form': form})
 
 
@@ -60,43 +87,43 @@ def create_post(request):
 def update_post(request, pk):
     post = get_object_or_404(Post, pk=pk, owner=request.user)
     if request.method == 'POST':
-        form = PostForm(request.POST, request.FILES, instance=post)
+        was_published = post.is_published
+        form = PostForm(request.POST, instance=post, user=request.user)
         if form.is_valid():
             post = form.save(commit=False)
             post.owner = request.user
             post.save()
-            if post.is_published:
-                send_new_post_notification.delay(post.pk)
+            # edits of a published post are not new posts
+            if post.is_published and not was_published:
+                dispatch(send_new_post_notification, post.pk)
             return redirect('post_detail', pk=post.pk)
     else:
-        form = PostForm(instance=post)
+        form = PostForm(instance=post, user=request.user)
     return render(request, 'blog/post_form.html', {'form': form})
 
 
 @login_required
 def unpublished_posts(request):
-    post_list = Post.objects.filter(owner=request.user, is_published=False).order_by('-published_date')
-    paginator = Paginator(post_list, 10)
-    page = request.GET.get('page')
-    posts = paginator.get_page(page)
+    post_list = Post.objects.filter(owner=request.user, is_published=False).order_by('-published_date', '-id')
+    posts = paginate(request, post_list, 10)
     return render(request, 'blog/unpublished_posts.html', {'posts': posts})
 
 
+@method_decorator(cache_anonymous_page(lambda request, pk: [post_scope(pk)]), name='dispatch')
+@method_decorator(rate_limit('comment'), name='post')
 class PostDetailView(DetailView):
     model = Post
+    queryset = Post.objects.select_related('owner')
     template_name = 'blog/post_detail.html'
     context_object_name = 'post'
     paginate_by = 10
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        comments = Comment.objects.filter(post=self.object, is_published=True).order_by('-published_date')
-        paginator = Paginator(comments, self.paginate_by)
-        page_number = self.request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
-        context['page_obj'] = page_obj
+        comments = Comment.objects.filter(post=self.object, is_published=True).order_by('-published_date', '-id')
+        context['page_obj'] = paginate(self.request, comments, self.paginate_by)
         context['comment_form'] = CommentForm()
-        if self.object.owner == self.request.user:
+        if self.object.owner_id == self.request.user.pk:
             context['is_owner'] = True
         return context
 
@@ -109,60 +136,78 @@ class PostDetailView(DetailView):
         if form.is_valid():
             comment = form.save(commit=False)
             comment.post = post
-            comment.save()
-            send_new_comment_notification.delay(comment.id)
+            queue = comment_queue()
+            if queue is not None:
+                # saved by the ingest_comments task, the author is told it awaits moderation
+                queue.push(submission(comment))
+                if isinstance(queue, LocalQueue):
+                    # no worker can read this process' queue
+                    transaction.on_commit(ingest_comments)
+                return redirect(f"{reverse('post_detail', args=[post.pk])}?comment=pending")
+            with transaction.atomic():
+                comment.save()
+                if comment.is_published:
+                    count_published(Comment.objects.filter(pk=comment.pk))
+            dispatch(send_new_comment_notification, comment.id)
             return redirect('post_detail', pk=post.pk)
         context = {'comment_form': form, 'post': post}
         return render(request, 'blog/post_detail.html', context)
 
 
-class PostListView(ListView):
+@method_decorator(cache_anonymous_page(lambda request: [list_scope()]), name='dispatch')
+class PostListView(CursorPaginationMixin, ListView):
     model = Post
     template_name = 'blog/post_list.html'
     context_object_name = 'posts'
     paginate_by = 10
-    queryset = Post.objects.filter(is_published=True).order_by('-published_date')
+    queryset = Post.objects.filter(is_published=True).select_related('owner').order_by('-published_date', '-id')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        page = self.request.GET.get('page')
-        paginator = Paginator(self.queryset, self.paginate_by)
-        try:
-            posts = paginator.page(page)
-        except PageNotAnInteger:
-            posts = paginator.page(1)
-        except EmptyPage:
-            posts = paginator.page(paginator.num_pages)
-        context['posts'] = posts
+        context['posts'] = context['page_obj']
         return context
 
 
-class UserPostListView(ListView):
+@method_decorator(cache_anonymous_page(lambda request, username: [author_scope(username)]), name='dispatch')
+class UserPostListView(CursorPaginationMixin, ListView):
     model = Post
     template_name = 'blog/user_post_list.html'
     context_object_name = 'posts'
     paginate_by = 10
 
     def get_queryset(self):
-        user = get_object_or_404(Author, username=self.kwargs.get('username'))
-        return Post.objects.filter(owner=user, is_published=True).order_by('-published_date')
+        self.user_profile = get_object_or_404(Author, username=self.kwargs.get('username'))
+        return Post.objects.filter(owner=self.user_profile, is_published=True).order_by('-published_date', '-id')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['user_profile'] = get_object_or_404(Author, username=self.kwargs.get('username'))
+        for post in context['posts']:
+            post.owner = self.user_profile
+        context['user_profile'] = self.user_profile
+        context['stats'] = author_stats(self.user_profile)
         return context
 
 
+@cache_anonymous_page(lambda request: [list_scope()])
+def search(request):
+    query = request.GET.get('q', '').strip()
+    posts = Post.objects.none()
+    if query:
+        posts = search_backend().search(Post.objects.filter(is_published=True).select_related('owner'), query)
+    page = CachedCountPaginator(posts, 10).get_page(request.GET.get('page'))
+    return render(request, 'blog/search.html', {'posts': page, 'query': query})
+
+
 def user_profile(request, username):
     user = get_object_or_404(Author, username=username)
-    return render(request, 'blog/user_profile.html', {'user': user})
+    return render(request, 'blog/user_profile.html', {'user': user, 'stats': author_stats(user)})
 
 
 @login_required
 def edit_profile(request):
     if request.method == 'POST':
         user_form = AuthorChangeForm(request.POST, instance=request.user)
-        profile_form = AuthorProfileForm(request.POST, request.FILES, instance=request.user)
+        profile_form = AuthorProfileForm(request.POST, instance=request.user, user=request.user)
         if user_form.is_valid() and profile_form.is_valid():
             user = user_form.save(commit=False)
             if not request.user.is_superuser and user.is_superuser:
@@ -176,7 +221,7 @@ def edit_profile(request):
             messages.error(request, 'Please correct the error below.')
     else:
         user_form = AuthorChangeForm(instance=request.user)
-        profile_form = AuthorProfileForm(instance=request.user)
+        profile_form = AuthorProfileForm(instance=request.user, user=request.user)
     return render(request, 'blog/edit_profile.html', {'user_form': user_form, 'profile_form': profile_form})
 
 
@@ -186,6 +231,7 @@ class CustomPasswordChangeView(PasswordChangeView):
 
 
 @csrf_exempt
+@rate_limit('contact')
 def contact(request):
     if request.method == 'POST':
         form = ContactForm(request.POST)
@@ -202,3 +248,12 @@ def contact(request):
         form = ContactForm()
         html_form = render_to_string('blog/contact.html', {'form': form}, request=request)
         return JsonResponse({'html_form': html_form})
+
+
+def prometheus_metrics(request):
+    """Request and task metrics in the Prometheus text format, for staff or with the BLOG_METRICS_TOKEN bearer token."""
+    token = getattr(settings, 'BLOG_METRICS_TOKEN', '')
+    authorized = bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorized and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,43 @@
+(function(w,d,$){
+  $(d).ready(function(){
+
+    // Send the picked file straight to storage, the form only submits the key of the upload
+    let upload = function() {
+      let input = $(this);
+      let file = this.files[0];
+      let target = $('#' + input.data('target'));
+      let submit = input.closest('form').find('[type=submit]');
+      if (!file) {
+        return;
+      }
+      submit.prop('disabled', true);
+      $.ajax({
+        url: input.data('url'),
+        type: 'post',
+        dataType: 'json',
+        data: {
+          kind: input.data('kind'),
+          content_type: file.type,
+          csrfmiddlewaretoken: input.closest('form').find('[name=csrfmiddlewaretoken]').val()
+        }
+      }).then(function(presigned) {
+        let data = new FormData();
+        $.each(presigned.fields, function(name, value) {
+          data.append(name, value);
+        });
+        data.append('file', file);
+        return $.ajax({url: presigned.url, type: 'post', data: data, processData: false, contentType: false})
+          .then(function() {
+            target.val(presigned.key);
+          });
+      }).fail(function() {
+        input.val('');
+        alert('The file could not be uploaded, please try again.');
+      }).always(function() {
+        submit.prop('disabled', false);
+      });
+    };
+
+    $(d).on('change', '.js-direct-upload', upload);
+  });
+})(window, document, jQuery);